@@ -1,42 +1,120 @@
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, NamedTuple
+
 import requests
-from .config import API_URL, ACCESS_TOKEN
+from api.tenants import tenant_for_course
+from utils.rubric_assessment import rubric_assessment_form
+from utils.tracing import logger, span
+
+try:
+    from .config import API_URL, ACCESS_TOKEN
+except ImportError:
+    # No local config module (CI, benchmarks, containers): read from the environment
+    API_URL = os.getenv("CANVAS_API_URL")
+    ACCESS_TOKEN = os.getenv("CANVAS_ACCESS_TOKEN")
+
+try:
+    from .config import CANVAS_BACKEND
+except ImportError:
+    # "rest" (default) or "graphql": one paginated query for rubric + submissions
+    CANVAS_BACKEND = os.getenv("CANVAS_BACKEND", "rest")
+
+# Students per update_grades request when posting grades in bulk
+GRADE_POST_BATCH_SIZE = int(os.getenv("CANVAS_GRADE_POST_BATCH_SIZE", "50"))
+# How long to wait for Canvas to apply a bulk update, and how often to check
+GRADE_POST_TIMEOUT = float(os.getenv("CANVAS_GRADE_POST_TIMEOUT", "120"))
+PROGRESS_POLL_SECONDS = 1.0
+
+
+class CanvasClient(NamedTuple):
+    api_url: str
+    headers: dict
+    http: Any  # the requests module, or a tenant's rate-limited session
+
+
+def canvas_client(course_id=None):
+    """Base URL, auth headers and HTTP client for a course: its tenant's, or the default credentials."""
+    tenant = tenant_for_course(course_id) if course_id is not None else None
+    if tenant is not None:
+        # The tenant session carries the token, connection pool and rate limit
+        return CanvasClient(tenant.api_url, {}, tenant.session)
+    return CanvasClient(API_URL, {"Authorization": f"Bearer {ACCESS_TOKEN}"}, requests)
+
+
+def _graphql():
+    # Imported lazily: canvas_graphql uses canvas_client from this module
+    from api import canvas_graphql
+    return canvas_graphql
 
 
 def get_submissions(course_id, assignment_id):
-    headers = {"Authorization": f"Bearer {ACCESS_TOKEN}"}
-    url = f"{API_URL}/courses/{course_id}/assignments/{assignment_id}/submissions"
+    if CANVAS_BACKEND == "graphql":
+        return _graphql().get_submissions(course_id, assignment_id)
+    client = canvas_client(course_id)
+    url = f"{client.api_url}/courses/{course_id}/assignments/{assignment_id}/submissions"
+    params = {"per_page": 100, "include[]": ["submission_comments", "user"]}
     
     try:
-        response = requests.get(
-            url,
-            headers=headers,
-            params={"per_page": 100, "include[]": ["submission_comments", "user"]}
-        )
-        response.raise_for_status()
-        return response.json()
+        with span("canvas.get_submissions", course_id=str(course_id), assignment_id=str(assignment_id)) as s:
+            submissions = []
+            pages = 0
+            # Follow the Link header so courses with more than one page are complete
+            while url:
+                response = client.http.get(url, headers=client.headers, params=params)
+                s.set("http.status_code", response.status_code)
+                response.raise_for_status()
+                submissions.extend(response.json())
+                pages += 1
+                url = response.links.get("next", {}).get("url")
+                params = None  # The next link carries the query string
+            s.set("canvas.pages", pages)
+            s.set("canvas.items", len(submissions))
+        return submissions
     except Exception as e:
-        print(f"Error fetching submissions: {str(e)}")
+        logger.warning("Error fetching submissions: %s", e)
         return []
 
 
+def get_submission(course_id, assignment_id, user_id):
+    """One student's submission, or None on errors."""
+    client = canvas_client(course_id)
+    url = f"{client.api_url}/courses/{course_id}/assignments/{assignment_id}/submissions/{user_id}"
+    try:
+        with span("canvas.get_submission", course_id=str(course_id), assignment_id=str(assignment_id)) as s:
+            response = client.http.get(url, headers=client.headers, params={"include[]": ["user"]})
+            s.set("http.status_code", response.status_code)
+            response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        logger.warning("Error fetching submission of user %s: %s", user_id, e)
+        return None
+
+
 def get_assignment_rubric(course_id, assignment_id):
     if not course_id or not assignment_id:
-        print("Error: Missing course_id or assignment_id")
+        logger.warning("Error: Missing course_id or assignment_id")
         return []
-        
-    headers = {"Authorization": f"Bearer {ACCESS_TOKEN}"}
-    url = f"{API_URL}/courses/{course_id}/assignments/{assignment_id}"
-    print(f"Making API request to: {url}")
+    if CANVAS_BACKEND == "graphql":
+        return _graphql().get_assignment_rubric(course_id, assignment_id)
+
+    client = canvas_client(course_id)
+    url = f"{client.api_url}/courses/{course_id}/assignments/{assignment_id}"
+    logger.debug("Making API request to: %s", url)
     
     try:
-        response = requests.get(url, headers=headers, params={"include[]": "rubric"})
-        print(f"API response status: {response.status_code}")
+        with span("canvas.get_assignment_rubric", course_id=str(course_id), assignment_id=str(assignment_id)) as s:
+            response = client.http.get(url, headers=client.headers, params={"include[]": "rubric"})
+            s.set("http.status_code", response.status_code)
+        logger.debug("API response status: %s", response.status_code)
         
         if response.status_code == 401:
             error_data = response.json()
             if "errors" in error_data and error_data["errors"]:
                 error_msg = error_data["errors"][0].get("message", "Unknown error")
-                print(f"Authentication error: {error_msg}")
+                logger.warning("Authentication error: %s", error_msg)
                 if "expired" in error_msg.lower():
                     return "Your Canvas API token has expired. Please generate a new token in Canvas settings."
             return "Failed to authenticate with Canvas. Please check your API token."
@@ -44,31 +122,122 @@ def get_assignment_rubric(course_id, assignment_id):
         response.raise_for_status()
         data = response.json()
         rubric = data.get("rubric", [])
-        print(f"Got rubric data: {bool(rubric)}")
+        logger.debug("Got rubric data: %s", bool(rubric))
         return rubric
     except requests.exceptions.RequestException as e:
-        print(f"Error in get_assignment_rubric: {str(e)}")
-        print(f"Response content: {getattr(response, 'text', 'No response content')}")
+        logger.warning("Error in get_assignment_rubric: %s", e)
+        logger.debug("Response content: %s", getattr(response, 'text', 'No response content'))
         return []
     except Exception as e:
-        print(f"Unexpected error: {str(e)}")
+        logger.warning("Unexpected error: %s", e)
         return []
 
 
-def submit_grade_and_feedback(user_id, course_id, assignment_id, grade, feedback):
-    url = f"{API_URL}/courses/{course_id}/assignments/{assignment_id}/submissions/{user_id}"
-    headers = {"Authorization": f"Bearer {ACCESS_TOKEN}"}
+def get_assignment_data(course_id, assignment_id):
+    """Rubric and submissions of an assignment: one paginated GraphQL query, or two concurrent REST calls.
+
+    Returns:
+        tuple: (rubric, submissions) as from get_assignment_rubric and get_submissions
+    """
+    if CANVAS_BACKEND == "graphql":
+        return _graphql().get_assignment_data(course_id, assignment_id)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        ctx = contextvars.copy_context()
+        rubric = pool.submit(ctx.copy().run, get_assignment_rubric, course_id, assignment_id)
+        submissions = pool.submit(ctx.copy().run, get_submissions, course_id, assignment_id)
+        return rubric.result(), submissions.result()
+
+
+def submit_grade_and_feedback(user_id, course_id, assignment_id, grade, feedback, rubric_assessment=None):
+    """Post a grade and comment for one student, with per-criterion rubric scores if given.
+
+    ``rubric_assessment`` maps Canvas criterion ids to {"points", "comments", "rating_id"}
+    (see utils.rubric_assessment.build_rubric_assessment).
+    """
+    client = canvas_client(course_id)
+    url = f"{client.api_url}/courses/{course_id}/assignments/{assignment_id}/submissions/{user_id}"
     
     data = {
         "comment[text_comment]": feedback,
         "submission[posted_grade]": str(grade)
     }
+    if rubric_assessment:
+        data.update(rubric_assessment_form(rubric_assessment))
 
     try:
-        response = requests.put(url, headers=headers, data=data)
+        with span("canvas.submit_grade", course_id=str(course_id), assignment_id=str(assignment_id)) as s:
+            response = client.http.put(url, headers=client.headers, data=data)
+            s.set("http.status_code", response.status_code)
         if response.status_code == 200:
             return f"✅ Submitted feedback for user {user_id}."
         else:
             return f"❌ Canvas responded with {response.status_code}: {response.text}"
     except Exception as e:
         return f"❌ Error submitting feedback: {str(e)}"
+
+
+class ProgressUnconfirmed(Exception):
+    """Canvas accepted a bulk update but has not (yet) reported it as finished."""
+
+
+def post_grades_batch(course_id, assignment_id, grades):
+    """Send one update_grades request for ``grades`` and return Canvas's Progress.
+
+    ``grades`` are dicts with "student_id", "grade", and optionally "comment" and "rubric_assessment"
+    (criterion id -> {"points", "comments", "rating_id"}); utils.grade_outbox.OutboxFlusher._send
+    splits posts into GRADE_POST_BATCH_SIZE batches. Raises on HTTP errors; once this returns,
+    Canvas has accepted the update.
+    """
+    client = canvas_client(course_id)
+    url = f"{client.api_url}/courses/{course_id}/assignments/{assignment_id}/submissions/update_grades"
+    data = {}
+    for entry in grades:
+        prefix = f"grade_data[{entry['student_id']}]"
+        data[f"{prefix}[posted_grade]"] = str(entry["grade"])
+        if entry.get("comment"):
+            data[f"{prefix}[text_comment]"] = entry["comment"]
+        if entry.get("rubric_assessment"):
+            data.update(rubric_assessment_form(entry["rubric_assessment"], f"{prefix}[rubric_assessment]"))
+    with span("canvas.update_grades", course_id=str(course_id), assignment_id=str(assignment_id),
+              students=len(grades)) as s:
+        response = client.http.post(url, headers=client.headers, data=data)
+        s.set("http.status_code", response.status_code)
+        response.raise_for_status()
+    return response.json()
+
+
+def get_progress(course_id, progress_url):
+    """Current state of a Canvas Progress (as returned by update_grades)."""
+    client = canvas_client(course_id)
+    response = client.http.get(progress_url, headers=client.headers)
+    response.raise_for_status()
+    return response.json()
+
+
+def wait_for_progress(course_id, progress, timeout=GRADE_POST_TIMEOUT):
+    """Poll a Progress until it finishes; returns None on success or Canvas's failure message.
+
+    Raises ProgressUnconfirmed when it does not finish within ``timeout`` or cannot be read.
+    """
+    deadline = time.monotonic() + timeout
+    while progress.get("workflow_state") not in ("completed", "failed"):
+        if time.monotonic() > deadline or not progress.get("url"):
+            raise ProgressUnconfirmed(f"Canvas did not finish the update within {timeout:.0f}s")
+        time.sleep(PROGRESS_POLL_SECONDS)
+        try:
+            progress = get_progress(course_id, progress["url"])
+        except Exception as e:
+            raise ProgressUnconfirmed(f"Could not check the update's progress: {e}") from e
+    if progress["workflow_state"] == "failed":
+        return progress.get("message") or "Canvas reported the update as failed"
+    return None
+
+
+def download_attachment(url, size=None, timeout=30, course_id=None):
+    """Download a submission attachment from its Canvas file ``url`` and return the bytes."""
+    client = canvas_client(course_id)
+    with span("canvas.download_attachment", size=size) as s:
+        response = client.http.get(url, headers=client.headers, timeout=timeout)
+        s.set("http.status_code", response.status_code)
+        response.raise_for_status()
+    return response.content
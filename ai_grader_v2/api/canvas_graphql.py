@@ -0,0 +1,174 @@
+from contextlib import contextmanager
+
+import requests
+
+from api import canvas_api
+from utils.tracing import logger, span
+
+# Only the fields grading uses; the rubric is requested on the first page only
+GRADING_DATA_QUERY = """
+query GradingData($assignmentId: ID!, $first: Int!, $after: String, $withRubric: Boolean!) {
+  assignment(id: $assignmentId) {
+    _id
+    name
+    pointsPossible
+    rubric @include(if: $withRubric) {
+      criteria {
+        _id
+        description
+        longDescription
+        points
+        ratings { _id description points }
+      }
+    }
+    submissionsConnection(first: $first, after: $after) {
+      nodes {
+        _id
+        attempt
+        state
+        submittedAt
+        gradedAt
+        body
+        user { _id name }
+        attachments { displayName contentType url size }
+      }
+      pageInfo { hasNextPage endCursor }
+    }
+  }
+}
+"""
+
+
+RUBRIC_QUERY = """
+query AssignmentRubric($assignmentId: ID!) {
+  assignment(id: $assignmentId) {
+    rubric {
+      criteria {
+        _id
+        description
+        longDescription
+        points
+        ratings { _id description points }
+      }
+    }
+  }
+}
+"""
+
+
+class GraphQLError(Exception):
+    """Raised when Canvas answers a GraphQL query with errors."""
+
+
+def graphql_url(api_url):
+    """Canvas serves GraphQL at /api/graphql next to the /api/v1 REST root."""
+    base = api_url.rstrip("/")
+    if base.endswith("/api/v1"):
+        base = base[:-len("/api/v1")]
+    return f"{base}/api/graphql"
+
+
+def run_query(query, variables, client, http=None):
+    """POST one GraphQL query with a CanvasClient (``http`` overrides its HTTP client) and return its ``data``."""
+    response = (http or client.http).post(graphql_url(client.api_url), headers=client.headers,
+                                          json={"query": query, "variables": variables})
+    response.raise_for_status()
+    payload = response.json()
+    if payload.get("errors"):
+        raise GraphQLError("; ".join(e.get("message", "unknown error") for e in payload["errors"]))
+    return payload["data"]
+
+
+def _rest_rubric(criteria):
+    """Shape GraphQL rubric criteria like the REST ``rubric`` list."""
+    return [
+        {
+            "id": c["_id"],
+            "description": c.get("description"),
+            "long_description": c.get("longDescription"),
+            "points": c.get("points"),
+            "ratings": [{"id": r["_id"], "description": r.get("description"), "points": r.get("points")}
+                        for r in c.get("ratings") or []],
+        }
+        for c in criteria or []
+    ]
+
+
+def _rest_submission(node):
+    """Shape a GraphQL submission node like a REST submission dict."""
+    user = node.get("user") or {}
+    return {
+        "id": node.get("_id"),
+        "user_id": user.get("_id"),
+        "workflow_state": node.get("state"),
+        "attempt": node.get("attempt"),
+        "submitted_at": node.get("submittedAt"),
+        "graded_at": node.get("gradedAt"),
+        "body": node.get("body"),
+        "user": {"id": user.get("_id"), "name": user.get("name")},
+        "attachments": [
+            {"display_name": a.get("displayName"), "content-type": a.get("contentType"),
+             "url": a.get("url"), "size": a.get("size")}
+            for a in node.get("attachments") or []
+        ],
+    }
+
+
+@contextmanager
+def _session(client):
+    """Keep-alive session for a multi-page fetch; tenant sessions are shared and stay open."""
+    if client.http is not requests:
+        yield client.http
+        return
+    with requests.Session() as session:
+        yield session
+
+
+def get_assignment_data(course_id, assignment_id, page_size=100):
+    """Rubric and all submissions of an assignment via cursor-paginated GraphQL queries.
+
+    Returns:
+        tuple: (rubric list, submission list) shaped like the REST responses,
+        or ([], []) on errors
+    """
+    client = canvas_api.canvas_client(course_id)
+    rubric, submissions = [], []
+    variables = {"assignmentId": str(assignment_id), "first": page_size, "after": None, "withRubric": True}
+    try:
+        with span("canvas.graphql.assignment_data", course_id=str(course_id), assignment_id=str(assignment_id)) as s, \
+                _session(client) as session:
+            pages = 0
+            while True:
+                data = run_query(GRADING_DATA_QUERY, variables, client, session)
+                pages += 1
+                assignment = data.get("assignment")
+                if assignment is None:
+                    raise GraphQLError(f"assignment {assignment_id} not found")
+                if variables["withRubric"]:
+                    rubric = _rest_rubric((assignment.get("rubric") or {}).get("criteria"))
+                    variables["withRubric"] = False
+                connection = assignment["submissionsConnection"]
+                submissions.extend(_rest_submission(node) for node in connection["nodes"])
+                if not connection["pageInfo"]["hasNextPage"]:
+                    break
+                variables["after"] = connection["pageInfo"]["endCursor"]
+            s.set("canvas.pages", pages)
+            s.set("canvas.items", len(submissions))
+        return rubric, submissions
+    except Exception as e:
+        logger.warning("Error fetching assignment data via GraphQL: %s", e)
+        return [], []
+
+
+def get_submissions(course_id, assignment_id):
+    return get_assignment_data(course_id, assignment_id)[1]
+
+
+def get_assignment_rubric(course_id, assignment_id):
+    try:
+        with span("canvas.graphql.rubric", course_id=str(course_id), assignment_id=str(assignment_id)):
+            data = run_query(RUBRIC_QUERY, {"assignmentId": str(assignment_id)}, canvas_api.canvas_client(course_id))
+        return _rest_rubric(((data.get("assignment") or {}).get("rubric") or {}).get("criteria"))
+    except Exception as e:
+        logger.warning("Error fetching rubric via GraphQL: %s", e)
+        return []
@@ -0,0 +1,163 @@
+"""Per-tenant Canvas credentials, connection pools and rate limits for service mode.
+
+Tenants come from ``CANVAS_TENANTS`` in api/config.py or from the JSON file
+named by ``CANVAS_TENANTS_FILE``::
+
+    [{"name": "history", "api_url": "https://history.instructure.com/api/v1",
+      "access_token_env": "HISTORY_CANVAS_TOKEN", "courses": [121, 130],
+      "requests_per_second": 5, "max_connections": 8}]
+
+Courses that belong to no tenant use the single API_URL/ACCESS_TOKEN setup.
+"""
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.tracing import logger
+
+try:
+    from .config import CANVAS_TENANTS
+except ImportError:
+    CANVAS_TENANTS = None
+
+CANVAS_TENANTS_FILE = os.getenv("CANVAS_TENANTS_FILE", "")
+
+DEFAULT_REQUESTS_PER_SECOND = float(os.getenv("CANVAS_TENANT_RPS", "10"))
+DEFAULT_MAX_CONNECTIONS = int(os.getenv("CANVAS_TENANT_CONNECTIONS", "8"))
+# Retries of a request Canvas rejected with 403 "Rate Limit Exceeded"
+RATE_LIMIT_RETRIES = 3
+
+
+class RateLimiter:
+    """Blocking token bucket: ``rate`` requests per second with bursts of up to ``burst``."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class TenantSession(requests.Session):
+    """Session bound to one tenant: its token, a bounded connection pool and its rate limit."""
+
+    def __init__(self, tenant):
+        super().__init__()
+        self.tenant = tenant
+        self.headers["Authorization"] = f"Bearer {tenant.access_token}"
+        # pool_block keeps concurrent connections to Canvas at max_connections
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=tenant.max_connections, pool_block=True)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            self.tenant.limiter.acquire()
+            response = super().request(method, url, *args, **kwargs)
+            if response.status_code != 403 or "Rate Limit Exceeded" not in response.text:
+                return response
+            if attempt < RATE_LIMIT_RETRIES:
+                logger.debug("Canvas rate limit hit for tenant %s, retrying", self.tenant.name)
+                time.sleep(0.5 * 2 ** attempt)
+        return response
+
+
+class Tenant:
+    def __init__(self, name, api_url, access_token, courses=(),
+                 requests_per_second=DEFAULT_REQUESTS_PER_SECOND, max_connections=DEFAULT_MAX_CONNECTIONS):
+        self.name = name
+        self.api_url = api_url.rstrip("/")
+        self.access_token = access_token
+        self.courses = {str(c) for c in courses}
+        self.max_connections = max_connections
+        self.limiter = RateLimiter(requests_per_second)
+        self._session = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, entry):
+        token = entry.get("access_token") or os.getenv(entry.get("access_token_env", ""), "")
+        if not token:
+            logger.warning("Canvas tenant %s has no access token", entry["name"])
+        return cls(
+            entry["name"], entry["api_url"], token, entry.get("courses", ()),
+            float(entry.get("requests_per_second", DEFAULT_REQUESTS_PER_SECOND)),
+            int(entry.get("max_connections", DEFAULT_MAX_CONNECTIONS)),
+        )
+
+    @property
+    def session(self):
+        """The tenant's shared session, created on first use."""
+        with self._lock:
+            if self._session is None:
+                self._session = TenantSession(self)
+            return self._session
+
+
+_tenants = None
+_by_course = {}
+_registry_lock = threading.Lock()
+
+
+def _load_config():
+    if CANVAS_TENANTS is not None:
+        return CANVAS_TENANTS
+    if CANVAS_TENANTS_FILE:
+        with open(CANVAS_TENANTS_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return []
+
+
+def load_tenants(entries=None):
+    """(Re)build the tenant registry from config, or from ``entries`` when given."""
+    global _tenants, _by_course
+    tenants = [Tenant.from_config(entry) for entry in (_load_config() if entries is None else entries)]
+    by_course = {}
+    for tenant in tenants:
+        for course_id in tenant.courses:
+            if course_id in by_course:
+                logger.warning("Course %s is listed for tenants %s and %s", course_id,
+                               by_course[course_id].name, tenant.name)
+            by_course.setdefault(course_id, tenant)
+    with _registry_lock:
+        _tenants, _by_course = tenants, by_course
+    return tenants
+
+
+def tenants():
+    if _tenants is None:
+        try:
+            load_tenants()
+        except Exception as e:
+            logger.warning("Could not load Canvas tenants: %s", e)
+            load_tenants([])
+    return _tenants
+
+
+def tenant_for_course(course_id):
+    """The Tenant that owns a course, or None for the default single-tenant setup."""
+    tenants()
+    return _by_course.get(str(course_id))
+
+
+def fairness_key(course_id):
+    """Scheduling key for grading jobs: the tenant, or the course itself when it has none."""
+    tenant = tenant_for_course(course_id)
+    return tenant.name if tenant else f"course:{course_id}"
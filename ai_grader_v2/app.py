@@ -1,13 +1,66 @@
 import streamlit as st
-from langgraph_pipeline import build_grading_graph
+from langgraph_pipeline import get_grading_graph
 from langchain_core.messages import HumanMessage, AIMessage
 from utils.rubric_parser import parse_rubric
 import json
 import time
-from utils.llm_utils import ChatOpenAI
-import PyPDF2
-import io
-import docx
+import uuid
+from utils.llm_utils import light_completion
+from utils.file_ingest import submit_file, extract_rubric_section, SUPPORTED_TYPES
+from utils.cache_utils import content_hash
+from utils.json_utils import parse_llm_json, validate_rubric, repair_messages, LLMOutputError
+from utils.tracing import span, start_run, run_summary, format_summary_table
+from utils.transcript_store import archive_messages, load_archived
+from utils.rubric_cache import STRUCTURE_PROMPT, get_structured_rubric, save_structured_rubric, list_structured_rubrics
+from utils.pregrader import get_pregrader, PREGRADE_ENABLED
+from utils.grade_outbox import get_flusher, status_counts, OUTBOX_PENDING, OUTBOX_SENDING, OUTBOX_FAILED
+
+# Only the most recent human messages are sent to the graph (the router reads the last one)
+GRAPH_HISTORY_WINDOW = 10
+# Older messages are moved out of session memory into the on-disk transcript
+MAX_LIVE_MESSAGES = 200
+# Messages rendered per page of chat history
+PAGE_SIZE = 50
+# Seconds between checks on an uploaded rubric that is still being extracted
+INGEST_POLL_SECONDS = 0.5
+
+def _message_role(msg):
+    return "assistant" if isinstance(msg, AIMessage) else "user"
+
+def recent_human_messages(messages, window=GRAPH_HISTORY_WINDOW):
+    """Return the last ``window`` human messages without scanning the whole history."""
+    recent = []
+    for msg in reversed(messages):
+        if isinstance(msg, HumanMessage):
+            recent.append(msg)
+            if len(recent) >= window:
+                break
+    recent.reverse()
+    return recent
+
+def archive_overflow_messages():
+    """Move messages beyond MAX_LIVE_MESSAGES from session state to the transcript store."""
+    overflow = len(st.session_state.messages) - MAX_LIVE_MESSAGES
+    if overflow > 0:
+        old_messages = st.session_state.messages[:overflow]
+        archive_messages(
+            st.session_state.session_id,
+            [(_message_role(msg), msg.content) for msg in old_messages]
+        )
+        del st.session_state.messages[:overflow]
+        st.session_state.archived_count = st.session_state.get("archived_count", 0) + overflow
+
+def render_message(role, content):
+    avatar = "🤖" if role == "assistant" else "👤"
+    with st.chat_message(role, avatar=avatar):
+        st.write(content)
+
+def use_rubric(rubric):
+    """Make a structured rubric the current rubric for grading."""
+    # Store in both session state and graph state
+    st.session_state.uploaded_rubric = rubric
+    st.session_state.graph_state["uploaded_rubric"] = rubric
+    st.session_state.rubric_criteria = rubric  # Also store as current rubric
 
 def process_uploaded_rubric(uploaded_file):
     """Process uploaded rubric file and convert it to a structured format."""
@@ -18,66 +71,119 @@ def process_uploaded_rubric(uploaded_file):
         # Handle different file types
         if file_type == "application/json":
             content = json.loads(uploaded_file.read().decode())
-            # Store in both session state and graph state
-            st.session_state.uploaded_rubric = content
-            st.session_state.graph_state["uploaded_rubric"] = content
-            st.session_state.rubric_criteria = content  # Also store as current rubric
+            use_rubric(content)
             return content, "JSON rubric loaded successfully!"
             
-        elif file_type == "text/plain":
-            content = uploaded_file.read().decode()
-        
-        elif file_type == "application/pdf":
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(uploaded_file.read()))
-            content = ""
-            for page in pdf_reader.pages:
-                content += page.extract_text()
-                
-        elif file_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            doc = docx.Document(io.BytesIO(uploaded_file.read()))
-            content = "\n".join([paragraph.text for paragraph in doc.paragraphs])
+        elif file_type in SUPPORTED_TYPES:
+            data = uploaded_file.getvalue()
+            file_hash = content_hash(data)
+            
+            # Same file structured before (any session): skip extraction and the LLM
+            with span("rubric.cache_lookup") as lookup:
+                cached_rubric = get_structured_rubric(file_hash)
+                lookup.set("cache.hit", bool(cached_rubric))
+            if cached_rubric:
+                use_rubric(cached_rubric)
+                return cached_rubric, "Rubric loaded from the structured rubric cache!"
+            
+            # Extract text in a worker process; later script runs pick up the result
+            with span("rubric.extract", file_type=file_type) as extract:
+                job = submit_file(data, file_type)
+                extract.set("cache.hit", job.cached)
+            st.session_state.rubric_ingest = {"job": job, "file_hash": file_hash, "filename": uploaded_file.name}
+            return None, None
             
         else:
             return None, f"Unsupported file type: {file_type}"
         
+    except Exception as e:
+        return None, f"Error processing rubric: {str(e)}"
+
+def finish_rubric_ingest():
+    """Structure an uploaded rubric once its text extraction is done; returns (rubric, message) or None while pending."""
+    pending = st.session_state.rubric_ingest
+    if not pending["job"].done():
+        return None
+    del st.session_state.rubric_ingest
+    try:
+        content = extract_rubric_section(pending["job"].result())
+        return structure_rubric_text(content, pending["file_hash"], pending["filename"])
+    except Exception as e:
+        return None, f"Error processing rubric: {str(e)}"
+
+@st.fragment(run_every=INGEST_POLL_SECONDS)
+def rubric_ingest_status():
+    """Poll a pending rubric extraction without rerunning the rest of the page."""
+    if "rubric_ingest" not in st.session_state:
+        return
+    filename = st.session_state.rubric_ingest["filename"]
+    with st.spinner(f"Processing {filename}..."):
+        finished = finish_rubric_ingest()
+    if finished is not None:
+        # The full rerun shows the outcome and the new chat message, and stops this polling
+        st.session_state.rubric_ingest_outcome = finished
+        st.rerun()
+
+def structure_rubric_text(content, file_hash, filename):
+    """Turn extracted rubric text into a structured rubric with the LLM and cache it."""
+    try:
         # For non-JSON files, use GPT to structure the content
         if content:
-            llm = ChatOpenAI(model="gpt-4", temperature=0)
-            system_prompt = """Convert the following rubric text into a structured JSON format suitable for grading. The format should be:
-            [{
-                "description": "Criterion Name",
-                "points": points_value,
-                "long_description": "Detailed description of the criterion",
-                "ratings": [
-                    {"description": "Level name", "points": points_value},
-                    ...
-                ]
-            }]
-            
-            Extract the criteria, point values, and rating levels from the text. If point values are not explicit, make reasonable assignments based on the content."""
-            
             messages = [
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": STRUCTURE_PROMPT},
                 {"role": "user", "content": content}
             ]
             
-            response = llm.invoke(messages)
+            response_text = light_completion(messages, purpose="rubric_structure")
             try:
-                structured_content = eval(response.content)  # Safe since we control the LLM prompt
-                # Store in both session state and graph state
-                st.session_state.uploaded_rubric = structured_content
-                st.session_state.graph_state["uploaded_rubric"] = structured_content
-                st.session_state.rubric_criteria = structured_content  # Also store as current rubric
+                structured_content = parse_llm_json(
+                    response_text,
+                    validator=validate_rubric,
+                    repair=lambda text, error: light_completion(repair_messages(text, error), purpose="repair")
+                )
+                save_structured_rubric(file_hash, filename, structured_content)
+                use_rubric(structured_content)
                 return structured_content, "Rubric processed and structured successfully!"
-            except:
-                return None, "Failed to structure the rubric content. Please check the format."
+            except LLMOutputError as e:
+                return None, f"Failed to structure the rubric content ({str(e)}). Please check the format."
                 
         return None, "Failed to process the rubric file."
         
     except Exception as e:
         return None, f"Error processing rubric: {str(e)}"
 
+def report_rubric_result(structured_content, message):
+    """Show the outcome of loading an uploaded rubric in the chat and sidebar."""
+    if structured_content:
+        st.session_state.graph_state["uploaded_rubric"] = structured_content
+        # Parse and preview the rubric
+        preview = parse_rubric(structured_content)
+        st.session_state.messages.append(
+            AIMessage(content=f"""✅ {message}
+
+Here's how I've interpreted your rubric:
+
+{preview}
+
+You can now:
+1. Start grading by providing course and assignment IDs
+2. Use this rubric for any assignment
+3. Modify the rubric if needed
+
+What would you like to do next?""")
+        )
+        st.success(message)
+    else:
+        st.error(message)
+
 # Initialize session state
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+    st.session_state.archived_count = 0
+
+if "visible_count" not in st.session_state:
+    st.session_state.visible_count = PAGE_SIZE
+
 if "messages" not in st.session_state:
     st.session_state.messages = [
         AIMessage(content="""Hi! I'm your AI grading assistant. I can help you grade assignments and manage feedback. Here's how you can interact with me:
@@ -155,6 +261,11 @@ with st.sidebar:
     - "Grade submission for student 247 in course 121, assignment 473"
     - "121,473,247"
     
+    **Grade Everyone:**
+    - "Grade all for course 121, assignment 473, budget: 5"
+    - "Post all grades for course 121, assignment 473" (bulk posts stored grades with rubric scores)
+    - "Save as exemplar" (after reviewing a grade, to calibrate similar submissions)
+    
     **Natural Language:**
     - "I want to see the rubric for CS101"
     - "Can you grade John's submission?"
@@ -180,43 +291,82 @@ with st.sidebar:
         with st.spinner("Processing rubric..."):
             try:
                 structured_content, message = process_uploaded_rubric(uploaded_file)
-                if structured_content:
-                    st.session_state.graph_state["uploaded_rubric"] = structured_content
-                    # Parse and preview the rubric
-                    preview = parse_rubric(structured_content)
-                    st.session_state.messages.append(
-                        AIMessage(content=f"""✅ {message}
-
-Here's how I've interpreted your rubric:
-
-{preview}
-
-You can now:
-1. Start grading by providing course and assignment IDs
-2. Use this rubric for any assignment
-3. Modify the rubric if needed
-
-What would you like to do next?""")
-                    )
-                    st.success(message)
-                else:
-                    st.error(message)
+                if message:
+                    report_rubric_result(structured_content, message)
             except Exception as e:
                 st.error(f"Error uploading file: {str(e)}")
-    elif uploaded_file:
+    elif uploaded_file and "rubric_ingest" not in st.session_state:
         # File is already uploaded and processed, just show a status indicator
         st.success("Rubric loaded and ready to use")
+    
+    # Text extraction runs in the background; the fragment polls it until it is done
+    if "rubric_ingest" in st.session_state:
+        rubric_ingest_status()
+    if "rubric_ingest_outcome" in st.session_state:
+        report_rubric_result(*st.session_state.pop("rubric_ingest_outcome"))
+    
+    # Reuse a rubric structured earlier (by anyone) without another LLM call
+    previous_rubrics = list_structured_rubrics()
+    if previous_rubrics:
+        labels = {
+            f"{item['filename']} ({time.strftime('%Y-%m-%d %H:%M', time.localtime(item['created_at']))})": item["file_hash"]
+            for item in previous_rubrics
+        }
+        choice = st.selectbox("Or reuse a previously structured rubric", ["—"] + list(labels))
+        if choice != "—" and st.button("Use this rubric"):
+            cached_rubric = get_structured_rubric(labels[choice])
+            if cached_rubric:
+                use_rubric(cached_rubric)
+                st.session_state.messages.append(
+                    AIMessage(content=f"✅ Loaded cached rubric {choice}:\n\n{parse_rubric(cached_rubric)}")
+                )
+                st.success("Cached rubric loaded")
 
-# Display chat messages
+# Send grade posts left in the outbox by an earlier run (a no-op once the flusher is running)
+get_flusher().start()
+
+# Opt-in background grading of the whole assignment when a rubric is previewed
+st.sidebar.toggle(
+    "Pre-grade assignment in background",
+    key="pregrade_enabled",
+    value=PREGRADE_ENABLED,
+    help="After a rubric is previewed, grade every submitted student at low priority so later requests are instant."
+)
+if st.session_state.get("course_id") and st.session_state.get("assignment_id"):
+    done, total = get_pregrader().progress(st.session_state.course_id, st.session_state.assignment_id)
+    if total:
+        st.sidebar.progress(done / total, text=f"Pre-graded {done}/{total}")
+    # Grade posts waiting in the outbox (retried in the background)
+    counts = status_counts(st.session_state.course_id, st.session_state.assignment_id)
+    waiting = counts.get(OUTBOX_PENDING, 0) + counts.get(OUTBOX_SENDING, 0)
+    if waiting or counts.get(OUTBOX_FAILED):
+        st.sidebar.caption(f"Canvas posts: {waiting} queued, {counts.get(OUTBOX_FAILED, 0)} failed")
+
+# Per-run timing summary from the tracing spans of the last turn
+if st.session_state.get("last_run_summary"):
+    with st.sidebar.expander("Last run timings"):
+        st.code(st.session_state.last_run_summary)
+
+# Display chat messages (only the latest page; earlier ones are loaded on request)
 chat_container = st.container()
 with chat_container:
-    for msg in st.session_state.messages:
-        if isinstance(msg, AIMessage):
-            with st.chat_message("assistant", avatar="🤖"):
-                st.write(msg.content)
-        else:
-            with st.chat_message("user", avatar="👤"):
-                st.write(msg.content)
+    live_messages = st.session_state.messages
+    visible_count = st.session_state.visible_count
+    total_messages = len(live_messages) + st.session_state.get("archived_count", 0)
+    hidden_total = max(total_messages - visible_count, 0)
+    
+    if hidden_total > 0 and st.button(f"Show earlier messages ({hidden_total} hidden)"):
+        st.session_state.visible_count += PAGE_SIZE
+        st.rerun()
+    
+    # Pages that reach past the live window are read back from the transcript store
+    archived_needed = visible_count - len(live_messages)
+    if archived_needed > 0 and st.session_state.get("archived_count", 0):
+        for record in load_archived(st.session_state.session_id, archived_needed):
+            render_message(record["role"], record["content"])
+    
+    for msg in live_messages[-visible_count:]:
+        render_message(_message_role(msg), msg.content)
 
     # Show loading message if processing
     if st.session_state.processing:
@@ -235,14 +385,16 @@ if prompt := st.chat_input("Type your message here...", disabled=st.session_stat
 if st.session_state.processing:
     try:
         # Add to graph state messages
-        st.session_state.graph_state["messages"] = [
-            msg for msg in st.session_state.messages if isinstance(msg, HumanMessage)
-        ]
+        st.session_state.graph_state["messages"] = recent_human_messages(st.session_state.messages)
         
         # Process with graph
         with st.spinner("Processing..."):
-            graph = build_grading_graph()
-            result = graph.invoke(st.session_state.graph_state)
+            trace_id = start_run()
+            graph = get_grading_graph()
+            # LLM usage is attributed to course/assignment/student by the tools that resolve them
+            with span("graph.invoke"):
+                result = graph.invoke(st.session_state.graph_state)
+            st.session_state.last_run_summary = format_summary_table(run_summary(trace_id))
             
             # Handle the result
             if isinstance(result, dict):
@@ -314,10 +466,19 @@ if st.session_state.processing:
     
     finally:
         st.session_state.processing = False
+        archive_overflow_messages()
         st.rerun()
 
 # Clear chat button
 if st.sidebar.button("Clear Chat"):
+    # Keep the full transcript on disk; only session memory is cleared
+    archive_messages(
+        st.session_state.session_id,
+        [(_message_role(msg), msg.content) for msg in st.session_state.messages]
+    )
+    st.session_state.session_id = uuid.uuid4().hex
+    st.session_state.archived_count = 0
+    st.session_state.visible_count = PAGE_SIZE
     st.session_state.messages = [
         AIMessage(content="""Hi! I'm your AI grading assistant. I can help you grade assignments and manage feedback. Here's how you can interact with me:
 
@@ -350,4 +511,4 @@ What would you like to do?""")
         "last_error": None
     }
     st.session_state.processing = False
-    st.rerun()
\ No newline at end of file
+    st.rerun()
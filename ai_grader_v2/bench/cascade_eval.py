@@ -0,0 +1,97 @@
+"""Compare cascade grading with grading everything on the strong model.
+
+Grades the labeled fixture set (bench/fixtures/labeled_submissions.jsonl)
+both ways and reports agreement with the reference scores, agreement between
+the two modes, escalation rate and wall-clock throughput.
+
+Run from ai_grader_v2/:
+    python -m bench.cascade_eval                      # offline, fake fast/strong models
+    python -m bench.cascade_eval --live               # real CASCADE_FAST_MODEL vs gpt-4 (costs money)
+    python -m bench.cascade_eval --concurrency 4 --tolerance 5 --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.fake_canvas import RUBRIC
+from bench.fake_llm import FakeLLMBackend
+
+from utils import llm_utils
+from utils.rubric_parser import parse_rubric
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "labeled_submissions.jsonl")
+
+
+def load_fixtures(path=FIXTURES):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run_mode(mode, fixtures, rubric_text, concurrency):
+    """Grade every fixture with ``mode`` and return (results by id, wall seconds)."""
+    def grade(fixture):
+        return fixture["id"], llm_utils.grading_llm(fixture["text"], rubric_text, mode=mode)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = dict(pool.map(grade, fixtures))
+    return results, time.perf_counter() - start
+
+
+def agreement(scores, reference, tolerance):
+    """Mean absolute error and share of items within ``tolerance`` points."""
+    diffs = [abs(scores[i] - reference[i]) for i in reference]
+    return statistics.mean(diffs), sum(d <= tolerance for d in diffs) / len(diffs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=FIXTURES)
+    parser.add_argument("--live", action="store_true", help="Use the real OpenAI models instead of fakes")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--tolerance", type=float, default=5.0, help="Points counted as agreement")
+    parser.add_argument("--repeat", type=int, default=1, help="Grade the fixture set this many times")
+    parser.add_argument("--strong-latency", type=float, default=0.5)
+    parser.add_argument("--fast-latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    if not args.live:
+        llm_utils.set_grading_backend(FakeLLMBackend(latency=args.strong_latency, tokens_per_second=40.0, seed=0))
+        llm_utils.set_fast_grading_backend(FakeLLMBackend(latency=args.fast_latency, tokens_per_second=400.0, seed=1))
+
+    fixtures = load_fixtures(args.fixtures)
+    # Repeats get distinct ids so each one is a separate grading call
+    fixtures = [dict(f, id=f"{f['id']}#{r}") for r in range(args.repeat) for f in fixtures]
+    reference = {f["id"]: float(f["reference_score"]) for f in fixtures}
+    rubric_text = parse_rubric(RUBRIC)
+
+    strong, strong_wall = run_mode("single", fixtures, rubric_text, args.concurrency)
+    cascade, cascade_wall = run_mode("cascade", fixtures, rubric_text, args.concurrency)
+
+    strong_scores = {i: r["score"] for i, r in strong.items()}
+    cascade_scores = {i: r["score"] for i, r in cascade.items()}
+    escalated = [i for i, r in cascade.items() if r.get("tier") == "strong"]
+
+    print(f"{'mode':<10}{'items':>7}{'MAE':>8}{'within':>9}{'wall s':>9}{'items/s':>9}")
+    for name, scores, wall in (("strong", strong_scores, strong_wall), ("cascade", cascade_scores, cascade_wall)):
+        mae, within = agreement(scores, reference, args.tolerance)
+        print(f"{name:<10}{len(scores):>7}{mae:>8.1f}{within:>8.0%}{wall:>9.2f}{len(scores) / wall:>9.1f}")
+
+    mae, within = agreement(cascade_scores, strong_scores, args.tolerance)
+    print(f"\nCascade vs strong: MAE {mae:.1f}, {within:.0%} within {args.tolerance:g} points")
+    print(f"Escalated to the strong model: {len(escalated)}/{len(cascade)} ({len(escalated) / len(cascade):.0%})")
+    print(f"Speed-up: {strong_wall / cascade_wall:.2f}x")
+    reasons = {}
+    for i in escalated:
+        for reason in cascade[i]["escalation_reason"].split("; "):
+            key = reason.split(" (")[0]
+            reasons[key] = reasons.get(key, 0) + 1
+    for reason, count in sorted(reasons.items(), key=lambda item: -item[1]):
+        print(f"  {reason}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""Local fake of the Canvas REST endpoints the grader uses.
+
+Serves generated submissions and a rubric (over REST and a minimal GraphQL
+endpoint), accepts grade PUTs and update_grades POSTs, and can add
+per-request latency and a requests/second rate limit (answered with
+Canvas's 403 "Rate Limit Exceeded").
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SUBMISSIONS_PATH = re.compile(r"^/api/v1/courses/(\d+)/assignments/(\d+)/submissions$")
+SUBMISSION_PATH = re.compile(r"^/api/v1/courses/(\d+)/assignments/(\d+)/submissions/(\d+)$")
+UPDATE_GRADES_PATH = re.compile(r"^/api/v1/courses/(\d+)/assignments/(\d+)/submissions/update_grades$")
+ASSIGNMENT_PATH = re.compile(r"^/api/v1/courses/(\d+)/assignments/(\d+)$")
+PROGRESS_PATH = re.compile(r"^/api/v1/progress/(\d+)$")
+GRAPHQL_PATH = "/api/graphql"
+
+FIRST_STUDENT_ID = 1000
+
+RUBRIC = [
+    {"id": "_5507", "points": 25.0, "description": "Critical Thinking & Argumentation",
+     "long_description": "Thesis Quality (5 pts)<br/>Analytical Depth (10 pts)<br/>Counterarguments (5 pts)<br/>Original Insight (5 pts)",
+     "ratings": [{"id": "blank", "points": 25.0, "description": "Excellent"},
+                 {"id": "_7863", "points": 20.0, "description": "Good"},
+                 {"id": "_6978", "points": 15.0, "description": "Marginal"},
+                 {"id": "blank_2", "points": 10.0, "description": "Poor"}]},
+    {"id": "113_4577", "points": 20.0, "description": "Structure, Organization & Flow",
+     "long_description": "Logical Progression (8 pts)<br/>Effective Paragraphing (6 pts)<br/>Use of Headings (6 pts)",
+     "ratings": [{"id": "113_2312", "points": 20.0, "description": "Excellent"},
+                 {"id": "113_4453", "points": 15.0, "description": "Good"},
+                 {"id": "113_5994", "points": 10.0, "description": "Marginal"},
+                 {"id": "113_5929", "points": 5.0, "description": "Poor"}]},
+    {"id": "113_8812", "points": 30.0, "description": "Use of Evidence",
+     "long_description": "Relevant sources (15 pts)<br/>Accurate interpretation (15 pts)",
+     "ratings": [{"id": "113_1", "points": 30.0, "description": "Excellent"},
+                 {"id": "113_2", "points": 22.0, "description": "Good"},
+                 {"id": "113_3", "points": 15.0, "description": "Marginal"}]},
+    {"id": "113_9921", "points": 25.0, "description": "Writing Mechanics",
+     "long_description": "Grammar and style (15 pts)<br/>Citations (10 pts)",
+     "ratings": [{"id": "113_4", "points": 25.0, "description": "Excellent"},
+                 {"id": "113_5", "points": 18.0, "description": "Good"},
+                 {"id": "113_6", "points": 10.0, "description": "Poor"}]},
+]
+
+
+def make_essay_html(student_index, paragraphs=8):
+    """Generate a deterministic HTML essay of roughly ``paragraphs`` paragraphs."""
+    parts = [f"<h1>Financial Literacy Essay #{student_index}</h1>"]
+    for p in range(paragraphs):
+        if p % 3 == 0:
+            parts.append(f"<h2>Section {p // 3 + 1}</h2>")
+        sentence = (f"Student {student_index} argues point {p} about budgeting, saving and credit, "
+                    f"citing evidence and reasoning about household decisions. ")
+        parts.append(f"<p>{sentence * 4}</p>")
+        if p % 4 == 3:
+            parts.append("<ul><li>Compound interest</li><li>Emergency funds</li><li>Debt management</li></ul>")
+    return "".join(parts)
+
+
+def _rest_only_fields(user_id):
+    """Fields real REST submissions carry that the grader never reads (GraphQL lets us skip them)."""
+    return {
+        "assignment_id": 473, "grade": None, "score": None, "entered_grade": None, "entered_score": None,
+        "grade_matches_current_submission": True, "grader_id": None, "graded_at": None, "posted_at": None,
+        "preview_url": f"https://canvas.example.edu/courses/121/assignments/473/submissions/{user_id}?preview=1&version=1",
+        "submission_type": "online_text_entry", "url": None, "late": False, "missing": False, "excused": None,
+        "late_policy_status": None, "points_deducted": None, "seconds_late": 0, "extra_attempts": None,
+        "anonymous_id": f"a{user_id}", "cached_due_date": "2025-03-01T23:59:00Z", "redo_request": False,
+        "sticker": None, "custom_grade_status_id": None,
+    }
+
+
+class _TokenBucket:
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True, self.tokens
+            return False, self.tokens
+
+
+class FakeCanvasServer:
+    """Threaded fake Canvas API; use as a context manager.
+
+    Args:
+        num_students (int): Number of generated submissions per assignment
+        latency (float): Seconds added to every request
+        rate_limit (float): Allowed requests per second, or None for unlimited
+        paragraphs (int): Essay length for generated submissions
+    """
+
+    def __init__(self, num_students=30, latency=0.0, rate_limit=None, paragraphs=8, host="127.0.0.1", port=0):
+        self.num_students = num_students
+        self.latency = latency
+        self.bucket = _TokenBucket(rate_limit) if rate_limit else None
+        self.submissions = [
+            {
+                "id": 50000 + i,
+                "user_id": FIRST_STUDENT_ID + i,
+                "workflow_state": "submitted",
+                "attempt": 1,
+                "submitted_at": "2025-03-01T12:00:00Z",
+                "body": make_essay_html(i, paragraphs),
+                "submission_comments": [],
+                "user": {"id": FIRST_STUDENT_ID + i, "name": f"Student {i}"},
+                **_rest_only_fields(FIRST_STUDENT_ID + i),
+            }
+            for i in range(num_students)
+        ]
+        self.posted = []
+        self.request_count = 0
+        self.bytes_sent = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def graphql(self, query, variables):
+        """Answer the grader's assignment queries (GradingData / AssignmentRubric) with cursor pagination."""
+        criteria = [
+            {"_id": c["id"], "description": c["description"], "longDescription": c["long_description"],
+             "points": c["points"],
+             "ratings": [{"_id": r["id"], "description": r["description"], "points": r["points"]} for r in c["ratings"]]}
+            for c in RUBRIC
+        ]
+        assignment = {"_id": str(variables.get("assignmentId")), "name": "Essay", "pointsPossible": 100}
+        if "submissionsConnection" not in query:
+            assignment["rubric"] = {"criteria": criteria}
+            return {"assignment": assignment}
+        if variables.get("withRubric", True):
+            assignment["rubric"] = {"criteria": criteria}
+        first = int(variables.get("first") or 20)
+        start = int(variables["after"]) if variables.get("after") else 0
+        page = self.submissions[start:start + first]
+        end = start + len(page)
+        assignment["submissionsConnection"] = {
+            "nodes": [
+                {"_id": str(s["id"]), "attempt": s["attempt"], "state": s["workflow_state"],
+                 "submittedAt": s["submitted_at"], "gradedAt": None, "body": s["body"],
+                 "user": {"_id": str(s["user_id"]), "name": s["user"]["name"]}, "attachments": []}
+                for s in page
+            ],
+            "pageInfo": {"hasNextPage": end < len(self.submissions), "endCursor": str(end)},
+        }
+        return {"assignment": assignment}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, payload, headers=None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+                with server._lock:
+                    server.bytes_sent += len(body)
+
+            def _admit(self):
+                with server._lock:
+                    server.request_count += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                if server.bucket is None:
+                    return True
+                allowed, remaining = server.bucket.take()
+                if not allowed:
+                    with server._lock:
+                        server.rate_limited += 1
+                    body = b"403 Forbidden (Rate Limit Exceeded)"
+                    self.send_response(403)
+                    self.send_header("X-Rate-Limit-Remaining", "0")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return False
+                return True
+
+            def _read_form(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length).decode() if length else ""
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    return json.loads(raw or "{}")
+                return {k: v[-1] for k, v in parse_qs(raw).items()}
+
+            def do_GET(self):
+                if not self._admit():
+                    return
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                match = SUBMISSIONS_PATH.match(url.path)
+                if match:
+                    per_page = int(query.get("per_page", ["10"])[0])
+                    page = int(query.get("page", ["1"])[0])
+                    start = (page - 1) * per_page
+                    items = server.submissions[start:start + per_page]
+                    headers = {}
+                    if start + per_page < len(server.submissions):
+                        next_url = f"{server.base_url}{url.path[len('/api/v1'):]}?per_page={per_page}&page={page + 1}"
+                        headers["Link"] = f'<{next_url}>; rel="next"'
+                    return self._send(200, items, headers)
+                match = SUBMISSION_PATH.match(url.path)
+                if match:
+                    submission = next((s for s in server.submissions if s["user_id"] == int(match.group(3))), None)
+                    if submission is None:
+                        return self._send(404, {"errors": [{"message": "not found"}]})
+                    return self._send(200, submission)
+                match = ASSIGNMENT_PATH.match(url.path)
+                if match:
+                    return self._send(200, {"id": int(match.group(2)), "name": "Essay", "points_possible": 100, "rubric": RUBRIC})
+                match = PROGRESS_PATH.match(url.path)
+                if match:
+                    return self._send(200, {"id": int(match.group(1)), "workflow_state": "completed", "completion": 100})
+                self._send(404, {"errors": [{"message": "not found"}]})
+
+            def do_PUT(self):
+                if not self._admit():
+                    return
+                match = SUBMISSION_PATH.match(urlparse(self.path).path)
+                if not match:
+                    return self._send(404, {"errors": [{"message": "not found"}]})
+                form = self._read_form()
+                with server._lock:
+                    server.posted.append({"user_id": int(match.group(3)), "data": form})
+                self._send(200, {"user_id": int(match.group(3)), "grade": form.get("submission[posted_grade]")})
+
+            def _graphql(self):
+                request = self._read_form()
+                return self._send(200, {"data": server.graphql(request.get("query", ""), request.get("variables") or {})})
+
+            def do_POST(self):
+                if not self._admit():
+                    return
+                if urlparse(self.path).path == GRAPHQL_PATH:
+                    return self._graphql()
+                match = UPDATE_GRADES_PATH.match(urlparse(self.path).path)
+                if not match:
+                    return self._send(404, {"errors": [{"message": "not found"}]})
+                form = self._read_form()
+                with server._lock:
+                    server.posted.append({"user_id": None, "data": form})
+                    progress_id = len(server.posted)
+                self._send(200, {"id": progress_id, "workflow_state": "queued",
+                                 "url": f"{server.base_url}/progress/{progress_id}"})
+
+        return Handler
@@ -0,0 +1,127 @@
+"""Deterministic stand-in for the OpenAI chat API used by the benchmarks.
+
+Answers free-text grading, structured (JSON) cascade grading and intent prompts.
+
+Latency is ``latency + output_tokens / tokens_per_second`` so prompt size and
+throughput settings show up in the numbers the same way they would remotely.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+
+from utils.llm_utils import LLMBackend, account_llm_usage
+
+CRITERION_LINE = re.compile(r"^(.+?) \((\d+(?:\.\d+)?) points\)$", re.MULTILINE)
+ID_PATTERNS = {
+    "course_id": re.compile(r"course\s*(?:id)?[:\s]*(\d+)", re.IGNORECASE),
+    "assignment_id": re.compile(r"assignment\s*(?:id)?[:\s]*(\d+)", re.IGNORECASE),
+    "student_id": re.compile(r"student\s*(?:id)?[:\s]*(\d+)", re.IGNORECASE),
+}
+
+
+def estimate_tokens(text):
+    """Rough GPT tokenizer estimate (about 4 characters per token)."""
+    return max(1, len(text) // 4)
+
+
+class FakeLLMBackend(LLMBackend):
+    """Fake backend that answers grading, intent and free-form prompts deterministically."""
+    name = "fake"
+
+    def __init__(self, latency=0.2, tokens_per_second=50.0, seed=0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.seed = seed
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _digest(self, text):
+        return int(hashlib.sha256(f"{self.seed}:{text}".encode()).hexdigest(), 16)
+
+    def _criterion_scores(self, prompt, sample=0):
+        """(name, awarded, points) per rubric criterion in the prompt.
+
+        Scores track the submission's vocabulary richness (so stronger essays
+        score higher, as with a real grader) plus a seed-dependent +/-5% jitter.
+        """
+        submission = prompt.rsplit("Submission:", 1)[-1]
+        words = re.findall(r"[a-z']+", submission.lower())
+        richness = min(1.0, len(set(words)) / 250.0) if words else 0.0
+        digest = self._digest(f"{sample}:{submission}" if sample else submission)
+        scores = []
+        for i, (name, points) in enumerate(CRITERION_LINE.findall(prompt.rsplit("Submission:", 1)[0])):
+            points = float(points)
+            jitter = ((digest >> (i * 8)) % 11 - 5) / 100.0
+            fraction = min(1.0, max(0.0, 0.5 + 0.5 * richness + jitter))
+            scores.append((name, round(points * fraction, 1), points))
+        return scores, digest
+
+    def _grade(self, prompt, sample=0):
+        scores, _ = self._criterion_scores(prompt, sample)
+        lines = [f"{name}: {awarded}/{points}\nFeedback: Solid work on {name.lower()}.\n"
+                 for name, awarded, points in scores]
+        total = sum(awarded for _, awarded, _ in scores) if scores else 80.0
+        maximum = sum(points for _, _, points in scores) if scores else 100.0
+        header = f"Overall Score: {round(total, 1)}/{maximum}\n"
+        footer = "Strengths: Clear structure.\nAreas for Improvement: Deepen the analysis."
+        return "\n".join([header] + lines + [footer])
+
+    def _structured_grade(self, prompt):
+        scores, digest = self._criterion_scores(prompt)
+        if not scores:
+            scores = [("Overall Assessment", 80.0, 100.0)]
+        return json.dumps({
+            "criteria": [{"name": name, "points": awarded, "max_points": points,
+                          "feedback": f"Solid work on {name.lower()}."} for name, awarded, points in scores],
+            "total": round(sum(awarded for _, awarded, _ in scores), 1),
+            "max_total": sum(points for _, _, points in scores),
+            # Deterministic 0.55-0.99 self-reported confidence
+            "confidence": round(0.55 + (digest >> 64) % 45 / 100.0, 2),
+            "strengths": "Clear structure.",
+            "improvements": "Deepen the analysis.",
+        })
+
+    def _intent(self, message):
+        entities = {}
+        for key, pattern in ID_PATTERNS.items():
+            match = pattern.search(message)
+            if match:
+                entities[key] = match.group(1)
+        lowered = message.lower()
+        if "grade" in lowered:
+            intent = "grade_submission"
+        elif "rubric" in lowered:
+            intent = "view_rubric"
+        elif "submission" in lowered:
+            intent = "fetch_submission"
+        else:
+            intent = "unknown"
+        return json.dumps({"intent": intent, "entities": entities})
+
+    def _respond(self, messages, sample=0):
+        system = messages[0]["content"] if messages else ""
+        user = messages[-1]["content"] if messages else ""
+        if "grading assistant" in system and '"confidence"' in system:
+            return self._structured_grade(user)
+        if "grading assistant" in system and "Rubric:" in user:
+            return self._grade(user, sample)
+        if '"intent"' in system:
+            return self._intent(user)
+        return "Sure - I can help with that. Please share the course and assignment IDs."
+
+    def complete(self, messages, temperature=0.0):
+        return self.complete_n(messages, 1, temperature)[0]
+
+    def complete_n(self, messages, n, temperature=0.0):
+        """Like the API's ``n`` parameter: n differently-sampled replies for one round-trip."""
+        texts = [self._respond(messages, sample) for sample in range(n)]
+        prompt_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+        completion_tokens = [estimate_tokens(text) for text in texts]
+        # Samples are generated in parallel, so latency follows the longest one
+        time.sleep(self.latency + max(completion_tokens) / self.tokens_per_second)
+        account_llm_usage(prompt_tokens, sum(completion_tokens), self.name)
+        with self._lock:
+            self.calls += 1
+        return texts
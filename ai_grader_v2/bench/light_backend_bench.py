@@ -0,0 +1,57 @@
+"""Latency benchmark: remote GPT-4 vs. local model for the light router tasks.
+
+Run from ai_grader_v2/:
+    LOCAL_MODEL_PATH=models/model.gguf python -m bench.light_backend_bench --repeats 5
+"""
+import argparse
+import os
+import statistics
+
+from utils.llm_utils import OpenAIBackend, LlamaCppBackend, time_completion
+
+INTENT_PROMPT = (
+    "You are an AI that understands user requests about grading assignments.\n"
+    "Extract the intent and any relevant IDs from the user's message.\n"
+    'Respond in JSON format with two fields: "intent" and "entities".'
+)
+
+SAMPLES = [
+    [{"role": "system", "content": INTENT_PROMPT},
+     {"role": "user", "content": "Can you grade student 247 in course 121 for assignment 473?"}],
+    [{"role": "system", "content": INTENT_PROMPT},
+     {"role": "user", "content": "show me the rubric for the essay in course 121, assignment 473"}],
+    [{"role": "system", "content": "You are a helpful AI grading assistant. Keep responses concise."},
+     {"role": "user", "content": str({"intent": "view_rubric", "course_id": None, "success": False})}],
+]
+
+
+def run(backend, repeats):
+    latencies = []
+    for messages in SAMPLES:
+        latencies.extend(time_completion(backend, messages, repeats))
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return statistics.median(latencies), p95, statistics.mean(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--model-path", default=os.getenv("LOCAL_MODEL_PATH"))
+    parser.add_argument("--skip-remote", action="store_true")
+    args = parser.parse_args()
+
+    backends = []
+    if not args.skip_remote:
+        backends.append(OpenAIBackend(model="gpt-4"))
+    if args.model_path:
+        backends.append(LlamaCppBackend(args.model_path))
+
+    print(f"{'backend':<12}{'p50 (s)':>10}{'p95 (s)':>10}{'mean (s)':>10}")
+    for backend in backends:
+        p50, p95, mean = run(backend, args.repeats)
+        print(f"{backend.name:<12}{p50:>10.3f}{p95:>10.3f}{mean:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
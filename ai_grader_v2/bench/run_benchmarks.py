@@ -0,0 +1,191 @@
+"""Throughput/latency benchmarks against a local fake Canvas API and fake LLM.
+
+Run from ai_grader_v2/:
+    python -m bench.run_benchmarks
+    python -m bench.run_benchmarks --scenario batch_grade --concurrency 1 4 16 --students 100
+    python -m bench.run_benchmarks --canvas-latency 0.05 --rate-limit 20 --llm-latency 0.5
+    python -m bench.run_benchmarks --scenario fetch_assignment --students 250   # REST vs GraphQL
+
+Reports p50/p95 latency, throughput and peak Python memory (tracemalloc) per scenario.
+"""
+import argparse
+import statistics
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.fake_canvas import FakeCanvasServer, FIRST_STUDENT_ID, make_essay_html
+from bench.fake_llm import FakeLLMBackend
+
+from api import canvas_api
+from utils import llm_utils
+from utils.rubric_parser import parse_rubric
+from utils.tracing import logger
+
+COURSE_ID = "121"
+ASSIGNMENT_ID = "473"
+
+ROUTER_MESSAGES = [
+    "121,473",
+    "121,473,1005",
+    "course_id: 121, assignment_id: 473",
+    "Can you grade student 1003 in course 121 for assignment 473?",
+    "show me the rubric for course 121 assignment 473",
+    "modify grade score: 88",
+    "feedback: nice structure, expand the counterarguments",
+    "what can you do?",
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class Result:
+    def __init__(self, name, latencies, wall, peak_bytes, extra=""):
+        self.name = name
+        self.latencies = latencies
+        self.wall = wall
+        self.peak_bytes = peak_bytes
+        self.extra = extra
+
+    def row(self):
+        n = len(self.latencies)
+        return (f"{self.name:<28}{n:>7}{statistics.median(self.latencies) * 1000:>10.1f}"
+                f"{percentile(self.latencies, 95) * 1000:>10.1f}{n / self.wall:>10.1f}"
+                f"{self.peak_bytes / 1e6:>10.1f}  {self.extra}")
+
+
+HEADER = f"{'scenario':<28}{'ops':>7}{'p50 ms':>10}{'p95 ms':>10}{'ops/s':>10}{'peak MB':>10}"
+
+
+def measure(name, func, items, concurrency=1, extra=""):
+    """Run ``func`` over ``items`` with a thread pool and collect per-item latencies."""
+    latencies = []
+
+    def timed(item):
+        start = time.perf_counter()
+        func(item)
+        return time.perf_counter() - start
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    if concurrency == 1:
+        latencies = [timed(item) for item in items]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(timed, items))
+    wall = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return Result(name, latencies, wall, peak, extra)
+
+
+def grade_student(student_id):
+    """Headless version of grade_selected_tool + submit_to_canvas_tool for one student."""
+    from utils.html_text import clean_html_text
+
+    submissions = canvas_api.get_submissions(COURSE_ID, ASSIGNMENT_ID)
+    submission = next((s for s in submissions if str(s["user_id"]) == str(student_id)), None)
+    if submission is None:
+        raise RuntimeError(f"no submission for {student_id}")
+    rubric = canvas_api.get_assignment_rubric(COURSE_ID, ASSIGNMENT_ID)
+    text = clean_html_text(submission.get("body", ""))
+    result = llm_utils.strict_grading_llm(text, parse_rubric(rubric))
+    canvas_api.submit_grade_and_feedback(student_id, COURSE_ID, ASSIGNMENT_ID, result["score"], result["feedback"])
+    return result
+
+
+def scenario_html_clean(args, server):
+    from utils.html_text import clean_html_text
+    bodies = [make_essay_html(i, args.paragraphs) for i in range(args.students)]
+    return [measure("html_clean", clean_html_text, bodies)]
+
+
+def scenario_router(args, server):
+    from langgraph_pipeline import understand_user_intent
+    messages = ROUTER_MESSAGES * max(1, args.students // len(ROUTER_MESSAGES))
+    return [measure("router_intent", understand_user_intent, messages)]
+
+
+def scenario_single_grade(args, server):
+    students = [FIRST_STUDENT_ID + i for i in range(min(args.students, 10))]
+    return [measure("single_grade", grade_student, students)]
+
+
+def scenario_batch_grade(args, server):
+    results = []
+    students = [FIRST_STUDENT_ID + i for i in range(args.students)]
+    for concurrency in args.concurrency:
+        before = server.rate_limited
+        result = measure(f"batch_grade[c={concurrency}]", grade_student, students, concurrency)
+        result.extra = f"rate-limited={server.rate_limited - before}"
+        results.append(result)
+    return results
+
+
+def scenario_fetch_assignment(args, server):
+    """Rubric + all submissions through the REST and the GraphQL backends."""
+    results = []
+    original = canvas_api.CANVAS_BACKEND
+    try:
+        for backend in ("rest", "graphql"):
+            canvas_api.CANVAS_BACKEND = backend
+            requests_before, bytes_before = server.request_count, server.bytes_sent
+            items = []
+            result = measure(f"fetch_assignment[{backend}]",
+                             lambda _: items.append(len(canvas_api.get_assignment_data(COURSE_ID, ASSIGNMENT_ID)[1])),
+                             range(args.repeats))
+            requests_made = (server.request_count - requests_before) / args.repeats
+            kilobytes = (server.bytes_sent - bytes_before) / args.repeats / 1024
+            result.extra = f"requests/op={requests_made:.0f} KB/op={kilobytes:.0f} submissions={items[-1]}"
+            results.append(result)
+    finally:
+        canvas_api.CANVAS_BACKEND = original
+    return results
+
+
+SCENARIOS = {
+    "html_clean": scenario_html_clean,
+    "router_intent": scenario_router,
+    "single_grade": scenario_single_grade,
+    "batch_grade": scenario_batch_grade,
+    "fetch_assignment": scenario_fetch_assignment,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), action="append")
+    parser.add_argument("--students", type=int, default=40)
+    parser.add_argument("--paragraphs", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=10, help="Repetitions for fetch_assignment")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--canvas-latency", type=float, default=0.02)
+    parser.add_argument("--rate-limit", type=float, default=None, help="Canvas requests per second")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--llm-tps", type=float, default=200.0, help="Fake LLM output tokens per second")
+    args = parser.parse_args()
+
+    fake_llm = FakeLLMBackend(latency=args.llm_latency, tokens_per_second=args.llm_tps)
+    llm_utils.set_light_backend(fake_llm)
+    llm_utils.set_grading_backend(fake_llm)
+
+    with FakeCanvasServer(args.students, args.canvas_latency, args.rate_limit, args.paragraphs) as server:
+        canvas_api.API_URL = server.base_url
+        canvas_api.ACCESS_TOKEN = "bench-token"
+        print(HEADER)
+        for name in args.scenario or list(SCENARIOS):
+            try:
+                for result in SCENARIOS[name](args, server):
+                    print(result.row())
+            except Exception as e:
+                logger.error("Scenario %s failed: %s", name, e)
+        print(f"\nCanvas requests: {server.request_count}, rate-limited: {server.rate_limited}, "
+              f"grades posted: {len(server.posted)}, LLM calls: {fake_llm.calls}")
+
+
+if __name__ == "__main__":
+    main()
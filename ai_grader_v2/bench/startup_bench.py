@@ -0,0 +1,99 @@
+"""Cold-start benchmark: import cost of the app's entry modules, via ``python -X importtime``.
+
+Run from ai_grader_v2/:
+    python -m bench.startup_bench
+    python -m bench.startup_bench --module utils.batch_grader --top 15
+    python -m bench.startup_bench --budget-ms 800      # exit 1 if any module is slower
+
+Each module is imported in a fresh interpreter (like a new batch worker or
+a service process), so nothing is shared with earlier runs except the OS
+file cache. Reports the wall time of the process, the cumulative import
+time of the module and its heaviest dependencies.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+DEFAULT_MODULES = [
+    "utils.batch_grader",    # batch worker
+    "utils.pregrader",       # background / live-event grading
+    "langgraph_pipeline",    # chat graph (imported by app.py)
+    "grading_service",       # ASGI service
+]
+
+# "import time:      self [us] |  cumulative | imported package"
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|\s*(\S+)")
+
+
+def profile_import(module, python=sys.executable):
+    """Import ``module`` in a fresh interpreter and return (wall seconds, {package: (self_us, cumulative_us)})."""
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.getcwd(),
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        last_line = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "unknown error"
+        raise RuntimeError(f"import {module} failed: {last_line}")
+    timings = {}
+    for line in proc.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, package = match.groups()
+            timings[package] = (int(self_us), int(cumulative_us))
+    return wall, timings
+
+
+def top_level_costs(timings, top, exclude=()):
+    """Heaviest top-level packages by cumulative import time, leaving out ``exclude`` (interpreter startup)."""
+    roots = {}
+    for package, (_, cumulative) in timings.items():
+        root = package.split(".")[0]
+        if root in exclude:
+            continue
+        roots[root] = max(roots.get(root, 0), cumulative)
+    return sorted(roots.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", action="append", help="Module to import (repeatable)")
+    parser.add_argument("--repeats", type=int, default=3, help="Fresh interpreters per module (median is reported)")
+    parser.add_argument("--top", type=int, default=8, help="Heaviest packages to list per module")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail if a module's median import exceeds this")
+    args = parser.parse_args()
+
+    # Baseline: an interpreter that imports nothing of ours
+    baseline_runs = [profile_import("sys") for _ in range(args.repeats)]
+    baseline = statistics.median(run[0] for run in baseline_runs)
+    startup_packages = {package.split(".")[0] for package in baseline_runs[-1][1]}
+    print(f"interpreter start: {baseline * 1000:.0f} ms\n")
+    print(f"{'module':<24}{'wall ms':>10}{'import ms':>11}  heaviest packages (cumulative ms)")
+
+    over_budget = []
+    for module in args.module or DEFAULT_MODULES:
+        try:
+            runs = [profile_import(module) for _ in range(args.repeats)]
+        except RuntimeError as e:
+            print(f"{module:<24}{'-':>10}{'-':>11}  {e}")
+            continue
+        wall = statistics.median(run[0] for run in runs)
+        import_ms = statistics.median(run[1].get(module, (0, 0))[1] for run in runs) / 1000
+        heaviest = ", ".join(f"{name} {us / 1000:.0f}" for name, us in top_level_costs(runs[-1][1], args.top + 1, startup_packages)
+                             if name != module.split(".")[0])
+        print(f"{module:<24}{wall * 1000:>10.0f}{import_ms:>11.0f}  {heaviest}")
+        if args.budget_ms is not None and import_ms > args.budget_ms:
+            over_budget.append(module)
+
+    if over_budget:
+        print(f"\nOver the {args.budget_ms:.0f} ms budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+# grading_service.py
+"""HTTP/ASGI grading service for LMS integrations and other UIs.
+
+Run from ai_grader_v2/:
+    uvicorn grading_service:app --port 8000
+
+Endpoints:
+    POST /grade                     grade one student, returns the grade
+    POST /chat                      one chat turn through the LangGraph pipeline
+    POST /batches                   grade a whole assignment, returns a job id
+    GET  /jobs/{job_id}             job status and results so far
+    GET  /jobs/{job_id}/events      job progress as Server-Sent Events
+    GET  /grades/{course}/{assignment}/{student}   a stored grade
+
+Grading, Canvas and LLM calls are blocking, so each request runs in a worker
+thread with its own isolated session state while the event loop keeps
+serving other clients. Set GRADING_SERVICE_TOKEN to require
+"Authorization: Bearer <token>".
+"""
+import asyncio
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from langchain_core.messages import HumanMessage
+from pydantic import BaseModel
+
+from langgraph_pipeline import get_grading_graph
+from tool.grading_tool import grade_selected_tool
+from utils.batch_grader import BatchGrader, DEFAULT_RUN_BUDGET
+from utils.grade_outbox import get_flusher
+from utils.grade_store import get_grade, graded_student_ids
+from utils.session_state import isolated_state
+from utils.tracing import logger, span
+from utils.usage_store import usage_context
+
+SERVICE_TOKEN = os.getenv("GRADING_SERVICE_TOKEN", "")
+# Chat sessions and finished jobs kept in memory; the oldest are dropped first
+MAX_SESSIONS = int(os.getenv("GRADING_SERVICE_MAX_SESSIONS", "200"))
+MAX_JOBS = int(os.getenv("GRADING_SERVICE_MAX_JOBS", "100"))
+# Seconds between SSE keep-alive comments while a job is quiet
+SSE_KEEPALIVE = 15
+JOB_END_EVENTS = ("done", "failed")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Grade posts queued by an earlier process are sent on startup
+    get_flusher().start()
+    yield
+
+
+app = FastAPI(title="AI Canvas Grader", lifespan=lifespan)
+
+
+def require_token(authorization: str = Header(default="")):
+    if SERVICE_TOKEN and not hmac.compare_digest(authorization.removeprefix("Bearer ").strip(), SERVICE_TOKEN):
+        raise HTTPException(status_code=401, detail="invalid or missing token")
+
+
+class GradeRequest(BaseModel):
+    course_id: str
+    assignment_id: str
+    student_id: str
+    rubric: Optional[list] = None
+
+
+class ChatRequest(BaseModel):
+    message: str
+    session_id: Optional[str] = None
+
+
+class BatchRequest(BaseModel):
+    course_id: str
+    assignment_id: str
+    student_ids: Optional[List[str]] = None
+    rubric: Optional[list] = None
+    budget_usd: Optional[float] = DEFAULT_RUN_BUDGET
+    skip_graded: bool = True
+
+
+def _grade_one(request):
+    with isolated_state({"uploaded_rubric": request.rubric} if request.rubric else None) as state, \
+            usage_context(course_id=request.course_id, assignment_id=request.assignment_id,
+                          student_id=request.student_id), \
+            span("service.grade", student_id=request.student_id):
+        message = grade_selected_tool(f"{request.course_id},{request.assignment_id},{request.student_id}")
+        result = state.get("last_grade_result")
+    if not isinstance(result, dict):
+        raise HTTPException(status_code=502, detail=message)
+    return {
+        "course_id": request.course_id,
+        "assignment_id": request.assignment_id,
+        "student_id": request.student_id,
+        "student_name": state.get("selected_student_name"),
+        "score": state.get("current_grade"),
+        "feedback": state.get("current_feedback"),
+        "model": result.get("model"),
+        "review_reason": result.get("review_reason"),
+        "pregraded": bool(result.get("pregraded")),
+        "message": message,
+    }
+
+
+@app.post("/grade", dependencies=[Depends(require_token)])
+async def grade(request: GradeRequest):
+    return await asyncio.to_thread(_grade_one, request)
+
+
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+
+
+def _session(session_id):
+    with _sessions_lock:
+        session = _sessions.get(session_id)
+        if session is None:
+            session = {"state": {}, "graph_state": {"messages": [], "error_count": 0}, "lock": threading.Lock()}
+            _sessions[session_id] = session
+            while len(_sessions) > MAX_SESSIONS:
+                _sessions.popitem(last=False)
+        _sessions.move_to_end(session_id)
+    return session
+
+
+def _chat(request, session_id):
+    session = _session(session_id)
+    # Turns of one session run in order; different sessions run concurrently
+    with session["lock"], isolated_state(session["state"]) as state:
+        graph_state = session["graph_state"]
+        graph_state["messages"] = [HumanMessage(content=request.message)]
+        # LLM usage is attributed to course/assignment/student by the tools that resolve them
+        with span("graph.invoke"):
+            result = get_grading_graph().invoke(graph_state)
+        if isinstance(result, dict):
+            graph_state.update({k: v for k, v in result.items() if k != "messages"})
+        session["state"] = dict(state)
+    response = result.get("response", "") if isinstance(result, dict) else str(result)
+    return {"session_id": session_id, "response": response}
+
+
+@app.post("/chat", dependencies=[Depends(require_token)])
+async def chat(request: ChatRequest):
+    return await asyncio.to_thread(_chat, request, request.session_id or uuid.uuid4().hex)
+
+
+class Job:
+    """A background batch run; progress events are pushed to SSE subscribers on their event loops."""
+
+    def __init__(self, request):
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.status = "queued"
+        self.results = []
+        self.summary = None
+        self.error = None
+        self.created_at = time.time()
+        self.events = []
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def publish(self, event, **data):
+        payload = {"event": event, "job_id": self.id, "status": self.status, "graded": len(self.results), **data}
+        with self._lock:
+            self.events.append(payload)
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, payload)
+
+    def subscribe(self):
+        """An asyncio.Queue fed with future events, plus the events so far."""
+        queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.append((asyncio.get_running_loop(), queue))
+            past = list(self.events)
+        return queue, past
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers = [(loop, q) for loop, q in self._subscribers if q is not queue]
+
+    @property
+    def finished(self):
+        return self.status in JOB_END_EVENTS
+
+    def to_dict(self, with_results=True):
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "course_id": self.request.course_id,
+            "assignment_id": self.request.assignment_id,
+            "graded": len(self.results),
+            "error": self.error,
+        }
+        if self.summary:
+            data.update(self.summary)
+        if with_results:
+            data["results"] = self.results
+        return data
+
+
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def _result_fields(result):
+    return {k: result.get(k) for k in ("student_id", "student_name", "score", "feedback", "model",
+                                       "review_reason", "duplicate_of", "source")}
+
+
+def _run_batch(job):
+    request = job.request
+    job.status = "running"
+    job.publish("started")
+
+    def on_result(result):
+        job.results.append(_result_fields(result))
+        job.publish("graded", student_id=result["student_id"], score=result.get("score"))
+
+    try:
+        with isolated_state(), span("service.batch", course_id=request.course_id,
+                                     assignment_id=request.assignment_id):
+            skip = graded_student_ids(request.course_id, request.assignment_id) if request.skip_graded else ()
+            grader = BatchGrader(request.course_id, request.assignment_id, rubric=request.rubric,
+                                 budget_usd=request.budget_usd)
+            summary = grader.run(student_ids=request.student_ids, skip_ids=skip, on_result=on_result)
+        # Duplicate reuse adds results after the run
+        job.results = [_result_fields(r) for r in summary["results"]]
+        job.summary = {
+            "failed": summary["failed"],
+            "remaining": summary["remaining"],
+            "paused": summary["paused"],
+            "spent_usd": summary["spent_usd"],
+        }
+        job.status = "done"
+        job.publish("done", paused=summary["paused"], failed=len(summary["failed"]))
+    except Exception as e:
+        logger.warning("Batch job %s failed: %s", job.id, e)
+        job.error = str(e)
+        job.status = "failed"
+        job.publish("failed", error=job.error)
+
+
+def _get_job(job_id):
+    job = _jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="unknown job")
+    return job
+
+
+@app.post("/batches", status_code=202, dependencies=[Depends(require_token)])
+async def start_batch(request: BatchRequest):
+    job = Job(request)
+    with _jobs_lock:
+        _jobs[job.id] = job
+        # Forget the oldest finished jobs; running ones are kept
+        for old_id in [i for i, j in _jobs.items() if j.finished][:max(0, len(_jobs) - MAX_JOBS)]:
+            del _jobs[old_id]
+    threading.Thread(target=_run_batch, args=(job,), name=f"batch-{job.id[:8]}", daemon=True).start()
+    return {"job_id": job.id, "status": job.status, "events": f"/jobs/{job.id}/events"}
+
+
+@app.get("/jobs/{job_id}", dependencies=[Depends(require_token)])
+async def job_status(job_id: str, results: bool = True):
+    return _get_job(job_id).to_dict(with_results=results)
+
+
+def _sse(payload):
+    return f"event: {payload['event']}\ndata: {json.dumps(payload)}\n\n"
+
+
+@app.get("/jobs/{job_id}/events", dependencies=[Depends(require_token)])
+async def job_events(job_id: str):
+    job = _get_job(job_id)
+
+    async def stream():
+        queue, past = job.subscribe()
+        try:
+            for payload in past:
+                yield _sse(payload)
+            if past and past[-1]["event"] in JOB_END_EVENTS:
+                return
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse(payload)
+                if payload["event"] in JOB_END_EVENTS:
+                    return
+        finally:
+            job.unsubscribe(queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/grades/{course_id}/{assignment_id}/{student_id}", dependencies=[Depends(require_token)])
+async def stored_grade(course_id: str, assignment_id: str, student_id: str):
+    grade_row = await asyncio.to_thread(get_grade, course_id, assignment_id, student_id)
+    if not grade_row:
+        raise HTTPException(status_code=404, detail="no stored grade")
+    return grade_row
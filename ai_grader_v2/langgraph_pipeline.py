@@ -1,11 +1,7 @@
 # langgraph_pipeline.py
-from langgraph.graph import StateGraph, END
-from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
-from langchain_core.runnables import RunnableLambda
-from langgraph.prebuilt import ToolNode
-from langchain_openai import ChatOpenAI
+# langgraph.graph (StateGraph) is imported when the graph is first built
+from langgraph.constants import END
 import re
-import streamlit as st
 
 from tool.rubric_tool import preview_rubric_tool, load_rubric_tool
 from tool.submission_tool import fetch_submission_tool
@@ -14,31 +10,23 @@ from tool.grading_tool import (
     modify_grade_tool,
     modify_feedback_tool,
     submit_to_canvas_tool,
-    show_feedback_tool
+    show_feedback_tool,
+    save_exemplar_tool
 )
 from tool.feedback_tool import submit_feedback_tool
 from tool.submit_tool import submit_tool
+from tool.batch_grading_tool import grade_all_tool, post_all_grades_tool
 from dataclasses import dataclass, field
 from typing import List, Union, Dict, Any, Optional, Tuple
 from langchain_core.messages import BaseMessage
-
-# Initialize LLM
-llm = ChatOpenAI(
-    model="gpt-4",
-    temperature=0,
-)
-
-# Internal state storage for non-Streamlit environments
-_internal_state = {}
+from utils.llm_utils import light_completion
+from utils.json_utils import parse_llm_json, validate_intent, repair_messages
+from utils.tracing import logger, span
+from utils.session_state import current_state
 
 def get_state_store():
-    """Get the appropriate state store based on environment."""
-    try:
-        if st._is_running_with_streamlit:
-            return st.session_state
-    except:
-        pass
-    return _internal_state
+    """Get the appropriate state store based on environment (see utils.session_state)."""
+    return current_state()
 
 @dataclass
 class GradingState:
@@ -110,7 +98,7 @@ class GradingState:
 
 def understand_user_intent(message: str) -> Tuple[str, Dict[str, Any]]:
     """Use LLM to understand user intent and extract relevant information."""
-    print(f"Processing message: {message}")
+    logger.debug("Processing message: %s", message)
     
     # Check for grade modification commands first
     message_lower = message.lower()
@@ -135,16 +123,33 @@ def understand_user_intent(message: str) -> Tuple[str, Dict[str, Any]]:
     if "submit grade to canvas" in message_lower:
         return "submit_grade", {}
     
+    # Bulk posting of every stored grade of the assignment
+    if "post all" in message_lower:
+        entities = {f"{key}_id": value for key, value in re.findall(r'(course|assignment)(?:_id)?[:\s]+(\d+)', message_lower)}
+        return "post_all", entities
+    
+    # Approve the current grade as a calibration exemplar
+    if re.search(r"\bsave (?:this |it )?(?:grade )?(?:as (?:an? )?)?exemplar\b", message_lower):
+        return "save_exemplar", {}
+    
+    # Batch grading of the whole assignment, optionally with a spending budget
+    if "grade all" in message_lower:
+        entities = {f"{key}_id": value for key, value in re.findall(r'(course|assignment)(?:_id)?[:\s]+(\d+)', message_lower)}
+        budget_match = re.search(r'budget[:\s]*\$?(\d+(?:\.\d+)?)', message_lower)
+        if budget_match:
+            entities["budget"] = float(budget_match.group(1))
+        return "grade_all", entities
+    
     # First try to parse comma-separated format (e.g., "121,473")
     if "," in message and not any(word in message.lower() for word in ["course", "assignment", "student"]):
         parts = [part.strip() for part in message.split(",")]
         if len(parts) == 2:
             result = ("view_rubric", {"course_id": parts[0], "assignment_id": parts[1]})
-            print(f"Parsed comma format: {result}")
+            logger.debug("Parsed comma format: %s", result)
             return result
         elif len(parts) == 3:
             result = ("fetch_submission", {"course_id": parts[0], "assignment_id": parts[1], "student_id": parts[2]})
-            print(f"Parsed comma format: {result}")
+            logger.debug("Parsed comma format: %s", result)
             return result
     
     # Then try to parse structured format (e.g., "course_id: 121, assignment_id: 473")
@@ -153,18 +158,18 @@ def understand_user_intent(message: str) -> Tuple[str, Dict[str, Any]]:
         entities = {key: value for key, value in structured_match}
         if "course" in entities and "assignment" in entities:
             result = ("view_rubric", entities)
-            print(f"Parsed structured format: {result}")
+            logger.debug("Parsed structured format: %s", result)
             return result
         if "student" in entities:
             result = ("fetch_submission", entities)
-            print(f"Parsed structured format: {result}")
+            logger.debug("Parsed structured format: %s", result)
             return result
     
     # Finally, use LLM for natural language understanding
     system_prompt = """You are an AI that understands user requests about grading assignments.
 Extract the intent and any relevant IDs from the user's message.
 Respond in JSON format with two fields:
-1. "intent": One of [view_rubric, load_rubric, fetch_submission, grade_submission, prepare_feedback, submit_feedback, modify_grade, submit_grade, show_feedback, unknown]
+1. "intent": One of [view_rubric, load_rubric, fetch_submission, grade_submission, grade_all, post_all, prepare_feedback, submit_feedback, modify_grade, submit_grade, show_feedback, save_exemplar, unknown]
 2. "entities": Dictionary containing any found course_id, assignment_id, student_id, score, or feedback
 
 Example inputs and outputs:
@@ -189,13 +194,17 @@ Example inputs and outputs:
     ]
     
     try:
-        response = llm.invoke(messages)
-        print(f"LLM response: {response.content}")
-        result = eval(response.content)  # Safe since we control the LLM prompt
-        print(f"Parsed LLM result: {result}")
+        content = light_completion(messages, purpose="intent")
+        logger.debug("LLM response: %s", content)
+        result = parse_llm_json(
+            content,
+            validator=validate_intent,
+            repair=lambda text, error: light_completion(repair_messages(text, error), purpose="repair")
+        )
+        logger.debug("Parsed LLM result: %s", result)
         return result["intent"], result["entities"]
     except Exception as e:
-        print(f"Error in LLM parsing: {str(e)}")
+        logger.warning("Error in LLM parsing: %s", e)
         return "unknown", {}
 
 def generate_response(intent: str, state: GradingState, success: bool = True) -> str:
@@ -220,8 +229,7 @@ If there's an error, explain what information is needed."""
     ]
     
     try:
-        response = llm.invoke(messages)
-        return response.content
+        return light_completion(messages, purpose="response")
     except Exception:
         return "I understand your request. Let me help you with that."
 
@@ -230,19 +238,26 @@ def user_input_router(state: GradingState) -> Dict[str, Any]:
     if not state.messages:
         return {"next": END}
     
+    with span("router") as router_span:
+        result = _route(state)
+        router_span.set("router.next", str(result.get("next")))
+        return result
+
+def _route(state: GradingState) -> Dict[str, Any]:
+    """Router body; wrapped in a span by user_input_router."""
     last_message = state.messages[-1].content
-    print(f"\nCurrent state before processing: course_id={state.get('course_id')}, assignment_id={state.get('assignment_id')}, student_id={state.get('student_id')}")
-    print(f"Processing message in router: {last_message}")
+    logger.debug("Current state before processing: course_id=%s, assignment_id=%s, student_id=%s", state.get('course_id'), state.get('assignment_id'), state.get('student_id'))
+    logger.debug("Processing message in router: %s", last_message)
     
     # Use LLM to understand intent
     intent, entities = understand_user_intent(last_message)
-    print(f"Understood intent: {intent}")
-    print(f"Extracted entities: {entities}")
+    logger.debug("Understood intent: %s", intent)
+    logger.debug("Extracted entities: %s", entities)
     
     # Update state with extracted entities
     if entities:
         state.update(entities)
-        print(f"Updated state: course_id={state.get('course_id')}, assignment_id={state.get('assignment_id')}, student_id={state.get('student_id')}")
+        logger.debug("Updated state: course_id=%s, assignment_id=%s, student_id=%s", state.get('course_id'), state.get('assignment_id'), state.get('student_id'))
     
     # Get state dictionary for passing to next node
     state_dict = state.to_dict()
@@ -252,51 +267,82 @@ def user_input_router(state: GradingState) -> Dict[str, Any]:
         if not all([state.get('course_id'), state.get('assignment_id'), state.get('student_id')]):
             # Check if we have a current grade or feedback to modify
             if intent == "modify_grade" and state.get('current_grade') is None:
-                print("Missing required fields and no current grade")
+                logger.debug("Missing required fields and no current grade")
                 response = "Please grade a submission first before trying to modify the grade."
                 state_dict["response"] = response
                 state_dict["next"] = END
                 return state_dict
             elif intent == "modify_feedback" and not state.get('current_feedback') and not state.get('current_grade'):
-                print("Missing required fields and no current feedback")
+                logger.debug("Missing required fields and no current feedback")
                 response = "Please grade a submission first before trying to modify the feedback."
                 state_dict["response"] = response
                 state_dict["next"] = END
                 return state_dict
         
-        print(f"Proceeding with {intent}")
+        logger.debug("Proceeding with %s", intent)
         state_dict["next"] = intent
         return state_dict
     
     # Handle grade submission to Canvas
     if intent == "submit_grade":
         if not all([state.get('course_id'), state.get('assignment_id'), state.get('student_id')]):
-            print("Missing required fields for grade submission")
+            logger.debug("Missing required fields for grade submission")
             response = "Please grade a submission first before trying to submit to Canvas."
             state_dict["response"] = response
             state_dict["next"] = END
             return state_dict
-        print("Proceeding with grade submission to Canvas")
+        logger.debug("Proceeding with grade submission to Canvas")
         state_dict["next"] = "submit_grade"
         return state_dict
     
+    # Handle saving the current grade as a calibration exemplar
+    if intent == "save_exemplar":
+        if not all([state.get('course_id'), state.get('assignment_id'), state.get('student_id')]):
+            logger.debug("Missing required fields for save_exemplar")
+            state_dict["response"] = "Please grade a submission first before saving it as an exemplar."
+            state_dict["next"] = END
+            return state_dict
+        state_dict["next"] = "save_exemplar"
+        return state_dict
+    
+    # Handle batch grading of every submitted student
+    if intent == "grade_all":
+        if not state.get('course_id') or not state.get('assignment_id'):
+            logger.debug("Missing required fields for grade_all")
+            response = generate_response(intent, state, False)
+            state_dict["response"] = response
+            state_dict["next"] = END
+            return state_dict
+        state_dict["next"] = "grade_all"
+        return state_dict
+    
+    # Handle bulk posting of stored grades
+    if intent == "post_all":
+        if not state.get('course_id') or not state.get('assignment_id'):
+            logger.debug("Missing required fields for post_all")
+            state_dict["response"] = "Please specify the course and assignment whose grades should be posted."
+            state_dict["next"] = END
+            return state_dict
+        state_dict["next"] = "post_all"
+        return state_dict
+    
     # Handle grading submission
     if intent == "grade_submission":
         # Ensure we persist the state
         state.persist_grading_state()
-        print(f"Proceeding with grade_submission: course_id={state.get('course_id')}, assignment_id={state.get('assignment_id')}, student_id={state.get('student_id')}")
+        logger.debug("Proceeding with grade_submission: course_id=%s, assignment_id=%s, student_id=%s", state.get('course_id'), state.get('assignment_id'), state.get('student_id'))
         state_dict["next"] = "grade_submission"
         return state_dict
     
     # Generate appropriate response based on intent and available information
     if intent == "view_rubric":
         if not state.get('course_id') or not state.get('assignment_id'):
-            print(f"Missing required fields for view_rubric: course_id={state.get('course_id')}, assignment_id={state.get('assignment_id')}")
+            logger.debug("Missing required fields for view_rubric: course_id=%s, assignment_id=%s", state.get('course_id'), state.get('assignment_id'))
             response = generate_response(intent, state, False)
             state_dict["response"] = response
             state_dict["next"] = END
             return state_dict
-        print(f"Proceeding with view_rubric: course_id={state.get('course_id')}, assignment_id={state.get('assignment_id')}")
+        logger.debug("Proceeding with view_rubric: course_id=%s, assignment_id=%s", state.get('course_id'), state.get('assignment_id'))
         state_dict["next"] = "preview_rubric"
         return state_dict
     
@@ -306,7 +352,7 @@ def user_input_router(state: GradingState) -> Dict[str, Any]:
     
     elif intent == "fetch_submission":
         if not all([state.get('course_id'), state.get('assignment_id'), state.get('student_id')]):
-            print(f"Missing required fields for fetch_submission")
+            logger.debug("Missing required fields for fetch_submission")
             response = generate_response(intent, state, False)
             state_dict["response"] = response
             state_dict["next"] = END
@@ -315,20 +361,34 @@ def user_input_router(state: GradingState) -> Dict[str, Any]:
         return state_dict
     
     # Handle unknown intent or missing information
-    print("Unknown intent or missing information")
+    logger.debug("Unknown intent or missing information")
     response = generate_response("unknown", state, False)
     state_dict["response"] = response
     state_dict["next"] = END
     return state_dict
 
+_graph = None
+
+
+def get_grading_graph():
+    """The compiled grading graph, built on first use and shared afterwards (it holds no session state)."""
+    global _graph
+    if _graph is None:
+        _graph = build_grading_graph()
+    return _graph
+
+
 def build_grading_graph():
+    from langchain_core.runnables import RunnableLambda
+    from langgraph.graph import StateGraph
+
     # Build the LangGraph
     builder = StateGraph(GradingState)
     
     # Create tool nodes with proper input formatting
     def format_tool_input(state: Dict[str, Any], tool_name: str) -> str:
         """Format the input for tools based on the state."""
-        print(f"Formatting input for {tool_name} with state: {state}")
+        logger.debug("Formatting input for %s with state: %s", tool_name, state)
         
         if isinstance(state, GradingState):
             # If state is a GradingState object, use its get method
@@ -361,10 +421,10 @@ def build_grading_graph():
             course_id = get_value("course_id")
             assignment_id = get_value("assignment_id")
             if not course_id or not assignment_id:
-                print("Warning: Missing required fields for preview_rubric")
+                logger.warning("Missing required fields for preview_rubric")
                 return ""
             formatted = f"{course_id},{assignment_id}"
-            print(f"Formatted input: {formatted}")
+            logger.debug("Formatted input: %s", formatted)
             return formatted
             
         elif tool_name == "fetch_submission":
@@ -372,10 +432,10 @@ def build_grading_graph():
             assignment_id = get_value("assignment_id")
             student_id = get_value("student_id")
             if not all([course_id, assignment_id, student_id]):
-                print("Warning: Missing required fields for fetch_submission")
+                logger.warning("Missing required fields for fetch_submission")
                 return ""
             formatted = f"{course_id},{assignment_id},{student_id}"
-            print(f"Formatted input: {formatted}")
+            logger.debug("Formatted input: %s", formatted)
             return formatted
             
         elif tool_name == "grade_submission":
@@ -383,13 +443,32 @@ def build_grading_graph():
             assignment_id = get_value("assignment_id")
             student_id = get_value("student_id")
             if not all([course_id, assignment_id, student_id]):
-                print("Warning: Missing required fields for grade_submission")
+                logger.warning("Missing required fields for grade_submission")
                 return ""
             formatted = f"{course_id},{assignment_id},{student_id}"
-            print(f"Formatted input: {formatted}")
+            logger.debug("Formatted input: %s", formatted)
+            return formatted
+            
+        elif tool_name == "grade_all":
+            course_id = get_value("course_id")
+            assignment_id = get_value("assignment_id")
+            if not course_id or not assignment_id:
+                logger.warning("Missing required fields for grade_all")
+                return ""
+            budget = get_value("budget")
+            formatted = f"{course_id},{assignment_id},{budget if budget is not None else ''}"
+            logger.debug("Formatted input: %s", formatted)
             return formatted
             
-        elif tool_name == "submit_grade":
+        elif tool_name == "post_all":
+            course_id = get_value("course_id")
+            assignment_id = get_value("assignment_id")
+            if not course_id or not assignment_id:
+                logger.warning("Missing required fields for post_all")
+                return ""
+            return f"{course_id},{assignment_id}"
+            
+        elif tool_name in ("submit_grade", "save_exemplar"):
             return ""  # No input needed, uses session state
             
         return ""
@@ -399,11 +478,12 @@ def build_grading_graph():
             try:
                 # Format input based on tool requirements
                 tool_input = format_tool_input(state, name)
-                print(f"Executing {name} with input: {tool_input}")
+                logger.debug("Executing %s with input: %s", name, tool_input)
                 
                 # Execute tool
-                result = tool(tool_input)
-                print(f"Tool result: {result}")
+                with span(f"tool.{name}"):
+                    result = tool(tool_input)
+                logger.debug("Tool result: %d chars", len(str(result)))
                 
                 # Update state with result
                 state_dict = state.to_dict()
@@ -412,7 +492,7 @@ def build_grading_graph():
                 
                 return state_dict
             except Exception as e:
-                print(f"Error in {name}: {str(e)}")
+                logger.warning("Error in %s: %s", name, e)
                 state_dict = state.to_dict()
                 state_dict["error_count"] = state.error_count + 1
                 state_dict["last_error"] = str(e)
@@ -431,6 +511,9 @@ def build_grading_graph():
     builder.add_node("modify_grade", create_tool_node(modify_grade_tool, "modify_grade"))
     builder.add_node("modify_feedback", create_tool_node(modify_feedback_tool, "modify_feedback"))
     builder.add_node("submit_grade", create_tool_node(submit_to_canvas_tool, "submit_grade"))
+    builder.add_node("grade_all", create_tool_node(grade_all_tool, "grade_all"))
+    builder.add_node("post_all", create_tool_node(post_all_grades_tool, "post_all"))
+    builder.add_node("save_exemplar", create_tool_node(save_exemplar_tool, "save_exemplar"))
     
     # Add edges
     builder.set_entry_point("router")
@@ -451,12 +534,15 @@ def build_grading_graph():
             "modify_grade": "modify_grade",
             "modify_feedback": "modify_feedback",
             "submit_grade": "submit_grade",
+            "grade_all": "grade_all",
+            "post_all": "post_all",
+            "save_exemplar": "save_exemplar",
             END: END
         }
     )
     
     # Connect all tool nodes to END
-    for node in ["preview_rubric", "load_rubric", "fetch_submission", "grade_submission", "modify_grade", "modify_feedback", "submit_grade"]:
+    for node in ["preview_rubric", "load_rubric", "fetch_submission", "grade_submission", "modify_grade", "modify_feedback", "submit_grade", "grade_all", "post_all", "save_exemplar"]:
         builder.add_edge(node, END)
     
     return builder.compile()
\ No newline at end of file
@@ -0,0 +1,79 @@
+import streamlit as st
+from api.canvas_api import get_assignment_rubric
+from utils.grade_analytics import compute_analytics
+from utils.grade_store import result_set_version, rubric_hash
+
+st.title("📊 Grade Analytics")
+
+
+@st.cache_data(show_spinner=False)
+def cached_analytics(course_id, assignment_id, version, rubric_key, _rubric, bins, outlier_threshold):
+    """Aggregates for one result-set version; reruns with the same version hit the cache."""
+    return compute_analytics(course_id, assignment_id, _rubric, bins, outlier_threshold)
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def cached_rubric(course_id, assignment_id):
+    rubric = get_assignment_rubric(course_id, assignment_id)
+    return rubric if isinstance(rubric, list) else []
+
+
+col1, col2 = st.columns(2)
+course_id = col1.text_input("Course ID", value=str(st.session_state.get("course_id") or ""))
+assignment_id = col2.text_input("Assignment ID", value=str(st.session_state.get("assignment_id") or ""))
+
+with st.sidebar:
+    bins = st.slider("Histogram bins", 5, 25, 10)
+    outlier_threshold = st.slider("Outlier threshold (robust z)", 2.0, 5.0, 3.5, 0.5)
+
+if not course_id or not assignment_id:
+    st.info("Enter a course and assignment to see its grade distribution.")
+    st.stop()
+
+# The chat's rubric only applies when it was loaded for the assignment shown here
+rubric = None
+if (str(st.session_state.get("course_id")), str(st.session_state.get("assignment_id"))) == (course_id, assignment_id):
+    rubric = st.session_state.get("rubric_criteria")
+rubric = rubric or cached_rubric(course_id, assignment_id)
+version = result_set_version(course_id, assignment_id)
+analytics = cached_analytics(course_id, assignment_id, version, rubric_hash(rubric), rubric, bins, outlier_threshold)
+
+stats = analytics["stats"]
+if not stats:
+    st.warning("No grades stored for this assignment yet. Grade some submissions first.")
+    st.stop()
+
+metrics = st.columns(5)
+metrics[0].metric("Graded", stats["count"])
+metrics[1].metric("Mean", f"{stats['mean']:.1f}")
+metrics[2].metric("Median", f"{stats['median']:.1f}")
+metrics[3].metric("Std dev", f"{stats['std']:.1f}")
+metrics[4].metric("IQR", f"{stats['q1']:.0f}–{stats['q3']:.0f}")
+
+st.subheader("Score distribution")
+st.bar_chart(analytics["distribution"], x="bin", y="count")
+
+st.subheader("Per-criterion performance")
+criteria = analytics["criteria"]
+if criteria.empty:
+    st.caption("No per-criterion scores were found in the stored feedback.")
+else:
+    st.bar_chart(criteria, x="criterion", y="mean_pct")
+    st.dataframe(criteria.round(2), hide_index=True, use_container_width=True)
+
+st.subheader("Rating levels reached")
+levels = analytics["levels"]
+if levels.empty:
+    st.caption("No rubric rating levels available to compare against.")
+else:
+    st.dataframe(levels.round(2), hide_index=True, use_container_width=True)
+
+st.subheader("Outliers")
+outliers = analytics["outliers"]
+if outliers.empty:
+    st.caption("No outliers at this threshold.")
+else:
+    st.dataframe(
+        outliers[["student_id", "student_name", "score", "robust_z", "post_status"]].round(2),
+        hide_index=True, use_container_width=True
+    )
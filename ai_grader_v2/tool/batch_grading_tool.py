@@ -0,0 +1,104 @@
+from langchain_core.tools import tool
+from utils.session_state import session_state
+from utils.batch_grader import BatchGrader, DEFAULT_RUN_BUDGET
+from utils.tracing import logger
+from utils.grade_store import graded_student_ids
+from utils.grade_posting import post_stored_grades
+
+
+@tool
+def grade_all_tool(input_str: str = "") -> str:
+    """Grade all submitted students for an assignment, pausing when the run budget is spent.
+    
+    Args:
+        input_str: Comma-separated course_id, assignment_id and optional budget in USD
+        
+    Returns:
+        str: Summary of the batch run
+    """
+    try:
+        parts = [p.strip() for p in input_str.split(",")] if input_str else []
+        course_id = parts[0] if len(parts) > 0 and parts[0] else session_state.get("course_id")
+        assignment_id = parts[1] if len(parts) > 1 and parts[1] else session_state.get("assignment_id")
+        budget = float(parts[2]) if len(parts) > 2 and parts[2] else DEFAULT_RUN_BUDGET
+        
+        if not course_id or not assignment_id:
+            return "Missing required information. Please provide course_id and assignment_id."
+        
+        rubric = session_state.get("uploaded_rubric") or session_state.get("rubric_criteria")
+        
+        # Students graded earlier (a paused run, another session) are skipped so a rerun resumes
+        already_graded = graded_student_ids(course_id, assignment_id)
+        
+        logger.debug("Batch grading course %s assignment %s with budget %s", course_id, assignment_id, budget)
+        grader = BatchGrader(course_id, assignment_id, rubric=rubric, budget_usd=budget)
+        summary = grader.run(skip_ids=already_graded)
+        
+        response = [
+            f"Batch grading for course {course_id}, assignment {assignment_id}:",
+            f"- Graded this run: {len(summary['results'])} (total graded: {len(already_graded) + len(summary['results'])})",
+            f"- LLM cost this run: ${summary['spent_usd']:.2f}",
+        ]
+        if summary["duplicate_clusters"]:
+            response.append(f"- Near-duplicate clusters: {len(summary['duplicate_clusters'])} (flagged for review)")
+            for cluster in summary["duplicate_clusters"][:10]:
+                response.append(f"  • students {', '.join(cluster['members'])} (similarity ≥ {cluster['similarity']:.2f})")
+        if summary["failed"]:
+            response.append(f"- Failed: {', '.join(summary['failed'])}")
+        if summary["paused"]:
+            response.append(
+                f"\n⏸️ Paused: the run budget of ${budget:.2f} was reached with "
+                f"{len(summary['remaining'])} students remaining. "
+                "To continue, type: 'grade all budget: XX'"
+            )
+        if summary["results"]:
+            response.append("\nScores:")
+            for result in sorted(summary["results"], key=lambda r: r["student_id"]):
+                flag = " ⚠️ review: " + result["review_reason"] if result.get("review_reason") else ""
+                response.append(f"- {result['student_name']} ({result['student_id']}): {result['score']}{flag}")
+        return "\n".join(response)
+        
+    except Exception as e:
+        logger.warning("Error in grade_all_tool: %s", e)
+        return f"Batch grading failed: {str(e)}"
+
+
+@tool
+def post_all_grades_tool(input_str: str = "") -> str:
+    """Post every stored, not yet posted grade of an assignment to Canvas in bulk.
+    
+    Args:
+        input_str: Comma-separated course_id and assignment_id (defaults to the session's)
+        
+    Returns:
+        str: Summary of the posted and failed grades
+    """
+    try:
+        parts = [p.strip() for p in input_str.split(",")] if input_str else []
+        course_id = parts[0] if len(parts) > 0 and parts[0] else session_state.get("course_id")
+        assignment_id = parts[1] if len(parts) > 1 and parts[1] else session_state.get("assignment_id")
+        
+        if not course_id or not assignment_id:
+            return "Missing required information. Please provide course_id and assignment_id."
+        
+        summary = post_stored_grades(course_id, assignment_id)
+        if not any((summary["posted"], summary["failed"], summary["queued"])):
+            return f"No unposted grades for course {course_id}, assignment {assignment_id}."
+        
+        response = [
+            f"Posted grades for course {course_id}, assignment {assignment_id}:",
+            f"- Posted: {len(summary['posted'])} ({summary['with_rubric']} with rubric scores)",
+        ]
+        if summary["duplicates"]:
+            response.append(f"- Already queued or posted with the same content: {summary['duplicates']} (not sent again)")
+        if summary["queued"]:
+            response.append(f"- Still queued: {len(summary['queued'])} (retried in the background)")
+        if summary["failed"]:
+            response.append(f"- Failed: {len(summary['failed'])}")
+            for student_id, error in sorted(summary["failed"].items())[:10]:
+                response.append(f"  • {student_id}: {error}")
+        return "\n".join(response)
+        
+    except Exception as e:
+        logger.warning("Error in post_all_grades_tool: %s", e)
+        return f"Posting grades failed: {str(e)}"
@@ -1,18 +1,18 @@
 from langchain_core.tools import tool
 from api.canvas_api import submit_grade_and_feedback
-import streamlit as st
+from utils.session_state import session_state
 
 @tool
 def submit_feedback_tool(_: str) -> str:
     """Submit the feedback and score to Canvas."""
     try:
-        result = st.session_state.get("last_grade_result")
+        result = session_state.get("last_grade_result")
         if not result:
             return "No feedback to submit."
 
-        course_id = st.session_state.get("course_id")
-        assignment_id = st.session_state.get("assignment_id")
-        student_id = st.session_state.get("selected_student_id")
+        course_id = session_state.get("course_id")
+        assignment_id = session_state.get("assignment_id")
+        student_id = session_state.get("selected_student_id")
 
         resp = submit_grade_and_feedback(
             course_id, assignment_id, student_id,
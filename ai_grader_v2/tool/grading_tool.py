@@ -1,10 +1,19 @@
 from langchain_core.tools import tool
-import streamlit as st
+from utils.session_state import session_state
 from utils.rubric_parser import parse_rubric
-from utils.llm_utils import strict_grading_llm
-from api.canvas_api import get_assignment_rubric, get_submissions, submit_grade_and_feedback
+from utils.grading_cache import grade_with_cache
 import json
 from functools import wraps
+from utils.tracing import logger
+from utils.usage_store import usage_context
+from utils.prefetch import get_prepared, cached_rubric, prefetch_assignment
+from utils.pregrader import get_pregrader, stored_pregrade, PREGRADE_WAIT_SECONDS
+from utils.exemplar_store import add_exemplar, exemplars_for
+from utils.grade_posting import canvas_rubric, grade_payload
+from utils.grade_outbox import get_flusher, OUTBOX_SENT, OUTBOX_FAILED
+from utils.grade_store import (
+    save_grade, update_grade, get_grade, rubric_hash
+)
 
 def _ensure_state_persistence(func):
     """Decorator to ensure state is preserved between tool calls."""
@@ -22,27 +31,39 @@ def _ensure_state_persistence(func):
                 assignment_id = assignment_id.strip()
                 student_id = student_id.strip()
                 # Store in session state
-                st.session_state.course_id = course_id
-                st.session_state.assignment_id = assignment_id
-                st.session_state.student_id = student_id
+                session_state.course_id = course_id
+                session_state.assignment_id = assignment_id
+                session_state.student_id = student_id
             except ValueError:
                 pass
         
         # Always try to get from session state if not in input
         if not all([course_id, assignment_id, student_id]):
-            course_id = st.session_state.get("course_id")
-            assignment_id = st.session_state.get("assignment_id")
-            student_id = st.session_state.get("student_id")
+            course_id = session_state.get("course_id")
+            assignment_id = session_state.get("assignment_id")
+            student_id = session_state.get("student_id")
         
         # Store the IDs back in session state
         if all([course_id, assignment_id, student_id]):
-            st.session_state.course_id = course_id
-            st.session_state.assignment_id = assignment_id
-            st.session_state.student_id = student_id
+            session_state.course_id = course_id
+            session_state.assignment_id = assignment_id
+            session_state.student_id = student_id
         
         return func(input_str)
     return wrapper
 
+def _store_edit(score=None, feedback=None):
+    """Mirror an instructor edit of the current grade into the grade store."""
+    course_id = session_state.get("course_id")
+    assignment_id = session_state.get("assignment_id")
+    student_id = session_state.get("student_id")
+    if not all([course_id, assignment_id, student_id]):
+        return
+    try:
+        update_grade(course_id, assignment_id, student_id, score=score, feedback=feedback)
+    except Exception as e:
+        logger.warning("Failed to store grade edit: %s", e)
+
 @tool
 def grade_selected_tool(input_str: str = "") -> str:
     """Grade the selected submission using the loaded rubric.
@@ -84,74 +105,69 @@ def grade_selected_tool(input_str: str = "") -> str:
         
         # If any ID is missing, try session state
         if not all([course_id, assignment_id, student_id]):
-            course_id = st.session_state.get("course_id") or course_id
-            assignment_id = st.session_state.get("assignment_id") or assignment_id
-            student_id = st.session_state.get("student_id") or student_id
+            course_id = session_state.get("course_id") or course_id
+            assignment_id = session_state.get("assignment_id") or assignment_id
+            student_id = session_state.get("student_id") or student_id
         
         # Store valid IDs in session state
-        if course_id: st.session_state.course_id = course_id
-        if assignment_id: st.session_state.assignment_id = assignment_id
-        if student_id: st.session_state.student_id = student_id
+        if course_id: session_state.course_id = course_id
+        if assignment_id: session_state.assignment_id = assignment_id
+        if student_id: session_state.student_id = student_id
         
-        print(f"Processing with IDs - course: {course_id}, assignment: {assignment_id}, student: {student_id}")
+        logger.debug("Processing with IDs - course: %s, assignment: %s, student: %s", course_id, assignment_id, student_id)
         
         if not all([course_id, assignment_id, student_id]):
             return "Missing required information. Please provide course_id, assignment_id, and student_id."
         
         # Get or fetch submission content
-        submission_body = st.session_state.get("selected_submission_body")
+        submission_body = session_state.get("selected_submission_body")
         if not submission_body:
-            print(f"Fetching submission for student {student_id}")
-            # Fetch submission
-            subs = get_submissions(course_id, assignment_id)
-            submission_found = False
-            for sub in subs:
-                if str(sub["user_id"]) == student_id:
-                    submission_body = sub.get("body", "")
-                    st.session_state.selected_submission_body = submission_body
-                    st.session_state.selected_student_name = sub.get("user", {}).get("name", "Unknown")
-                    submission_found = True
-                    break
-            
-            if not submission_found:
+            logger.debug("Fetching submission for student %s", student_id)
+            # Usually already prepared in the background by the prefetcher
+            prepared = get_prepared(course_id, assignment_id, student_id)
+            if prepared is None:
                 return "No submission found for the specified student."
+            submission_body = prepared["raw_body"] or prepared["text"]
+            session_state.selected_submission_body = submission_body
+            session_state.formatted_submission_body = prepared["text"]
+            session_state.selected_student_name = prepared["student_name"]
 
         # Get formatted submission for better readability
-        formatted_submission = st.session_state.get("formatted_submission_body", submission_body)
+        formatted_submission = session_state.get("formatted_submission_body", submission_body)
         
         # Try to get rubric from different sources
         rubric = None
         
         # 1. First check if we have an uploaded rubric
-        if "uploaded_rubric" in st.session_state:
-            print("Attempting to use uploaded rubric")
+        if "uploaded_rubric" in session_state:
+            logger.debug("Attempting to use uploaded rubric")
             try:
-                uploaded = st.session_state.uploaded_rubric
+                uploaded = session_state.uploaded_rubric
                 if isinstance(uploaded, str):
                     rubric = json.loads(uploaded)
                 else:
                     rubric = uploaded
-                print("Successfully loaded uploaded rubric")
+                logger.debug("Successfully loaded uploaded rubric")
             except json.JSONDecodeError:
-                print("Failed to parse uploaded rubric")
+                logger.warning("Failed to parse uploaded rubric")
                 pass
 
         # 2. If not, check if we have a rubric in session state
-        if not rubric and "rubric_criteria" in st.session_state:
-            print("Using rubric from session state")
-            rubric = st.session_state.rubric_criteria
+        if not rubric and "rubric_criteria" in session_state:
+            logger.debug("Using rubric from session state")
+            rubric = session_state.rubric_criteria
         
         # 3. If still not found, try to fetch from Canvas
         if not rubric:
-            print(f"Fetching rubric from Canvas for course {course_id}, assignment {assignment_id}")
-            rubric = get_assignment_rubric(course_id, assignment_id)
-            if rubric:
-                print("Successfully fetched rubric from Canvas")
-                st.session_state.rubric_criteria = rubric
+            logger.debug("Fetching rubric from Canvas for course %s, assignment %s", course_id, assignment_id)
+            rubric = cached_rubric(course_id, assignment_id)
+            if rubric and not isinstance(rubric, str):
+                logger.debug("Successfully fetched rubric from Canvas")
+                session_state.rubric_criteria = rubric
         
         # 4. If still no rubric, use default basic rubric
         if not rubric:
-            print("No rubric found, proceeding with basic grading")
+            logger.debug("No rubric found, proceeding with basic grading")
             rubric = [{
                 "description": "Overall Assessment",
                 "points": 100,
@@ -167,13 +183,33 @@ def grade_selected_tool(input_str: str = "") -> str:
         # Parse rubric into a clean format
         parsed_criteria = parse_rubric(rubric)
         
-        # Grade the submission
-        print("Starting grading process")
-        result = strict_grading_llm(formatted_submission, parsed_criteria)
-        print("Grading completed")
+        # Start warming the next students while this one is with the LLM
+        prefetch_assignment(course_id, assignment_id, after_student=student_id)
+        
+        # Serve a background pre-grade made with this rubric; waiting on it moves the student to the front
+        pregrader = get_pregrader()
+        if pregrader.rubric_hash_for(course_id, assignment_id) == rubric_hash(rubric):
+            pregrader.request(course_id, assignment_id, student_id, timeout=PREGRADE_WAIT_SECONDS)
+        result = stored_pregrade(course_id, assignment_id, student_id, rubric_hash(rubric))
+        if result:
+            logger.debug("Serving pre-graded result for student %s", student_id)
+        
+        if result is None:
+            # Calibrate against instructor-approved grades of similar submissions
+            try:
+                exemplars = exemplars_for(course_id, assignment_id, formatted_submission, exclude_student=student_id)
+            except Exception as e:
+                logger.warning("Exemplar selection failed: %s", e)
+                exemplars = ""
+
+            # Grade the submission, attributing its LLM usage to the student actually graded
+            logger.debug("Starting grading process")
+            with usage_context(course_id=course_id, assignment_id=assignment_id, student_id=student_id):
+                result = grade_with_cache(formatted_submission, parsed_criteria, exemplars=exemplars)
+            logger.debug("Grading completed")
         
         # Store the result for later use
-        st.session_state.last_grade_result = result
+        session_state.last_grade_result = result
         
         # Format the grading result
         if isinstance(result, dict):
@@ -190,23 +226,47 @@ def grade_selected_tool(input_str: str = "") -> str:
             except:
                 score = result.get("score", 0)
             
-            student_name = st.session_state.get("selected_student_name", "Unknown Student")
+            student_name = session_state.get("selected_student_name", "Unknown Student")
             
             # Store current grade and feedback for later use
-            st.session_state.current_grade = score
-            st.session_state.current_feedback = feedback
+            session_state.current_grade = score
+            session_state.current_feedback = feedback
+            
+            # Persist so the grade can be queried and re-displayed without re-grading
+            try:
+                if not result.get("pregraded"):
+                    save_grade(
+                        course_id, assignment_id, student_id, score, feedback,
+                        student_name=student_name,
+                        model=result.get("model"),
+                        rubric_hash=rubric_hash(rubric),
+                        source="cache" if result.get("cache_hit") else "chat",
+                        review_reason=result.get("review_reason")
+                    )
+            except Exception as e:
+                logger.warning("Failed to store grade: %s", e)
             
             # Create response with next steps
             response = [
                 f"Grade for {student_name}:",
                 f"Score: {score}/100",
+            ]
+            if result.get("pregraded"):
+                response.append("(Pre-graded in the background.)")
+            if result.get("review_reason"):
+                response.append(f"⚠️ Please review: {result['review_reason']}.")
+            if result.get("samples"):
+                response.append(f"Consistency: median of {result['samples']} samples, "
+                                f"total varied by ±{result['score_stdev']:.1f} points.")
+            response += [
                 "\nFeedback:",
                 feedback,
                 "\nNext Steps:",
                 "1. To modify the grade, type: 'modify grade score: XX'",
                 "2. To modify feedback, type: 'modify grade feedback: your new feedback'",
                 "3. To submit this grade to Canvas, type: 'submit grade to canvas'",
-                "4. To grade another submission, provide a new student ID"
+                "4. To save this grade as a calibration exemplar, type: 'save as exemplar'",
+                "5. To grade another submission, provide a new student ID"
             ]
             
             return "\n".join(response)
@@ -214,7 +274,7 @@ def grade_selected_tool(input_str: str = "") -> str:
             return str(result)
             
     except Exception as e:
-        print(f"Error in grade_selected_tool: {str(e)}")
+        logger.warning("Error in grade_selected_tool: %s", e)
         return f"Grading failed: {str(e)}"
 
 @tool
@@ -228,9 +288,9 @@ def modify_grade_tool(input_str: str = "") -> str:
         str: Confirmation message of the score modification
     """
     try:
-        current_grade = st.session_state.get("current_grade")
-        current_feedback = st.session_state.get("current_feedback", "")
-        student_name = st.session_state.get("selected_student_name", "Unknown Student")
+        current_grade = session_state.get("current_grade")
+        current_feedback = session_state.get("current_feedback", "")
+        student_name = session_state.get("selected_student_name", "Unknown Student")
         
         if not input_str:
             return (
@@ -242,7 +302,7 @@ def modify_grade_tool(input_str: str = "") -> str:
             try:
                 new_score = float(input_str.lower().split("score:")[1].strip())
                 if 0 <= new_score <= 100:
-                    st.session_state.current_grade = new_score
+                    session_state.current_grade = new_score
                     
                     # Update the score in the feedback if it exists
                     if current_feedback:
@@ -252,15 +312,17 @@ def modify_grade_tool(input_str: str = "") -> str:
                                 feedback_lines[0] = f"Overall Score: {new_score}/100"
                             else:
                                 feedback_lines.insert(0, f"Overall Score: {new_score}/100")
-                            st.session_state.current_feedback = '\n'.join(feedback_lines)
+                            session_state.current_feedback = '\n'.join(feedback_lines)
                     else:
-                        st.session_state.current_feedback = f"Overall Score: {new_score}/100"
+                        session_state.current_feedback = f"Overall Score: {new_score}/100"
+                    
+                    _store_edit(score=new_score, feedback=session_state.current_feedback)
                     
                     # Show both score update and current feedback
                     response = [
                         f"Score updated to {new_score}/100 for {student_name}",
                         "\nCurrent feedback:",
-                        st.session_state.current_feedback,
+                        session_state.current_feedback,
                         "\nOptions:",
                         "- To modify feedback: 'feedback: your new feedback'",
                         "- To submit to Canvas: 'submit grade to canvas'"
@@ -287,8 +349,8 @@ def modify_feedback_tool(input_str: str = "") -> str:
         str: Confirmation message of the feedback modification
     """
     try:
-        current_grade = st.session_state.get("current_grade")
-        student_name = st.session_state.get("selected_student_name", "Unknown Student")
+        current_grade = session_state.get("current_grade")
+        student_name = session_state.get("selected_student_name", "Unknown Student")
         
         if not input_str:
             return "Please provide the new feedback text."
@@ -300,7 +362,8 @@ def modify_feedback_tool(input_str: str = "") -> str:
             new_feedback = input_str
         
         # Update the feedback
-        st.session_state.current_feedback = new_feedback
+        session_state.current_feedback = new_feedback
+        _store_edit(feedback=new_feedback)
         
         # Show the updated feedback
         response = [
@@ -326,9 +389,22 @@ def show_feedback_tool(input_str: str = "") -> str:
         str: Current feedback and grade
     """
     try:
-        current_grade = st.session_state.get("current_grade")
-        current_feedback = st.session_state.get("current_feedback")
-        student_name = st.session_state.get("selected_student_name", "Unknown Student")
+        current_grade = session_state.get("current_grade")
+        current_feedback = session_state.get("current_feedback")
+        student_name = session_state.get("selected_student_name", "Unknown Student")
+        
+        # Fall back to the grade store (e.g. graded in a batch run or an earlier session)
+        if current_grade is None and not current_feedback:
+            course_id = session_state.get("course_id")
+            assignment_id = session_state.get("assignment_id")
+            student_id = session_state.get("student_id")
+            stored = get_grade(course_id, assignment_id, student_id, with_criteria=False) if all([course_id, assignment_id, student_id]) else None
+            if stored:
+                current_grade = stored["score"]
+                current_feedback = stored["feedback"]
+                student_name = stored.get("student_name") or student_name
+                session_state.current_grade = current_grade
+                session_state.current_feedback = current_feedback
         
         if current_grade is None and not current_feedback:
             return "No feedback available. Please grade a submission first."
@@ -349,6 +425,38 @@ def show_feedback_tool(input_str: str = "") -> str:
     except Exception as e:
         return f"Error showing feedback: {str(e)}"
 
+@tool
+def save_exemplar_tool(input_str: str = "") -> str:
+    """Save the current graded submission as an instructor-approved calibration exemplar.
+    
+    Args:
+        input_str: Not used
+        
+    Returns:
+        str: Confirmation message or error
+    """
+    try:
+        course_id = session_state.get("course_id")
+        assignment_id = session_state.get("assignment_id")
+        student_id = session_state.get("student_id")
+        if not all([course_id, assignment_id, student_id]):
+            return "Please select a course, assignment and student first."
+        
+        submission = session_state.get("formatted_submission_body") or session_state.get("selected_submission_body")
+        feedback = session_state.get("current_feedback")
+        score = session_state.get("current_grade")
+        if not submission or not feedback:
+            return "No graded submission to save. Please grade (and review) a submission first."
+        
+        add_exemplar(course_id, assignment_id, student_id, submission, feedback, score)
+        student_name = session_state.get("selected_student_name", "Unknown Student")
+        return (f"✅ Saved the grade for {student_name} ({score}/100) as a calibration exemplar. "
+                "Similar submissions in this assignment will be graded with it as a reference.")
+        
+    except Exception as e:
+        logger.warning("Error in save_exemplar_tool: %s", e)
+        return f"Error saving exemplar: {str(e)}"
+
 @tool
 def submit_to_canvas_tool(input_str: str = "") -> str:
     """Submit the current grade and feedback to Canvas.
@@ -360,11 +468,11 @@ def submit_to_canvas_tool(input_str: str = "") -> str:
         str: Confirmation message of the submission to Canvas
     """
     try:
-        course_id = st.session_state.get("course_id")
-        assignment_id = st.session_state.get("assignment_id")
-        student_id = st.session_state.get("student_id")
-        current_grade = st.session_state.get("current_grade")
-        current_feedback = st.session_state.get("current_feedback")
+        course_id = session_state.get("course_id")
+        assignment_id = session_state.get("assignment_id")
+        student_id = session_state.get("student_id")
+        current_grade = session_state.get("current_grade")
+        current_feedback = session_state.get("current_feedback")
         
         if not all([course_id, assignment_id, student_id]):
             return "Missing required information. Please ensure a submission is selected first."
@@ -373,17 +481,27 @@ def submit_to_canvas_tool(input_str: str = "") -> str:
             return "No grade to submit. Please grade the submission first."
             
         # Print debug info
-        print(f"Submitting to Canvas - Grade: {current_grade}, Feedback: {current_feedback}")
-        
-        result = submit_grade_and_feedback(
-            user_id=student_id,
-            course_id=course_id,
-            assignment_id=assignment_id,
-            grade=current_grade,
-            feedback=current_feedback
-        )
-        
-        return result
+        logger.debug("Submitting to Canvas - Grade: %s, Feedback: %d chars", current_grade, len(current_feedback or ""))
+        
+        # Criterion scores go into Canvas's rubric view; the comment keeps only the summary
+        payload = grade_payload(student_id, current_grade, current_feedback,
+                                canvas_rubric(course_id, assignment_id))
+        # Recorded in the outbox first: resubmitting the same grade and feedback is not posted twice
+        flusher = get_flusher()
+        entry = flusher.submit(course_id, assignment_id, [payload])[0]
+        if entry["duplicate"] and entry["status"] == OUTBOX_SENT:
+            return f"✅ This grade and feedback were already submitted for user {student_id}; nothing was re-sent."
+        entry = flusher.wait([entry["id"]])[0]
+        
+        if entry["status"] == OUTBOX_SENT:
+            return f"✅ Submitted feedback for user {student_id}."
+        if entry["status"] == OUTBOX_FAILED:
+            return f"❌ Could not submit to Canvas after {entry['attempts']} attempts: {entry['last_error']}"
+        if entry["progress_url"]:
+            return "⏳ Canvas accepted the grade and is still applying it; it will be confirmed in the background."
+        if entry["last_error"]:
+            return f"⏳ Canvas post failed ({entry['last_error']}); it will be retried in the background."
+        return "⏳ The grade is queued for Canvas and will be posted in the background."
         
     except Exception as e:
         return f"Error submitting to Canvas: {str(e)}"
\ No newline at end of file
@@ -1,37 +1,49 @@
 from langchain_core.tools import tool
 from utils.rubric_parser import parse_rubric
-import streamlit as st
-from api.canvas_api import get_assignment_rubric
+from utils.session_state import session_state
+from utils.prefetch import cached_rubric, prefetch_assignment
+from utils.tracing import logger
+from utils.pregrader import get_pregrader, PREGRADE_ENABLED
 
 @tool
 def preview_rubric_tool(input_str: str) -> str:
     """Preview the rubric for a given course and assignment."""
     try:
-        print(f"Preview rubric input: {input_str}")
+        logger.debug("Preview rubric input: %s", input_str)
         course_id, assignment_id = input_str.strip().split(",")
         course_id = course_id.strip()
         assignment_id = assignment_id.strip()
-        print(f"Fetching rubric for course_id={course_id}, assignment_id={assignment_id}")
+        logger.debug("Fetching rubric for course_id=%s, assignment_id=%s", course_id, assignment_id)
         
         # Update Streamlit state first
-        st.session_state.course_id = course_id
-        st.session_state.assignment_id = assignment_id
+        session_state.course_id = course_id
+        session_state.assignment_id = assignment_id
         
-        # Then fetch the rubric
-        rubric = get_assignment_rubric(course_id, assignment_id)
+        # Start fetching submissions and the first students alongside the rubric
+        prefetch_assignment(course_id, assignment_id)
+        rubric = cached_rubric(course_id, assignment_id)
+        if isinstance(rubric, str):
+            return rubric  # Canvas authentication error message
         if rubric:
-            st.session_state.rubric_criteria = rubric
+            session_state.rubric_criteria = rubric
             # Format the rubric using parse_rubric
             formatted_rubric = parse_rubric(rubric)
-            return f"Rubric Preview for Course {course_id}, Assignment {assignment_id}:\n\n{formatted_rubric}"
+            response = f"Rubric Preview for Course {course_id}, Assignment {assignment_id}:\n\n{formatted_rubric}"
+            
+            # Opt-in: grade everyone in the background so later grade requests are served from the store
+            if session_state.get("pregrade_enabled", PREGRADE_ENABLED):
+                queued = get_pregrader().start(course_id, assignment_id, rubric)
+                if queued:
+                    response += f"\n\n⏳ Pre-grading {queued} submissions in the background."
+            return response
         return "No rubric found."
     except Exception as e:
-        print(f"Error in preview_rubric_tool: {str(e)}")
+        logger.warning("Error in preview_rubric_tool: %s", e)
         return f"Error previewing rubric: {str(e)}"
 
 @tool
 def load_rubric_tool(_: str) -> str:
     """Load the rubric from Streamlit session state into memory for grading."""
-    if "rubric_criteria" in st.session_state:
+    if "rubric_criteria" in session_state:
         return "Rubric loaded successfully for grading."
     return "No rubric found. Please preview the rubric first."
\ No newline at end of file
@@ -0,0 +1,257 @@
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from api.canvas_api import get_submissions, get_assignment_rubric
+from utils.html_text import clean_html_text
+from utils.grading_cache import grade_with_cache
+from utils.rubric_parser import parse_rubric
+from utils.tracing import logger, span
+from utils.usage_store import Budget, usage_context
+from utils.grade_store import save_grades_bulk, rubric_hash
+from utils.similarity import find_duplicate_clusters
+from utils.submission_index import SubmissionIndex
+from utils.exemplar_store import get_index, format_exemplars
+
+# Default per-run spending limit for batch grading (USD); unset means unlimited
+DEFAULT_RUN_BUDGET = float(os.getenv("GRADING_RUN_BUDGET_USD", "0")) or None
+
+# Near-duplicate handling: "off", "flag" (grade all, mark clusters) or "reuse" (grade one per cluster)
+DEFAULT_DUPLICATE_MODE = os.getenv("BATCH_DUPLICATE_MODE", "flag")
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.85"))
+
+DEFAULT_RUBRIC = [{
+    "description": "Overall Assessment",
+    "points": 100,
+    "long_description": "Evaluate the submission based on:\n- Content quality and depth\n- Organization and clarity\n- Evidence and support\n- Writing mechanics and style",
+    "ratings": [
+        {"description": "Excellent", "points": 100},
+        {"description": "Good", "points": 85},
+        {"description": "Fair", "points": 70},
+        {"description": "Poor", "points": 55}
+    ]
+}]
+
+
+def resolve_rubric(course_id, assignment_id, rubric=None):
+    """Return the rubric to grade with: the given one, Canvas's, or the default."""
+    if not rubric:
+        rubric = get_assignment_rubric(course_id, assignment_id)
+    if not rubric or isinstance(rubric, str):
+        # Canvas returns an error string on auth failures
+        rubric = DEFAULT_RUBRIC
+    return rubric
+
+
+def body_text(body):
+    """Cleaned text of a submission body (the raw body if it has no HTML structure)."""
+    return clean_html_text(body) or body
+
+
+class BatchGrader:
+    """Grade many submissions of one assignment concurrently under a spending budget.
+
+    When the run's LLM spend reaches ``budget_usd`` no new students are started;
+    in-flight ones finish and the rest are reported as remaining so the run can
+    be resumed later with a larger budget.
+    """
+
+    def __init__(self, course_id, assignment_id, rubric=None, budget_usd=DEFAULT_RUN_BUDGET, max_workers=4,
+                 duplicate_mode=DEFAULT_DUPLICATE_MODE, duplicate_threshold=DUPLICATE_THRESHOLD):
+        self.course_id = str(course_id)
+        self.assignment_id = str(assignment_id)
+        self.rubric = rubric
+        self.budget = Budget(budget_usd)
+        self.max_workers = max_workers
+        self.duplicate_mode = duplicate_mode
+        self.duplicate_threshold = duplicate_threshold
+
+    def _grade_one(self, record, text, rubric_text, exemplars=""):
+        student_id = record.user_id
+        with usage_context(course_id=self.course_id, assignment_id=self.assignment_id,
+                           student_id=student_id, budget=self.budget):
+            with span("batch.grade_student", student_id=student_id):
+                result = grade_with_cache(text, rubric_text, exemplars=exemplars)
+        result["student_id"] = student_id
+        result["student_name"] = record.user_name
+        if result.get("cache_hit"):
+            result["source"] = "cache"
+        return result
+
+    def _prescreen(self, texts):
+        """Find near-duplicate clusters among the cleaned submission texts."""
+        if self.duplicate_mode == "off" or len(texts) < 2:
+            return []
+        with span("batch.duplicate_prescreen", submissions=len(texts)) as s:
+            clusters = find_duplicate_clusters(texts, threshold=self.duplicate_threshold)
+            s.set("duplicate.clusters", len(clusters))
+        return clusters
+
+    def _select_exemplars(self, texts):
+        """Calibration block per student, embedding every submission in one pass."""
+        try:
+            index = get_index(self.course_id, self.assignment_id)
+            if not len(index):
+                return {}
+            with span("batch.select_exemplars", submissions=len(texts), exemplars=len(index)):
+                ids = list(texts)
+                selections = index.select_for_texts([texts[i] for i in ids])
+                return {
+                    student_id: format_exemplars([e for e in chosen if e["student_id"] != student_id])
+                    for student_id, chosen in zip(ids, selections)
+                }
+        except Exception as e:
+            logger.warning("Exemplar selection failed: %s", e)
+            return {}
+
+    def run(self, student_ids=None, skip_ids=(), on_result=None):
+        """Grade the selected students.
+
+        Args:
+            student_ids (list): Students to grade; defaults to every submitted student
+            skip_ids (iterable): Students already graded (e.g. by a paused earlier run)
+            on_result (callable): Called with each result dict as soon as it is ready
+
+        Returns:
+            dict: results, failed (student_id -> error), remaining (ids not started),
+            paused (bool), spent_usd, duplicate_clusters
+        """
+        rubric = resolve_rubric(self.course_id, self.assignment_id, self.rubric)
+        rubric_text = parse_rubric(rubric)
+        index = SubmissionIndex.from_submissions(
+            self.course_id, self.assignment_id, get_submissions(self.course_id, self.assignment_id)
+        )
+        wanted = {str(s) for s in student_ids} if student_ids else None
+        skip = {str(s) for s in skip_ids}
+        queue = [
+            record for record in index.submitted()
+            if (wanted is None or record.user_id in wanted) and record.user_id not in skip
+        ]
+
+        # Pre-grading stage: clean every body once, then screen for near-duplicates
+        texts = {record.user_id: body_text(index.body(record.user_id)) for record in queue}
+        clusters = self._prescreen(texts)
+        duplicate_of = {}
+        for cluster in clusters:
+            representative = cluster["members"][0]
+            for member in cluster["members"][1:]:
+                duplicate_of[member] = (representative, cluster["similarity"])
+        if self.duplicate_mode == "reuse":
+            # Only representatives go to the LLM; their grades are copied after the run
+            to_grade = [record for record in queue if record.user_id not in duplicate_of]
+        else:
+            to_grade = queue
+        exemplars = self._select_exemplars({record.user_id: texts[record.user_id] for record in to_grade})
+
+        results, failed = [], {}
+        in_flight = {}
+        with span("batch.run", course_id=self.course_id, assignment_id=self.assignment_id, students=len(to_grade)) as run_span, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            position = 0
+            while position < len(to_grade) or in_flight:
+                # Keep the pool full unless the budget is spent
+                while position < len(to_grade) and len(in_flight) < self.max_workers and not self.budget.exceeded:
+                    record = to_grade[position]
+                    ctx = contextvars.copy_context()
+                    student_id = record.user_id
+                    future = pool.submit(ctx.run, self._grade_one, record, texts[student_id], rubric_text,
+                                         exemplars.get(student_id, ""))
+                    in_flight[future] = student_id
+                    position += 1
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    student_id = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                        results.append(result)
+                        if on_result:
+                            on_result(result)
+                    except Exception as e:
+                        logger.warning("Batch grading failed for student %s: %s", student_id, e)
+                        failed[student_id] = str(e)
+                        if self.duplicate_mode == "reuse":
+                            substitute = self._next_representative(student_id, duplicate_of)
+                            if substitute is not None:
+                                to_grade.append(index.get(substitute))
+                                exemplars.update(self._select_exemplars({substitute: texts[substitute]}))
+
+            remaining = [record.user_id for record in to_grade[position:]]
+            if self.duplicate_mode == "reuse":
+                # Duplicates of students never started are left for the resumed run as well
+                not_started = set(remaining)
+                remaining += [s for s, (representative, _) in duplicate_of.items() if representative in not_started]
+
+            if duplicate_of:
+                results = self._apply_duplicates(results, duplicate_of, index)
+            paused = bool(remaining) and self.budget.exceeded
+            run_span.set("batch.paused", paused)
+            run_span.set("batch.spent_usd", round(self.budget.spent_usd, 4))
+
+        # One transaction for the whole run instead of a write per student
+        rubric_id = rubric_hash(rubric)
+        try:
+            save_grades_bulk([
+                {
+                    "course_id": self.course_id,
+                    "assignment_id": self.assignment_id,
+                    "student_id": r["student_id"],
+                    "student_name": r["student_name"],
+                    "score": r["score"],
+                    "feedback": r["feedback"],
+                    "model": r.get("model"),
+                    "rubric_hash": rubric_id,
+                    "source": r.get("source", "batch"),
+                    "review_reason": r.get("review_reason"),
+                }
+                for r in results
+            ])
+        except Exception as e:
+            logger.warning("Failed to store batch grades: %s", e)
+
+        if paused:
+            logger.warning("Batch paused: budget $%.2f reached with %d students remaining",
+                           self.budget.limit_usd, len(remaining))
+        return {
+            "results": results,
+            "failed": failed,
+            "remaining": remaining,
+            "paused": paused,
+            "spent_usd": self.budget.spent_usd,
+            "duplicate_clusters": clusters,
+        }
+
+    @staticmethod
+    def _next_representative(failed_id, duplicate_of):
+        """After a representative failed, make the next member of its cluster the one to grade."""
+        members = [s for s, (representative, _) in duplicate_of.items() if representative == failed_id]
+        if not members:
+            return None
+        substitute = members[0]
+        del duplicate_of[substitute]
+        for member in members[1:]:
+            duplicate_of[member] = (substitute, duplicate_of[member][1])
+        return substitute
+
+    def _apply_duplicates(self, results, duplicate_of, index):
+        """Flag graded duplicates, and in reuse mode copy the representative's grade to them."""
+        graded = {r["student_id"]: r for r in results}
+        for student_id, (representative, similarity) in duplicate_of.items():
+            reason = f"near-duplicate of student {representative} (similarity {similarity:.2f})"
+            if student_id in graded:
+                graded[student_id]["review_reason"] = reason
+                graded[student_id]["duplicate_of"] = representative
+            elif self.duplicate_mode == "reuse" and representative in graded:
+                source = graded[representative]
+                reused = dict(source)
+                reused.update(
+                    student_id=student_id,
+                    student_name=index.get(student_id).user_name,
+                    duplicate_of=representative,
+                    source="duplicate_reuse",
+                    review_reason=f"grade reused from {reason}",
+                )
+                results.append(reused)
+                source.setdefault("review_reason", "representative of a near-duplicate cluster")
+        return results
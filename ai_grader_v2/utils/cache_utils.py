@@ -0,0 +1,19 @@
+import hashlib
+import os
+
+# Root directory for local caches and stores; shared across sessions and users
+CACHE_DIR = os.getenv("GRADER_CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".grader_cache"))
+
+
+def cache_path(*parts):
+    """Return a path under the cache directory, creating parent folders as needed."""
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def content_hash(data) -> str:
+    """SHA-256 hex digest of bytes or text."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
@@ -0,0 +1,162 @@
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from utils.cache_utils import cache_path
+from utils.similarity import embed_texts, embedding_model_name
+
+DB_PATH = cache_path("exemplars.sqlite")
+
+# Exemplars per grading prompt and the prompt tokens they may use
+EXEMPLAR_K = int(os.getenv("EXEMPLAR_K", "3"))
+EXEMPLAR_TOKEN_BUDGET = int(os.getenv("EXEMPLAR_TOKEN_BUDGET", "3000"))
+# Exemplar submissions are truncated to this many characters in the prompt
+EXEMPLAR_MAX_CHARS = 4000
+
+_local = threading.local()
+_lock = threading.Lock()
+# (course_id, assignment_id) -> ExemplarIndex, invalidated on writes
+_indexes = {}
+
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS exemplars (
+                id INTEGER PRIMARY KEY,
+                course_id TEXT NOT NULL,
+                assignment_id TEXT NOT NULL,
+                student_id TEXT NOT NULL,
+                submission TEXT NOT NULL,
+                feedback TEXT NOT NULL,
+                score REAL,
+                embedding BLOB NOT NULL,
+                embedding_model TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                UNIQUE (course_id, assignment_id, student_id)
+            )
+        """)
+        _local.conn = conn
+    return conn
+
+
+def estimate_tokens(text):
+    return len(text or "") // 4 + 1
+
+
+def add_exemplar(course_id, assignment_id, student_id, submission, feedback, score):
+    """Save an instructor-approved grade as a calibration exemplar (embedding computed once here)."""
+    vector = embed_texts([submission])[0]
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO exemplars (course_id, assignment_id, student_id, submission, feedback, score, "
+            "embedding, embedding_model, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (str(course_id), str(assignment_id), str(student_id), submission, feedback, score,
+             vector.astype(np.float32).tobytes(), embedding_model_name(), time.time())
+        )
+    with _lock:
+        _indexes.pop((str(course_id), str(assignment_id)), None)
+
+
+class ExemplarIndex:
+    """In-memory matrix of an assignment's exemplar embeddings for fast top-k selection."""
+
+    def __init__(self, course_id, assignment_id):
+        conn = _connect()
+        rows = conn.execute(
+            "SELECT id, student_id, submission, feedback, score, embedding, embedding_model "
+            "FROM exemplars WHERE course_id = ? AND assignment_id = ? ORDER BY id",
+            (str(course_id), str(assignment_id))
+        ).fetchall()
+        self.exemplars = [dict(r) for r in rows]
+        model = embedding_model_name()
+        stale = [e for e in self.exemplars if e["embedding_model"] != model]
+        if stale:
+            # Embedding backend changed since these were saved; re-embed once and persist
+            vectors = embed_texts([e["submission"] for e in stale])
+            with conn:
+                for exemplar, vector in zip(stale, vectors):
+                    exemplar["embedding"] = vector.astype(np.float32).tobytes()
+                    conn.execute("UPDATE exemplars SET embedding = ?, embedding_model = ? WHERE id = ?",
+                                 (exemplar["embedding"], model, exemplar["id"]))
+        if self.exemplars:
+            self.matrix = np.vstack([np.frombuffer(e["embedding"], dtype=np.float32) for e in self.exemplars])
+        else:
+            self.matrix = np.zeros((0, 1), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.exemplars)
+
+    def select(self, vector, k=EXEMPLAR_K, token_budget=EXEMPLAR_TOKEN_BUDGET, exclude_student=None):
+        """Pick up to ``k`` most similar exemplars whose prompt text fits in ``token_budget``."""
+        if not self.exemplars or k <= 0:
+            return []
+        similarities = self.matrix @ vector
+        candidate_count = min(len(self.exemplars), k * 3)
+        top = np.argpartition(-similarities, candidate_count - 1)[:candidate_count]
+        top = top[np.argsort(-similarities[top])]
+        chosen, used = [], 0
+        for i in top:
+            exemplar = self.exemplars[i]
+            if exclude_student is not None and exemplar["student_id"] == str(exclude_student):
+                continue
+            cost = estimate_tokens(exemplar["submission"][:EXEMPLAR_MAX_CHARS]) + estimate_tokens(exemplar["feedback"])
+            if used + cost > token_budget:
+                continue
+            chosen.append({**exemplar, "similarity": float(similarities[i])})
+            used += cost
+            if len(chosen) >= k:
+                break
+        return chosen
+
+    def select_for_texts(self, texts, **kwargs):
+        """Embed many submissions in one call and select exemplars for each."""
+        if not self.exemplars:
+            return [[] for _ in texts]
+        vectors = embed_texts(texts)
+        return [self.select(vector, **kwargs) for vector in vectors]
+
+
+def get_index(course_id, assignment_id):
+    """Cached ExemplarIndex for an assignment (rebuilt after exemplars change)."""
+    key = (str(course_id), str(assignment_id))
+    with _lock:
+        index = _indexes.get(key)
+    if index is None:
+        index = ExemplarIndex(*key)
+        with _lock:
+            _indexes[key] = index
+    return index
+
+
+def format_exemplars(exemplars):
+    """Render selected exemplars as a prompt block ("" when there are none)."""
+    if not exemplars:
+        return ""
+    blocks = []
+    for n, exemplar in enumerate(exemplars, 1):
+        submission = exemplar["submission"]
+        if len(submission) > EXEMPLAR_MAX_CHARS:
+            submission = submission[:EXEMPLAR_MAX_CHARS] + " [...]"
+        blocks.append(
+            f"Example {n} (instructor-approved score: {exemplar['score']}):\n"
+            f"Submission:\n{submission}\n\nApproved evaluation:\n{exemplar['feedback']}"
+        )
+    return "\n\n---\n\n".join(blocks)
+
+
+def exemplars_for(course_id, assignment_id, submission, exclude_student=None):
+    """Formatted calibration block for one submission, or "" if the assignment has no exemplars."""
+    index = get_index(course_id, assignment_id)
+    if not len(index):
+        return ""
+    vector = embed_texts([submission])[0]
+    return format_exemplars(index.select(vector, exclude_student=exclude_student))
@@ -0,0 +1,61 @@
+import heapq
+import itertools
+import threading
+from collections import deque
+
+
+class FairQueue:
+    """Blocking job queue that round-robins between lanes (tenants or courses).
+
+    The lowest priority value still goes first, but among lanes whose next
+    job has that priority, lanes take turns, so a course with hundreds of
+    queued submissions cannot hold back a course with a handful.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._counter = itertools.count()
+        # lane -> heap of (priority, counter, item)
+        self._lanes = {}
+        # Lanes with queued jobs; the lane served last moves to the back
+        self._order = deque()
+
+    def put(self, item, lane, priority=0):
+        with self._cond:
+            if lane not in self._lanes:
+                self._lanes[lane] = []
+                self._order.append(lane)
+            heapq.heappush(self._lanes[lane], (priority, next(self._counter), item))
+            self._cond.notify()
+
+    def promote(self, item, lane, priority):
+        """Lower a queued item's priority value in place; False if it is not queued in ``lane``."""
+        with self._cond:
+            jobs = self._lanes.get(lane, [])
+            for i, (old_priority, counter, queued) in enumerate(jobs):
+                if queued == item:
+                    if priority < old_priority:
+                        jobs[i] = (priority, counter, queued)
+                        heapq.heapify(jobs)
+                    return True
+            return False
+
+    def get(self, timeout=None):
+        """Next item (blocks until one is queued); raises TimeoutError after ``timeout`` seconds."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._order, timeout):
+                raise TimeoutError("queue is empty")
+            best = min(self._lanes[lane][0][0] for lane in self._order)
+            lane = next(lane for lane in self._order if self._lanes[lane][0][0] == best)
+            jobs = self._lanes[lane]
+            _, _, item = heapq.heappop(jobs)
+            self._order.remove(lane)
+            if jobs:
+                self._order.append(lane)
+            else:
+                del self._lanes[lane]
+            return item
+
+    def __len__(self):
+        with self._cond:
+            return sum(len(jobs) for jobs in self._lanes.values())
@@ -0,0 +1,140 @@
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.cache_utils import cache_path, content_hash
+
+PDF_TYPE = "application/pdf"
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+TEXT_TYPE = "text/plain"
+SUPPORTED_TYPES = (PDF_TYPE, DOCX_TYPE, TEXT_TYPE)
+
+# Headings that usually start the grading section of a syllabus or assignment sheet
+RUBRIC_HEADING = re.compile(r"^\s*(#+\s*)?(grading\s+)?(rubric|grading criteria|scoring guide|assessment criteria|evaluation criteria)\b", re.IGNORECASE)
+RUBRIC_HINTS = re.compile(r"\b(rubric|criteri(on|a)|points?|pts|excellent|proficient|marginal|poor|score)\b", re.IGNORECASE)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=1)
+    return _executor
+
+
+def iter_pdf_pages(data: bytes):
+    """Yield the text of each PDF page one at a time."""
+    import PyPDF2
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+
+def iter_docx_blocks(data: bytes):
+    """Yield paragraph and table-row text from a Word document."""
+    import docx
+    document = docx.Document(io.BytesIO(data))
+    for paragraph in document.paragraphs:
+        yield paragraph.text
+    for table in document.tables:
+        for row in table.rows:
+            yield " | ".join(cell.text.strip() for cell in row.cells)
+
+
+def extract_text(data: bytes, file_type: str) -> str:
+    """Extract plain text from an uploaded file, page by page."""
+    if file_type == PDF_TYPE:
+        return "\n".join(iter_pdf_pages(data))
+    if file_type == DOCX_TYPE:
+        return "\n".join(iter_docx_blocks(data))
+    if file_type == TEXT_TYPE:
+        return data.decode("utf-8", errors="replace")
+    raise ValueError(f"Unsupported file type: {file_type}")
+
+
+def _cached_text_path(file_hash: str) -> str:
+    return cache_path("ingest", f"{file_hash}.txt")
+
+
+def load_cached_text(file_hash: str):
+    """Return previously extracted text for a file hash, or None."""
+    path = _cached_text_path(file_hash)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    return None
+
+
+def _store_cached_text(file_hash: str, text: str) -> None:
+    path = _cached_text_path(file_hash)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _extract_and_cache(data: bytes, file_type: str, file_hash: str) -> str:
+    text = extract_text(data, file_type)
+    _store_cached_text(file_hash, text)
+    return text
+
+
+class IngestJob:
+    """Handle for a file being extracted in the worker process."""
+
+    def __init__(self, file_hash, future=None, text=None):
+        self.file_hash = file_hash
+        self._future = future
+        self._text = text
+
+    @property
+    def cached(self) -> bool:
+        return self._future is None
+
+    def done(self) -> bool:
+        return self._future is None or self._future.done()
+
+    def result(self, timeout=None) -> str:
+        if self._future is not None:
+            return self._future.result(timeout=timeout)
+        return self._text
+
+
+def submit_file(data: bytes, file_type: str) -> IngestJob:
+    """Start extracting text from file bytes in a worker process.
+
+    Returns immediately; cached files resolve without touching the worker.
+    """
+    file_hash = content_hash(data)
+    cached = load_cached_text(file_hash)
+    if cached is not None:
+        return IngestJob(file_hash, text=cached)
+    if file_type == TEXT_TYPE:
+        # Nothing to parse; avoid the process round-trip
+        text = _extract_and_cache(data, file_type, file_hash)
+        return IngestJob(file_hash, text=text)
+    future = _get_executor().submit(_extract_and_cache, data, file_type, file_hash)
+    return IngestJob(file_hash, future=future)
+
+
+def extract_rubric_section(text: str, max_chars: int = 12000) -> str:
+    """Return only the part of a document that describes the rubric.
+
+    Starts at the first rubric-like heading if there is one; otherwise keeps
+    the paragraphs that mention criteria, points or rating levels. The result
+    is capped at ``max_chars`` so long syllabi don't blow up the prompt.
+    """
+    if not text:
+        return ""
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        if RUBRIC_HEADING.match(line):
+            section = "\n".join(lines[i:]).strip()
+            return section[:max_chars]
+
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    relevant = [p for p in paragraphs if RUBRIC_HINTS.search(p)]
+    section = "\n\n".join(relevant) if relevant else text.strip()
+    return section[:max_chars]
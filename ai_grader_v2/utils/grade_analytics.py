@@ -0,0 +1,139 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from utils.grade_store import list_grades, list_criterion_scores
+
+
+def load_frames(course_id, assignment_id):
+    """Load an assignment's grades and per-criterion scores as DataFrames."""
+    grades = pd.DataFrame(list_grades(course_id, assignment_id))
+    criteria = pd.DataFrame(
+        list_criterion_scores(course_id, assignment_id),
+        columns=["student_id", "criterion", "points", "max_points"]
+    )
+    return grades, criteria
+
+
+def score_distribution(grades, bins=10):
+    """Histogram of overall scores as a DataFrame of bin ranges and counts."""
+    scores = grades["score"].dropna().to_numpy(dtype=float) if not grades.empty else np.array([])
+    if scores.size == 0:
+        return pd.DataFrame(columns=["bin", "count"])
+    upper = max(float(grades["max_score"].max() or 0), float(scores.max()), 1.0)
+    counts, edges = np.histogram(scores, bins=bins, range=(0.0, upper))
+    labels = [f"{edges[i]:.0f}-{edges[i + 1]:.0f}" for i in range(len(counts))]
+    return pd.DataFrame({"bin": labels, "count": counts})
+
+
+def summary_stats(grades):
+    """Count, mean, median, std and quartiles of overall scores."""
+    scores = grades["score"].dropna().to_numpy(dtype=float) if not grades.empty else np.array([])
+    if scores.size == 0:
+        return {}
+    q1, median, q3 = np.percentile(scores, [25, 50, 75])
+    return {
+        "count": int(scores.size),
+        "mean": float(scores.mean()),
+        "median": float(median),
+        "std": float(scores.std(ddof=1)) if scores.size > 1 else 0.0,
+        "q1": float(q1),
+        "q3": float(q3),
+        "min": float(scores.min()),
+        "max": float(scores.max()),
+    }
+
+
+def criterion_summary(criteria):
+    """Per-criterion mean/std/min/max and mean as a percentage of the criterion's points."""
+    if criteria.empty:
+        return pd.DataFrame(columns=["criterion", "n", "mean", "std", "min", "max", "max_points", "mean_pct"])
+    summary = criteria.groupby("criterion").agg(
+        n=("points", "size"),
+        mean=("points", "mean"),
+        std=("points", "std"),
+        min=("points", "min"),
+        max=("points", "max"),
+        max_points=("max_points", "max"),
+    ).reset_index()
+    summary["mean_pct"] = np.where(summary["max_points"] > 0, 100.0 * summary["mean"] / summary["max_points"], np.nan)
+    return summary.sort_values("mean_pct")
+
+
+def detect_outliers(grades, threshold=3.5):
+    """Flag scores far from the median using the robust (MAD-based) z-score.
+
+    Returns:
+        DataFrame: the outlier rows with an added ``robust_z`` column
+    """
+    if grades.empty or grades["score"].notna().sum() < 3:
+        return grades.iloc[0:0]
+    scores = grades["score"].to_numpy(dtype=float)
+    median = np.nanmedian(scores)
+    mad = np.nanmedian(np.abs(scores - median))
+    if mad == 0:
+        # Fall back to the standard deviation when most scores are identical
+        spread = np.nanstd(scores) or 1.0
+        robust_z = (scores - median) / spread
+    else:
+        robust_z = 0.6745 * (scores - median) / mad
+    flagged = grades.assign(robust_z=robust_z)
+    return flagged[np.abs(flagged["robust_z"]) > threshold].sort_values("robust_z")
+
+
+def _normalize(name):
+    # "Critical Thinking & Argumentation (25 pts)" -> "critical thinking argumentation"
+    name = re.sub(r"\(.*?\)", "", str(name)).lower()
+    return " ".join(re.findall(r"[a-z0-9]+", name))
+
+
+def rating_level_comparison(criteria, rubric):
+    """Count how many students landed in each rubric rating level per criterion.
+
+    Each awarded score is assigned to the highest rating level whose points it
+    reaches (vectorized with ``np.searchsorted``).
+
+    Returns:
+        DataFrame: criterion, level, level_points, count, share
+    """
+    if criteria.empty or not rubric:
+        return pd.DataFrame(columns=["criterion", "level", "level_points", "count", "share"])
+    frames = []
+    normalized = criteria.assign(key=criteria["criterion"].map(_normalize))
+    for item in rubric:
+        ratings = item.get("ratings") or []
+        if not ratings:
+            continue
+        key = _normalize(item.get("description", ""))
+        rows = normalized[normalized["key"].str.startswith(key) | normalized["key"].map(lambda k: key.startswith(k) if k else False)]
+        if rows.empty:
+            continue
+        levels = sorted(ratings, key=lambda r: float(r.get("points", 0)))
+        level_points = np.array([float(r.get("points", 0)) for r in levels])
+        idx = np.searchsorted(level_points, rows["points"].to_numpy(dtype=float), side="right") - 1
+        idx = np.clip(idx, 0, len(levels) - 1)
+        counts = np.bincount(idx, minlength=len(levels))
+        frames.append(pd.DataFrame({
+            "criterion": item.get("description", ""),
+            "level": [r.get("description", "") for r in levels],
+            "level_points": level_points,
+            "count": counts,
+            "share": counts / max(counts.sum(), 1),
+        }))
+    if not frames:
+        return pd.DataFrame(columns=["criterion", "level", "level_points", "count", "share"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def compute_analytics(course_id, assignment_id, rubric=None, bins=10, outlier_threshold=3.5):
+    """All dashboard aggregates for one assignment in a single pass over the store."""
+    grades, criteria = load_frames(course_id, assignment_id)
+    return {
+        "grades": grades,
+        "stats": summary_stats(grades),
+        "distribution": score_distribution(grades, bins),
+        "criteria": criterion_summary(criteria),
+        "outliers": detect_outliers(grades, outlier_threshold),
+        "levels": rating_level_comparison(criteria, rubric),
+    }
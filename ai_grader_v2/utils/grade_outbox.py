@@ -0,0 +1,432 @@
+"""Outbox for posting grades to Canvas.
+
+A grade post is written to the outbox table before anything is sent, keyed
+by (course, assignment, student, content hash), so posting the same grade
+and feedback again (a Streamlit rerun, the graph retrying after an error,
+"post all" after a partial failure) is recognized instead of adding a second
+comment in Canvas. A background flusher sends pending entries in
+update_grades batches per assignment and retries failures with backoff.
+Once Canvas has accepted an update_grades request, its Progress URL is
+stored on the entries; a retry re-checks that Progress instead of posting
+again. Entries interrupted mid-send (the process died) are retried after a
+lease that is renewed before every Canvas request, so a crash at the wrong
+moment can repeat a post, but never loses one.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from api.canvas_api import (
+    submit_grade_and_feedback, post_grades_batch, get_progress, wait_for_progress, ProgressUnconfirmed,
+    GRADE_POST_BATCH_SIZE, GRADE_POST_TIMEOUT
+)
+from utils.cache_utils import cache_path, content_hash
+from utils.grade_store import set_post_status, POST_PENDING, POST_POSTED, POST_FAILED
+from utils.tracing import logger, span
+
+DB_PATH = cache_path("grade_outbox.sqlite")
+
+# Entries taken per flush; each assignment's share goes out as update_grades batches
+OUTBOX_CLAIM_LIMIT = int(os.getenv("GRADE_OUTBOX_CLAIM_LIMIT", "200"))
+# Attempts before an entry is given up as failed, and the first retry delay (doubled per attempt)
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("GRADE_OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_RETRY_SECONDS = float(os.getenv("GRADE_OUTBOX_RETRY_SECONDS", "5"))
+# How long a chat request waits for its post before reporting it as queued
+OUTBOX_WAIT_SECONDS = float(os.getenv("GRADE_OUTBOX_WAIT_SECONDS", "30"))
+# Entries left "sending" longer than this (a crashed process) are sent again. The lease is
+# renewed before each Canvas request, so it only has to outlast one request and its Progress wait.
+SEND_LEASE_SECONDS = GRADE_POST_TIMEOUT + 180
+# Posts arriving within this window share a request
+LINGER_SECONDS = 0.2
+# Longest sleep of an idle flusher (it is woken when something is queued)
+IDLE_SECONDS = 60
+
+OUTBOX_PENDING = "pending"
+OUTBOX_SENDING = "sending"
+OUTBOX_SENT = "sent"
+OUTBOX_FAILED = "failed"
+# A newer grade for the same student was queued before this one was sent
+OUTBOX_SUPERSEDED = "superseded"
+
+FINAL_STATES = (OUTBOX_SENT, OUTBOX_FAILED, OUTBOX_SUPERSEDED)
+
+_local = threading.local()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    course_id TEXT NOT NULL,
+    assignment_id TEXT NOT NULL,
+    student_id TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    claim TEXT,
+    progress_url TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    sent_at REAL,
+    UNIQUE (course_id, assignment_id, student_id, content_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_outbox_assignment ON outbox (course_id, assignment_id, status);
+"""
+
+
+# Columns added after the first release, with their definitions
+_ADDED_COLUMNS = {
+    "progress_url": "TEXT",
+}
+
+
+def _migrate(conn):
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(outbox)")}
+    for column, definition in _ADDED_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE outbox ADD COLUMN {column} {definition}")
+
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _migrate(conn)
+        _local.conn = conn
+    return conn
+
+
+def payload_hash(payload):
+    """Hash of what a post changes in Canvas: grade, comment and rubric assessment."""
+    grade = payload.get("grade")
+    try:
+        grade = f"{float(grade):g}"
+    except (TypeError, ValueError):
+        grade = str(grade)
+    content = {"grade": grade, "comment": (payload.get("comment") or "").strip(),
+               "rubric_assessment": payload.get("rubric_assessment") or {}}
+    return content_hash(json.dumps(content, sort_keys=True, default=str))[:32]
+
+
+def _entry(row):
+    entry = dict(row)
+    entry["payload"] = json.loads(entry["payload"])
+    return entry
+
+
+def record(course_id, assignment_id, payload):
+    """Write a grade post to the outbox unless the same content is already queued or sent.
+
+    Args:
+        payload (dict): "student_id", "grade", and optionally "comment" and "rubric_assessment"
+
+    Returns:
+        dict: the outbox entry, with "duplicate" True if nothing new was queued
+    """
+    key = (str(course_id), str(assignment_id), str(payload["student_id"]), payload_hash(payload))
+    now = time.time()
+    conn = _connect()
+    with conn:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO outbox (course_id, assignment_id, student_id, content_hash, payload, status,"
+            " next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (*key, json.dumps(payload, default=str), OUTBOX_PENDING, now, now, now),
+        )
+        duplicate = cursor.rowcount == 0
+        if duplicate:
+            # Posting content that failed for good or was superseded is a deliberate retry
+            revived = conn.execute(
+                "UPDATE outbox SET status = ?, attempts = 0, next_attempt_at = ?, last_error = NULL, updated_at = ?"
+                " WHERE course_id = ? AND assignment_id = ? AND student_id = ? AND content_hash = ?"
+                " AND status IN (?, ?)",
+                (OUTBOX_PENDING, now, now, *key, OUTBOX_FAILED, OUTBOX_SUPERSEDED),
+            )
+            duplicate = revived.rowcount == 0
+        row = conn.execute(
+            "SELECT * FROM outbox WHERE course_id = ? AND assignment_id = ? AND student_id = ? AND content_hash = ?",
+            key,
+        ).fetchone()
+        if not duplicate:
+            # Older unsent versions of this student's grade must not overwrite the new one
+            conn.execute(
+                "UPDATE outbox SET status = ?, updated_at = ? WHERE course_id = ? AND assignment_id = ?"
+                " AND student_id = ? AND status = ? AND id != ?",
+                (OUTBOX_SUPERSEDED, now, *key[:3], OUTBOX_PENDING, row["id"]),
+            )
+    entry = _entry(row)
+    entry["duplicate"] = duplicate
+    return entry
+
+
+def claim(limit=OUTBOX_CLAIM_LIMIT):
+    """Mark up to ``limit`` due entries as sending and return them, oldest first."""
+    token = uuid.uuid4().hex
+    now = time.time()
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "UPDATE outbox SET status = ?, claim = ?, updated_at = ? WHERE id IN ("
+            " SELECT id FROM outbox WHERE (status = ? AND next_attempt_at <= ?) OR (status = ? AND updated_at < ?)"
+            " ORDER BY id LIMIT ?)",
+            (OUTBOX_SENDING, token, now, OUTBOX_PENDING, now, OUTBOX_SENDING, now - SEND_LEASE_SECONDS, limit),
+        )
+    rows = conn.execute("SELECT * FROM outbox WHERE claim = ? AND status = ? ORDER BY id",
+                        (token, OUTBOX_SENDING)).fetchall()
+    return [_entry(r) for r in rows]
+
+
+def _mark(entry, status, error=None):
+    now = time.time()
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "UPDATE outbox SET status = ?, last_error = ?, updated_at = ?, sent_at = ? WHERE id = ?",
+            (status, error, now, now if status == OUTBOX_SENT else None, entry["id"]),
+        )
+
+
+def _renew(entries):
+    """Extend the send lease of claimed entries that are still being sent."""
+    conn = _connect()
+    with conn:
+        conn.executemany("UPDATE outbox SET updated_at = ? WHERE id = ? AND status = ?",
+                         [(time.time(), e["id"], OUTBOX_SENDING) for e in entries])
+
+
+def _set_progress(entries, progress_url):
+    """Remember the Progress of an update Canvas accepted (None: the entries must be posted again)."""
+    conn = _connect()
+    with conn:
+        conn.executemany("UPDATE outbox SET progress_url = ?, updated_at = ? WHERE id = ?",
+                         [(progress_url, time.time(), e["id"]) for e in entries])
+    for entry in entries:
+        entry["progress_url"] = progress_url
+
+
+def mark_sent(entry):
+    _mark(entry, OUTBOX_SENT)
+    set_post_status(entry["course_id"], entry["assignment_id"], entry["student_id"], POST_POSTED)
+
+
+def mark_failed(entry, error):
+    """Schedule a retry with backoff, or give up after OUTBOX_MAX_ATTEMPTS; returns True if given up."""
+    attempts = entry["attempts"] + 1
+    now = time.time()
+    given_up = attempts >= OUTBOX_MAX_ATTEMPTS
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ?"
+            " WHERE id = ?",
+            (OUTBOX_FAILED if given_up else OUTBOX_PENDING, attempts,
+             now + OUTBOX_RETRY_SECONDS * 2 ** (attempts - 1), error, now, entry["id"]),
+        )
+    set_post_status(entry["course_id"], entry["assignment_id"], entry["student_id"],
+                    POST_FAILED if given_up else POST_PENDING, error=error)
+    return given_up
+
+
+def get_entries(entry_ids):
+    """Outbox entries by id."""
+    if not entry_ids:
+        return []
+    placeholders = ",".join("?" * len(entry_ids))
+    rows = _connect().execute(f"SELECT * FROM outbox WHERE id IN ({placeholders})", list(entry_ids)).fetchall()
+    return [_entry(r) for r in rows]
+
+
+def status_counts(course_id, assignment_id):
+    """{status: number of entries} for an assignment."""
+    rows = _connect().execute(
+        "SELECT status, COUNT(*) FROM outbox WHERE course_id = ? AND assignment_id = ? GROUP BY status",
+        (str(course_id), str(assignment_id)),
+    ).fetchall()
+    return {status: count for status, count in rows}
+
+
+def _next_due():
+    row = _connect().execute("SELECT MIN(next_attempt_at) FROM outbox WHERE status = ?", (OUTBOX_PENDING,)).fetchone()
+    return row[0]
+
+
+def is_settled(entry):
+    """Sent, given up, superseded, or waiting for a retry after at least one attempt."""
+    return entry["status"] in FINAL_STATES or (entry["status"] == OUTBOX_PENDING and entry["attempts"] > 0)
+
+
+class OutboxFlusher:
+    """Background thread that sends the outbox to Canvas.
+
+    Entries are grouped per assignment: a single post goes out as a normal
+    submission PUT, several as update_grades batches. Entries whose batch
+    Canvas already accepted only have their Progress re-checked. Results are
+    written back to the outbox and to the grade store's post_status.
+    """
+
+    def __init__(self, claim_limit=OUTBOX_CLAIM_LIMIT):
+        self.claim_limit = claim_limit
+        self._wake = threading.Event()
+        self._flushed = threading.Condition()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._claimed = []
+
+    def start(self):
+        """Start the flusher thread (if needed) and send whatever is due, e.g. posts left by an earlier run."""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="grade-outbox", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def submit(self, course_id, assignment_id, payloads):
+        """Queue grade posts (see record()) and wake the flusher once; returns their entries."""
+        entries = [record(course_id, assignment_id, payload) for payload in payloads]
+        for entry in entries:
+            if not entry["duplicate"]:
+                set_post_status(course_id, assignment_id, entry["student_id"], POST_PENDING)
+        if any(not entry["duplicate"] for entry in entries):
+            self.start()
+        return entries
+
+    def wait(self, entry_ids, timeout=OUTBOX_WAIT_SECONDS):
+        """Block until every entry is settled (see is_settled) or the timeout passes; returns the entries."""
+        deadline = time.monotonic() + timeout
+        with self._flushed:
+            while True:
+                entries = get_entries(entry_ids)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or all(is_settled(e) for e in entries):
+                    return entries
+                self._flushed.wait(min(remaining, 1.0))
+
+    def flush(self):
+        """Send one claimed batch; returns how many entries were handled."""
+        entries = claim(self.claim_limit)
+        if not entries:
+            return 0
+        # Every entry of the claim keeps its lease while earlier batches are sent
+        self._claimed = entries
+        groups = OrderedDict()
+        for entry in entries:
+            groups.setdefault((entry["course_id"], entry["assignment_id"]), OrderedDict())
+            group = groups[(entry["course_id"], entry["assignment_id"])]
+            # Only the newest version of a student's grade is sent
+            older = group.pop(entry["student_id"], None)
+            if older is not None:
+                _mark(older, OUTBOX_SUPERSEDED)
+            group[entry["student_id"]] = entry
+        for (course_id, assignment_id), group in groups.items():
+            try:
+                self._send(course_id, assignment_id, list(group.values()))
+            except Exception as e:
+                logger.warning("Error sending grades for %s/%s: %s", course_id, assignment_id, e)
+                for entry in group.values():
+                    mark_failed(entry, f"Error posting grades: {e}")
+        with self._flushed:
+            self._flushed.notify_all()
+        return len(entries)
+
+    def _send(self, course_id, assignment_id, entries):
+        with span("outbox.send", course_id=course_id, assignment_id=assignment_id, students=len(entries)):
+            # Accepted by Canvas earlier but not confirmed: check the Progress, never post again
+            by_progress = OrderedDict()
+            for entry in entries:
+                if entry["progress_url"]:
+                    by_progress.setdefault(entry["progress_url"], []).append(entry)
+            for progress_url, accepted in by_progress.items():
+                _renew(self._claimed)
+                try:
+                    progress = get_progress(course_id, progress_url)
+                    state = progress.get("workflow_state")
+                except Exception as e:
+                    self._settle(accepted, ProgressUnconfirmed(f"Could not check the update's progress: {e}"))
+                    continue
+                if state == "completed":
+                    self._settle(accepted, None)
+                elif state == "failed":
+                    _set_progress(accepted, None)
+                    self._settle(accepted, progress.get("message") or "Canvas reported the update as failed")
+                else:
+                    self._settle(accepted, ProgressUnconfirmed(f"Canvas is still applying the update ({state})"))
+
+            fresh = [e for e in entries if not e["progress_url"]]
+            if len(fresh) == 1:
+                _renew(self._claimed)
+                payload = fresh[0]["payload"]
+                result = submit_grade_and_feedback(
+                    user_id=payload["student_id"], course_id=course_id, assignment_id=assignment_id,
+                    grade=payload["grade"], feedback=payload.get("comment") or "",
+                    rubric_assessment=payload.get("rubric_assessment"),
+                )
+                self._settle(fresh, None if result.startswith("✅") else result)
+                return
+            for start in range(0, len(fresh), GRADE_POST_BATCH_SIZE):
+                batch = fresh[start:start + GRADE_POST_BATCH_SIZE]
+                _renew(self._claimed)
+                try:
+                    progress = post_grades_batch(course_id, assignment_id, [e["payload"] for e in batch])
+                except Exception as e:
+                    logger.warning("Error posting %d grades: %s", len(batch), e)
+                    self._settle(batch, f"Error posting grades: {e}")
+                    continue
+                if progress.get("url"):
+                    _set_progress(batch, progress["url"])
+                try:
+                    error = wait_for_progress(course_id, progress)
+                except ProgressUnconfirmed as e:
+                    self._settle(batch, e)
+                    continue
+                if error is not None:
+                    _set_progress(batch, None)
+                self._settle(batch, error)
+
+    def _settle(self, entries, error):
+        """Record the outcome: None is sent, a message is a failed post, ProgressUnconfirmed is re-checked later."""
+        for entry in entries:
+            if error is None:
+                mark_sent(entry)
+            elif mark_failed(entry, str(error)):
+                logger.warning("Giving up posting the grade of student %s after %d attempts: %s",
+                               entry["student_id"], entry["attempts"] + 1, error)
+
+    def _run(self):
+        while True:
+            due = None
+            try:
+                due = _next_due()
+            except Exception as e:
+                logger.warning("Could not read the grade outbox: %s", e)
+            timeout = IDLE_SECONDS if due is None else min(max(due - time.time(), 0), IDLE_SECONDS)
+            self._wake.wait(timeout)
+            self._wake.clear()
+            time.sleep(LINGER_SECONDS)
+            try:
+                while self.flush():
+                    pass
+            except Exception as e:
+                logger.warning("Grade outbox flush failed: %s", e)
+                time.sleep(OUTBOX_RETRY_SECONDS)
+
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def get_flusher():
+    """Process-wide OutboxFlusher."""
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = OutboxFlusher()
+    return _flusher
@@ -0,0 +1,61 @@
+from utils.grade_outbox import get_flusher, OUTBOX_SENT, OUTBOX_FAILED, OUTBOX_WAIT_SECONDS
+from utils.grade_store import list_grades, POST_POSTED
+from utils.prefetch import cached_rubric
+from utils.rubric_assessment import build_rubric_assessment
+from utils.tracing import logger, span
+
+
+def canvas_rubric(course_id, assignment_id):
+    """The assignment's Canvas rubric (criteria with ids), or [] when there is none."""
+    try:
+        rubric = cached_rubric(course_id, assignment_id)
+    except Exception as e:
+        logger.warning("Could not load the Canvas rubric for posting: %s", e)
+        return []
+    return rubric if isinstance(rubric, list) else []
+
+
+def grade_payload(student_id, score, feedback, rubric):
+    """What to post for one student: per-criterion rubric scores when the feedback matches
+    the Canvas rubric (the comment then only carries the summary), else the full feedback."""
+    payload = {"student_id": str(student_id), "grade": score, "comment": feedback or ""}
+    if rubric:
+        assessment, general_comment, missing = build_rubric_assessment(rubric, feedback)
+        if assessment:
+            payload["rubric_assessment"] = assessment
+            payload["comment"] = general_comment
+            if missing:
+                logger.debug("Feedback for student %s scores no rubric criterion for: %s", student_id, missing)
+    return payload
+
+
+def post_stored_grades(course_id, assignment_id, student_ids=None, rubric=None, timeout=OUTBOX_WAIT_SECONDS):
+    """Queue an assignment's stored, not yet posted grades in the outbox and wait for the flusher.
+
+    Returns:
+        dict: {"posted": [student ids], "failed": {student_id: error}, "queued": [student ids
+               still pending or retrying], "duplicates": count already queued, "with_rubric": count}
+    """
+    rubric = rubric if rubric is not None else canvas_rubric(course_id, assignment_id)
+    wanted = {str(s) for s in student_ids} if student_ids else None
+    rows = [
+        row for row in list_grades(course_id, assignment_id, include_feedback=True)
+        if row["post_status"] != POST_POSTED and row["score"] is not None
+        and (wanted is None or row["student_id"] in wanted)
+    ]
+    flusher = get_flusher()
+    with span("grades.post_bulk", course_id=str(course_id), assignment_id=str(assignment_id), students=len(rows)):
+        payloads = [grade_payload(row["student_id"], row["score"], row["feedback"], rubric) for row in rows]
+        entries = flusher.submit(course_id, assignment_id, payloads)
+        settled = flusher.wait([e["id"] for e in entries], timeout) if entries else []
+
+    summary = {"posted": [], "failed": {}, "queued": [], "duplicates": sum(e["duplicate"] for e in entries),
+               "with_rubric": sum(1 for p in payloads if p.get("rubric_assessment"))}
+    for entry in sorted(settled, key=lambda e: e["student_id"]):
+        if entry["status"] == OUTBOX_SENT:
+            summary["posted"].append(entry["student_id"])
+        elif entry["status"] == OUTBOX_FAILED:
+            summary["failed"][entry["student_id"]] = entry["last_error"]
+        else:
+            summary["queued"].append(entry["student_id"])
+    return summary
@@ -0,0 +1,267 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from utils.cache_utils import cache_path, content_hash
+
+DB_PATH = cache_path("grades.sqlite")
+
+# "Criterion Name: 18/25" lines in grading feedback
+CRITERION_SCORE = re.compile(r"^\s*([^:\n]{2,200}?):\s*(\d+(?:\.\d+)?)\s*/\s*(\d+(?:\.\d+)?)\s*$", re.MULTILINE)
+
+POST_NOT_POSTED = "not_posted"
+POST_PENDING = "pending"
+POST_POSTED = "posted"
+POST_FAILED = "failed"
+
+_local = threading.local()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS grades (
+    id INTEGER PRIMARY KEY,
+    course_id TEXT NOT NULL,
+    assignment_id TEXT NOT NULL,
+    student_id TEXT NOT NULL,
+    student_name TEXT,
+    score REAL,
+    max_score REAL,
+    feedback TEXT,
+    model TEXT,
+    rubric_hash TEXT,
+    source TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    post_status TEXT NOT NULL DEFAULT 'not_posted',
+    posted_at REAL,
+    post_error TEXT,
+    review_reason TEXT,
+    UNIQUE (course_id, assignment_id, student_id)
+);
+CREATE INDEX IF NOT EXISTS idx_grades_assignment ON grades (course_id, assignment_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_grades_post_status ON grades (post_status);
+CREATE TABLE IF NOT EXISTS criterion_scores (
+    grade_id INTEGER NOT NULL REFERENCES grades (id) ON DELETE CASCADE,
+    criterion TEXT NOT NULL,
+    points REAL,
+    max_points REAL,
+    PRIMARY KEY (grade_id, criterion)
+);
+"""
+
+
+# Columns added after the first release, with their definitions
+_ADDED_COLUMNS = {
+    "review_reason": "TEXT",
+}
+
+
+def _migrate(conn):
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(grades)")}
+    for column, definition in _ADDED_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE grades ADD COLUMN {column} {definition}")
+
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.executescript(SCHEMA)
+        _migrate(conn)
+        _local.conn = conn
+    return conn
+
+
+def rubric_hash(rubric) -> str:
+    """Stable short hash of a rubric (list/dict or already formatted text)."""
+    if not isinstance(rubric, str):
+        rubric = json.dumps(rubric, sort_keys=True, default=str)
+    return content_hash(rubric)[:16]
+
+
+def parse_criterion_scores(feedback):
+    """Extract (criterion, points, max_points) tuples from grading feedback text."""
+    scores = []
+    seen = set()
+    for name, points, max_points in CRITERION_SCORE.findall(feedback or ""):
+        name = name.strip()
+        if name.lower() in ("overall score", "score", "total") or name in seen:
+            continue
+        seen.add(name)
+        scores.append((name, float(points), float(max_points)))
+    return scores
+
+
+def _max_score(feedback):
+    match = re.search(r"Score:\s*\d+(?:\.\d+)?\s*/\s*(\d+(?:\.\d+)?)", (feedback or "").split("\n")[0])
+    return float(match.group(1)) if match else None
+
+
+def _upsert(conn, record, now):
+    feedback = record.get("feedback", "")
+    cursor = conn.execute(
+        """
+        INSERT INTO grades (course_id, assignment_id, student_id, student_name, score, max_score, feedback,
+                            model, rubric_hash, source, created_at, updated_at, post_status, review_reason)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (course_id, assignment_id, student_id) DO UPDATE SET
+            student_name = COALESCE(excluded.student_name, student_name),
+            score = excluded.score,
+            max_score = excluded.max_score,
+            feedback = excluded.feedback,
+            model = excluded.model,
+            rubric_hash = excluded.rubric_hash,
+            source = excluded.source,
+            updated_at = excluded.updated_at,
+            post_status = excluded.post_status,
+            post_error = NULL,
+            review_reason = excluded.review_reason
+        RETURNING id
+        """,
+        (str(record["course_id"]), str(record["assignment_id"]), str(record["student_id"]),
+         record.get("student_name"), record.get("score"), _max_score(feedback), feedback,
+         record.get("model"), record.get("rubric_hash"), record.get("source", "chat"), now, now,
+         POST_NOT_POSTED, record.get("review_reason"))
+    )
+    grade_id = cursor.fetchone()[0]
+    conn.execute("DELETE FROM criterion_scores WHERE grade_id = ?", (grade_id,))
+    conn.executemany(
+        "INSERT INTO criterion_scores VALUES (?, ?, ?, ?)",
+        [(grade_id, name, points, max_points) for name, points, max_points in parse_criterion_scores(feedback)]
+    )
+    return grade_id
+
+
+def save_grade(course_id, assignment_id, student_id, score, feedback, student_name=None,
+               model=None, rubric_hash=None, source="chat", review_reason=None):
+    """Insert or replace the grade for one student and return its row id.
+
+    ``review_reason`` marks grades an instructor should check (e.g. reused from a duplicate).
+    """
+    conn = _connect()
+    with conn:
+        return _upsert(conn, {
+            "course_id": course_id, "assignment_id": assignment_id, "student_id": student_id,
+            "student_name": student_name, "score": score, "feedback": feedback, "model": model,
+            "rubric_hash": rubric_hash, "source": source, "review_reason": review_reason,
+        }, time.time())
+
+
+def save_grades_bulk(records):
+    """Insert many grade records (dicts with save_grade's fields) in one transaction."""
+    if not records:
+        return 0
+    conn = _connect()
+    now = time.time()
+    with conn:
+        for record in records:
+            _upsert(conn, record, now)
+    return len(records)
+
+
+def update_grade(course_id, assignment_id, student_id, score=None, feedback=None):
+    """Apply an instructor edit to a stored grade (score and/or feedback)."""
+    conn = _connect()
+    with conn:
+        row = conn.execute(
+            "SELECT id FROM grades WHERE course_id = ? AND assignment_id = ? AND student_id = ?",
+            (str(course_id), str(assignment_id), str(student_id))
+        ).fetchone()
+        if row is None:
+            return False
+        # An instructor edit counts as the review
+        if score is not None:
+            conn.execute("UPDATE grades SET score = ?, updated_at = ?, source = 'edited', review_reason = NULL WHERE id = ?",
+                         (score, time.time(), row["id"]))
+        if feedback is not None:
+            conn.execute("UPDATE grades SET feedback = ?, updated_at = ?, source = 'edited', review_reason = NULL WHERE id = ?",
+                         (feedback, time.time(), row["id"]))
+            conn.execute("DELETE FROM criterion_scores WHERE grade_id = ?", (row["id"],))
+            conn.executemany(
+                "INSERT INTO criterion_scores VALUES (?, ?, ?, ?)",
+                [(row["id"], n, p, m) for n, p, m in parse_criterion_scores(feedback)]
+            )
+    return True
+
+
+def set_post_status(course_id, assignment_id, student_id, status, error=None):
+    """Record the outcome of posting a grade to Canvas."""
+    now = time.time()
+    conn = _connect()
+    with conn:
+        # updated_at moves too, so result_set_version changes and cached views see the new status
+        conn.execute(
+            "UPDATE grades SET post_status = ?, post_error = ?, posted_at = ?, updated_at = ? "
+            "WHERE course_id = ? AND assignment_id = ? AND student_id = ?",
+            (status, error, now if status == POST_POSTED else None, now,
+             str(course_id), str(assignment_id), str(student_id))
+        )
+
+
+def get_grade(course_id, assignment_id, student_id, with_criteria=True):
+    """Fetch one stored grade as a dict, or None."""
+    conn = _connect()
+    row = conn.execute(
+        "SELECT * FROM grades WHERE course_id = ? AND assignment_id = ? AND student_id = ?",
+        (str(course_id), str(assignment_id), str(student_id))
+    ).fetchone()
+    if row is None:
+        return None
+    grade = dict(row)
+    if with_criteria:
+        grade["criteria"] = [
+            dict(r) for r in conn.execute(
+                "SELECT criterion, points, max_points FROM criterion_scores WHERE grade_id = ?", (row["id"],)
+            )
+        ]
+    return grade
+
+
+def list_grades(course_id, assignment_id, include_feedback=False):
+    """All stored grades for an assignment (feedback text omitted unless asked for)."""
+    columns = "*" if include_feedback else (
+        "id, course_id, assignment_id, student_id, student_name, score, max_score, model, "
+        "rubric_hash, source, created_at, updated_at, post_status, posted_at, review_reason"
+    )
+    rows = _connect().execute(
+        f"SELECT {columns} FROM grades WHERE course_id = ? AND assignment_id = ? ORDER BY student_id",
+        (str(course_id), str(assignment_id))
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def list_criterion_scores(course_id, assignment_id):
+    """(student_id, criterion, points, max_points) rows for an assignment."""
+    rows = _connect().execute(
+        """
+        SELECT g.student_id, c.criterion, c.points, c.max_points
+        FROM criterion_scores c JOIN grades g ON g.id = c.grade_id
+        WHERE g.course_id = ? AND g.assignment_id = ?
+        """,
+        (str(course_id), str(assignment_id))
+    ).fetchall()
+    return [tuple(r) for r in rows]
+
+
+def graded_student_ids(course_id, assignment_id):
+    """Set of student ids that already have a stored grade."""
+    rows = _connect().execute(
+        "SELECT student_id FROM grades WHERE course_id = ? AND assignment_id = ?",
+        (str(course_id), str(assignment_id))
+    ).fetchall()
+    return {r[0] for r in rows}
+
+
+def result_set_version(course_id, assignment_id):
+    """Cheap version stamp for an assignment's grades; changes whenever a grade is written."""
+    row = _connect().execute(
+        "SELECT COUNT(*), MAX(updated_at) FROM grades WHERE course_id = ? AND assignment_id = ?",
+        (str(course_id), str(assignment_id))
+    ).fetchone()
+    return f"{row[0]}:{row[1] or 0}"
@@ -0,0 +1,158 @@
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from utils.cache_utils import cache_path, content_hash
+from utils.llm_utils import grading_llm
+from utils.similarity import MinHasher, LSHIndex, estimate_jaccard, normalize_text, shingles
+from utils.tracing import logger, current_span
+
+DB_PATH = cache_path("grading_cache.sqlite")
+
+# Set GRADING_CACHE=0 to always call the LLM
+CACHE_ENABLED = os.getenv("GRADING_CACHE", "1") != "0"
+# Minimum estimated Jaccard similarity for reusing a cached grade
+SIMILARITY_THRESHOLD = float(os.getenv("GRADING_CACHE_THRESHOLD", "0.9"))
+
+NUM_PERM = 128
+BANDS = 32
+
+_hasher = MinHasher(num_perm=NUM_PERM)
+_lock = threading.Lock()
+_local = threading.local()
+# rubric hash -> (LSHIndex, {entry id: signature})
+_indexes = {}
+
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS grading_cache (
+                id INTEGER PRIMARY KEY,
+                rubric_hash TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                score REAL,
+                feedback TEXT NOT NULL,
+                model TEXT,
+                created_at REAL NOT NULL,
+                UNIQUE (rubric_hash, text_hash)
+            )
+        """)
+        _local.conn = conn
+    return conn
+
+
+def _index_for(rubric_key):
+    """Lazily build the LSH index for one rubric from the stored signatures."""
+    with _lock:
+        if rubric_key not in _indexes:
+            lsh = LSHIndex(bands=BANDS, rows=NUM_PERM // BANDS)
+            signatures = {}
+            rows = _connect().execute(
+                "SELECT id, signature FROM grading_cache WHERE rubric_hash = ?", (rubric_key,)
+            ).fetchall()
+            for entry_id, blob in rows:
+                signature = np.frombuffer(blob, dtype=np.uint64)
+                lsh.add(entry_id, signature)
+                signatures[entry_id] = signature
+            _indexes[rubric_key] = (lsh, signatures)
+        return _indexes[rubric_key]
+
+
+def _fetch(entry_id):
+    row = _connect().execute(
+        "SELECT score, feedback, model FROM grading_cache WHERE id = ?", (entry_id,)
+    ).fetchone()
+    return {"score": row[0], "feedback": row[1], "model": row[2]} if row else None
+
+
+def lookup(submission, rubric, threshold=SIMILARITY_THRESHOLD):
+    """Find a cached grade for the same or a near-identical submission under the same rubric.
+
+    Returns:
+        dict: score, feedback, model, similarity and cache_hit ("exact"/"similar"), or None
+    """
+    rubric_key = content_hash(rubric)
+    text_hash = content_hash(normalize_text(submission))
+    row = _connect().execute(
+        "SELECT id FROM grading_cache WHERE rubric_hash = ? AND text_hash = ?", (rubric_key, text_hash)
+    ).fetchone()
+    if row:
+        cached = _fetch(row[0])
+        cached.update(similarity=1.0, cache_hit="exact")
+        return cached
+
+    signature = _hasher.signature(shingles(submission))
+    lsh, signatures = _index_for(rubric_key)
+    with _lock:
+        candidates = [(estimate_jaccard(signature, signatures[c]), c) for c in lsh.query(signature)]
+    if not candidates:
+        return None
+    similarity, entry_id = max(candidates)
+    if similarity < threshold:
+        return None
+    cached = _fetch(entry_id)
+    if cached:
+        cached.update(similarity=similarity, cache_hit="similar")
+    return cached
+
+
+def store(submission, rubric, result):
+    """Remember an LLM grade for later reuse."""
+    rubric_key = content_hash(rubric)
+    text_hash = content_hash(normalize_text(submission))
+    signature = _hasher.signature(shingles(submission))
+    conn = _connect()
+    with conn:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO grading_cache (rubric_hash, text_hash, signature, score, feedback, model, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (rubric_key, text_hash, signature.tobytes(), result.get("score"), result.get("feedback", ""),
+             result.get("model"), time.time())
+        )
+    if cursor.rowcount and cursor.lastrowid:
+        with _lock:
+            if rubric_key in _indexes:
+                lsh, signatures = _indexes[rubric_key]
+                lsh.add(cursor.lastrowid, signature)
+                signatures[cursor.lastrowid] = signature
+
+
+def grade_with_cache(submission, rubric, threshold=SIMILARITY_THRESHOLD, use_cache=CACHE_ENABLED, exemplars=""):
+    """grading_llm (single or cascade mode) with an exact/near-duplicate cache in front of it.
+
+    Reused grades carry ``cache_hit``, ``similarity`` and a ``review_reason`` so
+    the instructor can confirm them before they are posted. ``exemplars`` is
+    only sent to the LLM on a miss; it does not change the cache key.
+    """
+    span = current_span()
+    if use_cache:
+        try:
+            cached = lookup(submission, rubric, threshold)
+        except Exception as e:
+            logger.warning("Grading cache lookup failed: %s", e)
+            cached = None
+        if span is not None:
+            span.set("cache.hit", bool(cached))
+        if cached:
+            cached["review_reason"] = (
+                f"grade reused from {'an identical' if cached['cache_hit'] == 'exact' else 'a near-identical'} "
+                f"submission (similarity {cached['similarity']:.2f})"
+            )
+            logger.debug("Grading cache %s hit (similarity %.2f)", cached["cache_hit"], cached["similarity"])
+            return cached
+
+    result = grading_llm(submission, rubric, exemplars=exemplars)
+    if use_cache:
+        try:
+            store(submission, rubric, result)
+        except Exception as e:
+            logger.warning("Grading cache store failed: %s", e)
+    return result
@@ -0,0 +1,37 @@
+import re
+
+
+def clean_html_text(html_content):
+    """Clean HTML content and format it for readability."""
+    if not html_content:
+        return ""
+    
+    # Imported on first use: bs4 is only needed once a submission is cleaned
+    from bs4 import BeautifulSoup
+
+    # Parse HTML with BeautifulSoup
+    soup = BeautifulSoup(html_content, 'html.parser')
+    
+    # Get text while preserving some structure
+    text = ""
+    for element in soup.descendants:
+        if element.name == 'h1':
+            text += f"\n# {element.get_text().strip()}\n\n"
+        elif element.name == 'h2':
+            text += f"\n## {element.get_text().strip()}\n\n"
+        elif element.name == 'h3':
+            text += f"\n### {element.get_text().strip()}\n\n"
+        elif element.name == 'p':
+            text += f"{element.get_text().strip()}\n\n"
+        elif element.name == 'br':
+            text += "\n"
+        elif element.name == 'ul' or element.name == 'ol':
+            for li in element.find_all('li'):
+                text += f"• {li.get_text().strip()}\n"
+            text += "\n"
+    
+    # Clean up extra whitespace
+    text = re.sub(r'\n\s*\n', '\n\n', text)
+    text = text.strip()
+    
+    return text
@@ -0,0 +1,154 @@
+import ast
+import json
+import re
+
+from utils.tracing import logger
+
+FENCE_PATTERN = re.compile(r"```(?:json|JSON|python)?\s*(.*?)```", re.DOTALL)
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+REPAIR_PROMPT = """The following text was supposed to be valid JSON but could not be parsed ({error}).
+Return ONLY the corrected JSON, with no explanation and no code fences."""
+
+
+class LLMOutputError(ValueError):
+    """Raised when LLM output cannot be parsed into the expected structure."""
+
+
+def _candidates(text: str):
+    """Yield progressively more aggressive cleanups of raw LLM output."""
+    text = text.strip()
+    yield text
+    fenced = FENCE_PATTERN.search(text)
+    if fenced:
+        text = fenced.group(1).strip()
+        yield text
+    # Cut to the outermost object/array when the model adds prose around it
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if starts:
+        start = min(starts)
+        end = max(text.rfind("}"), text.rfind("]"))
+        if end > start:
+            text = text[start:end + 1]
+            yield text
+    yield TRAILING_COMMA.sub(r"\1", text)
+
+
+def loads_lenient(text: str):
+    """Parse JSON from LLM output without eval().
+
+    Handles code fences, surrounding prose, trailing commas and Python-style
+    literals (single quotes, True/False/None).
+
+    Raises:
+        LLMOutputError: If no candidate parses
+    """
+    if not isinstance(text, str) or not text.strip():
+        raise LLMOutputError("empty LLM output")
+    last_error = None
+    for candidate in _candidates(text):
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError as e:
+            last_error = e
+        try:
+            # Literal-only evaluation: no names, calls or attribute access
+            return ast.literal_eval(candidate)
+        except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+            pass
+    raise LLMOutputError(f"invalid JSON: {last_error}")
+
+
+def parse_llm_json(text: str, validator=None, repair=None):
+    """Parse and validate LLM JSON output with at most one repair attempt.
+
+    Args:
+        text (str): Raw LLM output
+        validator (callable): Optional; takes the parsed value and returns it
+            (possibly normalized) or raises LLMOutputError
+        repair (callable): Optional; takes (bad_text, error_message) and returns
+            new text, typically from a short "fix this JSON" LLM call
+
+    Returns:
+        The parsed (and validated) value
+
+    Raises:
+        LLMOutputError: If the output is still invalid after the repair attempt
+    """
+    try:
+        value = loads_lenient(text)
+        return validator(value) if validator else value
+    except LLMOutputError as e:
+        if repair is None:
+            raise
+        logger.info("Repairing malformed LLM output: %s", e)
+        repaired = repair(text, str(e))
+        value = loads_lenient(repaired)
+        return validator(value) if validator else value
+
+
+def repair_messages(bad_text: str, error: str):
+    """Build the chat messages for a targeted JSON repair call."""
+    return [
+        {"role": "system", "content": REPAIR_PROMPT.format(error=error)},
+        {"role": "user", "content": bad_text},
+    ]
+
+
+def validate_intent(value):
+    """Validate the router's {"intent": ..., "entities": {...}} output."""
+    if not isinstance(value, dict) or not isinstance(value.get("intent"), str):
+        raise LLMOutputError("expected an object with a string 'intent'")
+    entities = value.get("entities") or {}
+    if not isinstance(entities, dict):
+        raise LLMOutputError("'entities' must be an object")
+    # IDs are compared as strings everywhere else
+    for key in ("course_id", "assignment_id", "student_id"):
+        if key in entities and entities[key] is not None:
+            entities[key] = str(entities[key])
+    return {"intent": value["intent"], "entities": entities}
+
+
+def validate_rubric(value):
+    """Validate a structured rubric: a list of criteria with description and points."""
+    if isinstance(value, dict):
+        # Models sometimes wrap the list, e.g. {"criteria": [...]}
+        lists = [v for v in value.values() if isinstance(v, list)]
+        if len(lists) == 1:
+            value = lists[0]
+    if not isinstance(value, list) or not value:
+        raise LLMOutputError("expected a non-empty list of criteria")
+    for criterion in value:
+        if not isinstance(criterion, dict) or "description" not in criterion:
+            raise LLMOutputError("each criterion needs a 'description'")
+        try:
+            criterion["points"] = float(criterion.get("points", 0) or 0)
+        except (TypeError, ValueError):
+            raise LLMOutputError(f"non-numeric points for {criterion['description']!r}")
+        ratings = criterion.get("ratings", [])
+        if not isinstance(ratings, list):
+            raise LLMOutputError(f"'ratings' must be a list for {criterion['description']!r}")
+    return value
+
+
+def validate_structured_grade(value):
+    """Validate a structured grade: per-criterion points, a total and a 0-1 confidence."""
+    if not isinstance(value, dict) or not isinstance(value.get("criteria"), list) or not value["criteria"]:
+        raise LLMOutputError("expected an object with a non-empty 'criteria' list")
+    for criterion in value["criteria"]:
+        if not isinstance(criterion, dict) or "name" not in criterion:
+            raise LLMOutputError("each criterion needs a 'name'")
+        try:
+            criterion["points"] = float(criterion.get("points"))
+            criterion["max_points"] = float(criterion.get("max_points"))
+        except (TypeError, ValueError):
+            raise LLMOutputError(f"non-numeric points for {criterion['name']!r}")
+    try:
+        value["total"] = float(value.get("total"))
+        value["max_total"] = float(value.get("max_total") or sum(c["max_points"] for c in value["criteria"]))
+        value["confidence"] = float(value.get("confidence"))
+    except (TypeError, ValueError):
+        raise LLMOutputError("'total', 'max_total' and 'confidence' must be numbers")
+    if not 0.0 <= value["confidence"] <= 1.0:
+        raise LLMOutputError("'confidence' must be between 0 and 1")
+    return value
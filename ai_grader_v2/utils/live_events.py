@@ -0,0 +1,307 @@
+"""Grade new submissions as they arrive, from Canvas Live Events.
+
+A small HTTP receiver for the ``submission_created`` / ``submission_updated``
+events of a Canvas Live Events (Data Services) HTTPS subscription. Each new
+attempt is recorded once, its submission is refetched from Canvas and the
+student is queued on the background PreGrader, so the grade is usually in
+the grade store seconds after the student submits.
+
+Run from ai_grader_v2/:
+    python -m utils.live_events --port 8765 --assignments 473
+    python -m utils.live_events --dry-run        # log what would be graded
+
+Events are rejected unless LIVE_EVENTS_SECRET is set; pass --insecure (or
+LIVE_EVENTS_INSECURE=1) to accept unauthenticated events during development.
+
+Try it locally (with LIVE_EVENTS_SECRET=dev-secret):
+    curl -X POST localhost:8765/live_events -H 'Authorization: Bearer dev-secret' \\
+      -H 'Content-Type: application/json' -d \\
+      '{"metadata": {"event_name": "submission_created", "context_type": "Course", "context_id": "121"},
+        "body": {"assignment_id": "473", "user_id": "1005", "attempt": 1, "workflow_state": "submitted",
+                 "submitted_at": "2025-03-01T12:00:00Z"}}'
+"""
+import argparse
+import hmac
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from api.canvas_api import get_submission
+from utils.cache_utils import cache_path
+from utils.tracing import logger, span
+
+DB_PATH = cache_path("live_events.sqlite")
+
+LIVE_EVENTS_HOST = os.getenv("LIVE_EVENTS_HOST", "127.0.0.1")
+LIVE_EVENTS_PORT = int(os.getenv("LIVE_EVENTS_PORT", "8765"))
+# Shared secret expected as "Authorization: Bearer <secret>" or ?token=<secret>; empty rejects every event
+LIVE_EVENTS_SECRET = os.getenv("LIVE_EVENTS_SECRET", "")
+# Development only: accept events from any sender when no secret is set
+LIVE_EVENTS_INSECURE = os.getenv("LIVE_EVENTS_INSECURE", "0") == "1"
+# Comma-separated assignment ids to grade automatically; empty grades every assignment
+LIVE_EVENTS_ASSIGNMENTS = os.getenv("LIVE_EVENTS_ASSIGNMENTS", "")
+
+SUBMISSION_EVENTS = {"submission_created", "submission_updated"}
+# submission_updated also fires for grades and comments; only new work is graded
+GRADABLE_STATES = {"submitted", "pending_review"}
+
+# Live Events carry global ids (shard * 10**13 + local id); the grader keys everything by local id
+_SHARD_FACTOR = 10 ** 13
+
+_local = threading.local()
+
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS seen_attempts (
+                course_id TEXT NOT NULL,
+                assignment_id TEXT NOT NULL,
+                student_id TEXT NOT NULL,
+                attempt TEXT NOT NULL,
+                submitted_at TEXT NOT NULL,
+                received_at REAL NOT NULL,
+                PRIMARY KEY (course_id, assignment_id, student_id, attempt, submitted_at)
+            )
+        """)
+        _local.conn = conn
+    return conn
+
+
+def _first_sighting(event):
+    """Record an attempt; False if it was seen before (Canvas retries and duplicate updates)."""
+    conn = _connect()
+    with conn:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO seen_attempts VALUES (?, ?, ?, ?, ?, ?)",
+            (*_attempt_key(event), time.time()),
+        )
+    return cursor.rowcount == 1
+
+
+def _forget(event):
+    """Let a redelivery of this attempt through again (used when handling it failed)."""
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "DELETE FROM seen_attempts WHERE course_id = ? AND assignment_id = ? AND student_id = ?"
+            " AND attempt = ? AND submitted_at = ?",
+            _attempt_key(event),
+        )
+
+
+def _attempt_key(event):
+    return (event["course_id"], event["assignment_id"], event["student_id"],
+            str(event["attempt"]), event["submitted_at"] or "")
+
+
+def local_id(value):
+    """Canvas local id for a (possibly global) id, as a string."""
+    if value is None or not str(value).isdigit():
+        return None
+    return str(int(value) % _SHARD_FACTOR)
+
+
+def parse_event(payload):
+    """The gradable submission an event refers to, as a dict, or (None, reason) when it is ignored."""
+    metadata = payload.get("metadata") or {}
+    body = payload.get("body") or {}
+    name = metadata.get("event_name")
+    if name not in SUBMISSION_EVENTS:
+        return None, f"event {name!r} not handled"
+    if body.get("workflow_state") not in GRADABLE_STATES:
+        return None, f"submission is {body.get('workflow_state')!r}"
+    course_id = metadata.get("context_id") if metadata.get("context_type") == "Course" else body.get("course_id")
+    event = {
+        "name": name,
+        "course_id": local_id(course_id),
+        "assignment_id": local_id(body.get("assignment_id")),
+        "student_id": local_id(body.get("user_id")),
+        "attempt": body.get("attempt"),
+        "submitted_at": body.get("submitted_at"),
+    }
+    if not (event["course_id"] and event["assignment_id"] and event["student_id"]):
+        return None, "missing course, assignment or user id"
+    return event, None
+
+
+class LiveEventHandler:
+    """Filters, dedupes and queues submission events; the HTTP receiver only parses and acknowledges."""
+
+    def __init__(self, assignments=None, dry_run=False, workers=2):
+        self.assignments = {local_id(a) for a in assignments or ()}
+        self.dry_run = dry_run
+        self.counts = {"received": 0, "queued": 0, "duplicate": 0, "ignored": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="live-events")
+
+    def _count(self, status):
+        with self._lock:
+            self.counts[status] += 1
+
+    def handle(self, payload):
+        """Handle one event; returns "queued", "duplicate" or "ignored: <reason>"."""
+        self._count("received")
+        event, reason = parse_event(payload)
+        if event and self.assignments and event["assignment_id"] not in self.assignments:
+            event, reason = None, f"assignment {event['assignment_id']} not enabled"
+        if event is None:
+            self._count("ignored")
+            logger.debug("Ignoring live event: %s", reason)
+            return f"ignored: {reason}"
+        if not _first_sighting(event):
+            self._count("duplicate")
+            return "duplicate"
+        # Canvas expects a quick acknowledgement; fetching and queueing happen off the request thread
+        self._executor.submit(self._trigger, event)
+        return "queued"
+
+    def _trigger(self, event):
+        course_id, assignment_id, student_id = event["course_id"], event["assignment_id"], event["student_id"]
+        try:
+            with span("live_events.trigger", event=event["name"], student_id=student_id):
+                if self.dry_run:
+                    logger.info("Would grade %s/%s student %s (attempt %s)",
+                                course_id, assignment_id, student_id, event["attempt"])
+                    self._count("queued")
+                    # Dry runs must not keep a later real run from grading the attempt
+                    _forget(event)
+                    return
+                # Imported here so --help and dry runs don't load the grading stack
+                from utils.pregrader import get_pregrader
+                from utils.prefetch import cached_rubric, refresh_submission
+
+                # The event body may be truncated and has no attachment urls; Canvas has the full submission
+                submission = get_submission(course_id, assignment_id, student_id)
+                if submission is None:
+                    raise RuntimeError("submission could not be fetched")
+                refresh_submission(course_id, assignment_id, submission)
+                rubric = cached_rubric(course_id, assignment_id)
+                if not rubric or isinstance(rubric, str):
+                    raise RuntimeError("assignment has no rubric")
+                get_pregrader().enqueue(course_id, assignment_id, student_id, rubric)
+            self._count("queued")
+            logger.info("Queued %s/%s student %s for grading (%s)", course_id, assignment_id, student_id, event["name"])
+        except Exception as e:
+            self._count("failed")
+            logger.warning("Could not queue live event for student %s: %s", student_id, e)
+            _forget(event)
+
+
+class LiveEventReceiver:
+    """HTTP endpoint for a Canvas Live Events subscription (POST, one event or a JSON list per request)."""
+
+    def __init__(self, handler=None, host=LIVE_EVENTS_HOST, port=LIVE_EVENTS_PORT, secret=LIVE_EVENTS_SECRET,
+                 insecure=LIVE_EVENTS_INSECURE):
+        self.handler = handler or LiveEventHandler()
+        self.secret = secret
+        self.insecure = insecure
+        if not secret:
+            if insecure:
+                logger.warning("LIVE_EVENTS_SECRET is not set; accepting live events from any sender")
+            else:
+                logger.warning("LIVE_EVENTS_SECRET is not set; every live event will be rejected")
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/live_events"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="live-events", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _authorized(self, headers, query):
+        if not self.secret:
+            return self.insecure
+        token = headers.get("Authorization", "").removeprefix("Bearer ").strip() or query.get("token", [""])[0]
+        return hmac.compare_digest(token, self.secret)
+
+    def _make_handler(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if urlparse(self.path).path != "/health":
+                    return self._send(404, {"error": "not found"})
+                self._send(200, {"status": "ok", **receiver.handler.counts})
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                if not receiver._authorized(self.headers, parse_qs(url.query)):
+                    return self._send(401, {"error": "unauthorized"})
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"null")
+                except ValueError:
+                    return self._send(400, {"error": "invalid JSON"})
+                events = payload if isinstance(payload, list) else [payload]
+                if not all(isinstance(event, dict) for event in events):
+                    return self._send(400, {"error": "expected an event object or a list of events"})
+                self._send(200, {"results": [receiver.handler.handle(event) for event in events]})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=LIVE_EVENTS_HOST)
+    parser.add_argument("--port", type=int, default=LIVE_EVENTS_PORT)
+    parser.add_argument("--assignments", nargs="*",
+                        default=[a for a in LIVE_EVENTS_ASSIGNMENTS.split(",") if a.strip()],
+                        help="Assignment ids to grade (default: all)")
+    parser.add_argument("--dry-run", action="store_true", help="Log submissions instead of grading them")
+    parser.add_argument("--insecure", action="store_true", default=LIVE_EVENTS_INSECURE,
+                        help="Accept events without a secret (development only)")
+    args = parser.parse_args()
+
+    receiver = LiveEventReceiver(LiveEventHandler(args.assignments, args.dry_run), args.host, args.port,
+                                 insecure=args.insecure)
+    logger.info("Listening for Canvas live events on %s", receiver.url)
+    try:
+        receiver.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
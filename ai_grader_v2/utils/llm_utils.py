@@ -1,57 +1,276 @@
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-from langchain.chains import LLMChain
+import contextvars
+import os
+import statistics
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from utils.grade_store import CRITERION_SCORE
+from utils.json_utils import LLMOutputError, parse_llm_json, validate_structured_grade
+from utils.tracing import logger, span, current_span, record_llm_usage
+from utils.usage_store import record_usage, usage_context
 
-def strict_grading_llm(submission: str, rubric: str) -> dict:
+
+class LLMBackend(ABC):
+    """Minimal chat-completion interface used for the lightweight router tasks.
+
+    Backends take OpenAI-style message dicts and return the reply text.
     """
-    Returns a configured LLMChain for grading with a stricter evaluation prompt.
-    
-    Args:
-        submission (str): The student's submission text
-        rubric (str): The formatted rubric text
-        
-    Returns:
-        dict: Contains score and detailed feedback
+    name = "base"
+
+    @abstractmethod
+    def complete(self, messages, temperature=0.0):
+        """Return the reply text for ``messages``."""
+
+    def complete_n(self, messages, n, temperature=0.0):
+        """Return ``n`` sampled replies, issued concurrently so they cost one round-trip of latency."""
+        if n <= 1:
+            return [self.complete(messages, temperature)]
+        with ThreadPoolExecutor(max_workers=n) as pool:
+            # Each sample runs in a copy of the caller's context so spans and usage attribution carry over
+            futures = [pool.submit(contextvars.copy_context().run, self.complete, messages, temperature)
+                       for _ in range(n)]
+            return [future.result() for future in futures]
+
+
+def account_llm_usage(prompt_tokens, completion_tokens, model=None):
+    """Record one call's tokens on the current span and in the usage/cost store."""
+    record_llm_usage(prompt_tokens, completion_tokens, model)
+    try:
+        record_usage(model, prompt_tokens, completion_tokens)
+    except Exception as e:
+        # Accounting must never break grading
+        logger.warning("Failed to record LLM usage: %s", e)
+
+
+def _record_message_usage(message, model=None):
+    """Account token usage reported on a LangChain chat message."""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        account_llm_usage(usage.get("input_tokens"), usage.get("output_tokens"), model)
+        return
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    account_llm_usage(token_usage.get("prompt_tokens"), token_usage.get("completion_tokens"), model)
+
+
+def _chat_openai(**kwargs):
+    # langchain is imported on first use so importing this module stays cheap
+    from langchain.chat_models import ChatOpenAI
+    return ChatOpenAI(**kwargs)
+
+
+class OpenAIBackend(LLMBackend):
+    """Remote backend using the OpenAI chat API (the original GPT-4 path)."""
+    name = "openai"
+
+    def __init__(self, model="gpt-4", temperature=0):
+        self.model = model
+        self.temperature = temperature
+        # temperature -> client for single calls
+        self._clients = {}
+        # (n, temperature) -> client for multi-sample calls
+        self._sample_clients = {}
+
+    def complete(self, messages, temperature=None):
+        temperature = self.temperature if temperature is None else temperature
+        client = self._clients.get(temperature)
+        if client is None:
+            client = _chat_openai(model=self.model, temperature=temperature)
+            self._clients[temperature] = client
+        with span("llm.light", backend=self.name, model=self.model):
+            response = client.invoke(messages)
+            _record_message_usage(response, self.model)
+        return response.content
+
+    def complete_n(self, messages, n, temperature=None):
+        """Request ``n`` choices in a single API call via the ``n`` parameter."""
+        if n <= 1:
+            return [self.complete(messages, temperature)]
+        from langchain_core.messages import convert_to_messages
+        temperature = self.temperature if temperature is None else temperature
+        client = self._sample_clients.get((n, temperature))
+        if client is None:
+            client = _chat_openai(model=self.model, temperature=temperature, n=n)
+            self._sample_clients[(n, temperature)] = client
+        with span("llm.samples", backend=self.name, model=self.model, samples=n):
+            result = client.generate([convert_to_messages(messages)])
+            token_usage = (result.llm_output or {}).get("token_usage") or {}
+            account_llm_usage(token_usage.get("prompt_tokens"), token_usage.get("completion_tokens"), self.model)
+        return [generation.text for generation in result.generations[0]]
+
+
+class LlamaCppBackend(LLMBackend):
+    """CPU-only local backend for a small quantized GGUF model via llama.cpp.
+
+    Requires the optional ``llama-cpp-python`` package and a model file,
+    e.g. ``LOCAL_MODEL_PATH=models/qwen2.5-1.5b-instruct-q4_k_m.gguf``.
+    """
+    name = "llamacpp"
+
+    def __init__(self, model_path, n_ctx=4096, n_threads=None, max_tokens=1024):
+        self.model_path = model_path
+        self.n_ctx = n_ctx
+        self.n_threads = n_threads or os.cpu_count()
+        self.max_tokens = max_tokens
+        self._model = None
+
+    def _load(self):
+        if self._model is None:
+            from llama_cpp import Llama
+            self._model = Llama(
+                model_path=self.model_path,
+                n_ctx=self.n_ctx,
+                n_threads=self.n_threads,
+                verbose=False,
+            )
+        return self._model
+
+    def complete(self, messages, temperature=0.0):
+        with span("llm.light", backend=self.name, model=os.path.basename(self.model_path)):
+            model = self._load()
+            result = model.create_chat_completion(
+                messages=messages,
+                temperature=temperature or 0.0,
+                max_tokens=self.max_tokens,
+            )
+            usage = result.get("usage") or {}
+            account_llm_usage(usage.get("prompt_tokens"), usage.get("completion_tokens"), "llamacpp")
+        return result["choices"][0]["message"]["content"]
+
+
+class FallbackBackend(LLMBackend):
+    """Try the primary backend first and fall back to the secondary on any error."""
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+        self.name = f"{primary.name}->{fallback.name}"
+
+    def complete(self, messages, temperature=0.0):
+        try:
+            return self.primary.complete(messages, temperature)
+        except Exception as e:
+            parent = current_span()
+            if parent is not None:
+                parent.add("llm.retries")
+            logger.warning("%s backend failed, falling back to %s: %s", self.primary.name, self.fallback.name, e)
+            return self.fallback.complete(messages, temperature)
+
+
+_light_backend = None
+
+
+def create_backend(kind=None):
+    """Build a backend for light tasks from the environment.
+
+    LIGHT_LLM_BACKEND selects ``openai`` (default) or ``llamacpp``; the local
+    backend reads its model from LOCAL_MODEL_PATH and falls back to GPT-4 if
+    the model cannot be loaded or fails on a request.
+    """
+    kind = (kind or os.getenv("LIGHT_LLM_BACKEND", "openai")).lower()
+    remote = OpenAIBackend(model=os.getenv("LIGHT_LLM_MODEL", "gpt-4"), temperature=0)
+    if kind == "llamacpp":
+        model_path = os.getenv("LOCAL_MODEL_PATH")
+        if not model_path:
+            logger.warning("LIGHT_LLM_BACKEND=llamacpp but LOCAL_MODEL_PATH is not set; using OpenAI")
+            return remote
+        return FallbackBackend(LlamaCppBackend(model_path), remote)
+    return remote
+
+
+def get_light_backend():
+    """Return the shared backend used for intent parsing, replies and rubric structuring."""
+    global _light_backend
+    if _light_backend is None:
+        _light_backend = create_backend()
+    return _light_backend
+
+
+def set_light_backend(backend):
+    """Override the shared light-task backend (used by benchmarks)."""
+    global _light_backend
+    _light_backend = backend
+
+
+def light_completion(messages, temperature=0.0, purpose="light"):
+    """Run a light (non-grading) chat completion on the configured backend.
+
+    ``purpose`` (e.g. "intent", "response", "rubric_structure") labels the call in the usage store.
+    """
+    with usage_context(purpose=purpose):
+        return get_light_backend().complete(messages, temperature)
+
+
+def time_completion(backend, messages, repeats=3):
+    """Time ``repeats`` calls of ``backend.complete`` and return latencies in seconds."""
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        backend.complete(messages)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+GRADING_SYSTEM_PROMPT = (
+    "You are a strict but fair grading assistant. Your task is to:\n"
+    "1. Grade the submission exactly according to the provided rubric structure\n"
+    "2. For each criterion in the rubric:\n"
+    "   - Provide the criterion name and points awarded\n"
+    "   - Break down sub-criteria points if specified\n"
+    "   - Give specific feedback explaining the score\n"
+    "3. Ensure point allocations match the rubric exactly\n"
+    "4. Sum up the total score accurately\n"
+    "5. Provide a summary of strengths and areas for improvement\n\n"
+    "Format your response as:\n"
+    "Overall Score: [total]/[maximum]\n\n"
+    "[For each criterion:]\n"
+    "Criterion Name: [points awarded]/[total points]\n"
+    "[Sub-criteria breakdown if any]\n"
+    "Feedback: [specific feedback]\n\n"
+    "[After all criteria:]\n"
+    "Strengths: [summary of strong points]\n"
+    "Areas for Improvement: [specific suggestions]\n\n"
+    "IMPORTANT: Follow the exact point structure and criteria names from the provided rubric."
+)
+
+GRADING_HUMAN_PROMPT = (
+    "Rubric:\n{rubric}\n\n"
+    "Submission:\n{submission}\n\n"
+    "Please provide a detailed evaluation following the format specified."
+)
+
+# Prepended to the human prompt when calibration exemplars are available
+GRADING_EXEMPLAR_PROMPT = (
+    "Calibration examples (instructor-approved grades for similar submissions). "
+    "Match their strictness, but grade the new submission on its own merits:\n\n"
+    "{exemplars}\n\n=====\n\n"
+)
+
+# When set, grading calls go to this backend instead of the GPT-4 chain (benchmarks, tests)
+_grading_backend = None
+
+
+def set_grading_backend(backend):
+    """Override the backend used by strict_grading_llm; pass None to restore GPT-4."""
+    global _grading_backend
+    _grading_backend = backend
+
+
+_sampling_backend = None
+
+
+def _get_sampling_backend():
+    """The GPT-4 backend for sampled grading, built once so its per-(n, temperature) clients are reused."""
+    global _sampling_backend
+    if _sampling_backend is None:
+        _sampling_backend = OpenAIBackend(model="gpt-4", temperature=0.3)
+    return _sampling_backend
+
+
+def parse_grading_output(result: str) -> float:
+    """Extract the overall score from grading text.
+
+    Uses the 'Overall Score: X/Y' first line, otherwise sums 'Criterion: X/Y' lines.
     """
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", 
-         "You are a strict but fair grading assistant. Your task is to:\n"
-         "1. Grade the submission exactly according to the provided rubric structure\n"
-         "2. For each criterion in the rubric:\n"
-         "   - Provide the criterion name and points awarded\n"
-         "   - Break down sub-criteria points if specified\n"
-         "   - Give specific feedback explaining the score\n"
-         "3. Ensure point allocations match the rubric exactly\n"
-         "4. Sum up the total score accurately\n"
-         "5. Provide a summary of strengths and areas for improvement\n\n"
-         "Format your response as:\n"
-         "Overall Score: [total]/[maximum]\n\n"
-         "[For each criterion:]\n"
-         "Criterion Name: [points awarded]/[total points]\n"
-         "[Sub-criteria breakdown if any]\n"
-         "Feedback: [specific feedback]\n\n"
-         "[After all criteria:]\n"
-         "Strengths: [summary of strong points]\n"
-         "Areas for Improvement: [specific suggestions]\n\n"
-         "IMPORTANT: Follow the exact point structure and criteria names from the provided rubric."),
-        ("human", 
-         "Rubric:\n{rubric}\n\n"
-         "Submission:\n{submission}\n\n"
-         "Please provide a detailed evaluation following the format specified.")
-    ])
-    
-    chain = LLMChain(
-        llm=ChatOpenAI(model="gpt-4", temperature=0.3),
-        prompt=prompt
-    )
-    
-    # Run the chain
-    result = chain.run({
-        "rubric": rubric,
-        "submission": submission
-    })
-    
-    # Extract score and format feedback
     try:
         # Try to parse the score from the first line
         first_line = result.split('\n')[0]
@@ -70,8 +289,277 @@ def strict_grading_llm(submission: str, rubric: str) -> dict:
                         continue
     except:
         score = 0  # Default score if parsing fails
+    return score
+
+
+# Independent grading samples per submission; >1 enables self-consistency aggregation
+GRADING_SAMPLES = int(os.getenv("GRADING_SAMPLES", "1"))
+# Sample standard deviation of the total (points) above which a grade is flagged for review
+SAMPLE_STDEV_REVIEW = float(os.getenv("SAMPLE_STDEV_REVIEW", "5.0"))
+
+
+def aggregate_samples(texts, model) -> dict:
+    """Combine several grading samples: median per criterion, spread as a confidence signal.
+
+    The returned feedback is the sample closest to the aggregate, with its
+    score lines rewritten to the median values.
+
+    Returns:
+        dict: score, feedback, model, samples, score_stdev, criterion_stdev,
+        confidence (1 - mean per-criterion stdev / max points), and
+        review_reason when the samples disagree by more than SAMPLE_STDEV_REVIEW
+    """
+    per_sample = []
+    for text in texts:
+        criteria = {}
+        for name, points, max_points in CRITERION_SCORE.findall(text):
+            name = name.strip()
+            if name.lower() not in ("overall score", "score", "total"):
+                criteria.setdefault(name, (float(points), float(max_points)))
+        per_sample.append(criteria)
+
+    # Criteria every sample scored; otherwise fall back to the overall scores
+    shared = set(per_sample[0]).intersection(*per_sample[1:]) if per_sample[0] else set()
+    overall = [parse_grading_output(text) for text in texts]
+    medians, criterion_stdev, normalized = {}, {}, []
+    for name in shared:
+        points = [sample[name][0] for sample in per_sample]
+        max_points = per_sample[0][name][1]
+        medians[name] = statistics.median(points)
+        criterion_stdev[name] = statistics.pstdev(points)
+        if max_points:
+            normalized.append(criterion_stdev[name] / max_points)
+    score = round(sum(medians.values()), 2) if medians else statistics.median(overall)
+    score_stdev = statistics.stdev(overall) if len(overall) > 1 else 0.0
+
+    representative = min(range(len(texts)), key=lambda i: abs(overall[i] - score))
+    feedback = texts[representative]
+    if medians:
+        def rescore(match):
+            name = match.group(1).strip()
+            if name not in medians:
+                return match.group(0)
+            return f"{match.group(1)}: {medians[name]:g}/{match.group(3)}"
+        feedback = CRITERION_SCORE.sub(rescore, feedback)
+    lines = feedback.split("\n")
+    if "Score:" in lines[0] and "/" in lines[0]:
+        lines[0] = f"{lines[0].split(':')[0]}: {score:g}/{lines[0].split('/')[-1].strip()}"
+        feedback = "\n".join(lines)
+
+    result = {
+        "score": score,
+        "feedback": feedback,
+        "model": model,
+        "samples": len(texts),
+        "score_stdev": score_stdev,
+        "criterion_stdev": criterion_stdev,
+        "confidence": max(0.0, 1.0 - statistics.mean(normalized)) if normalized else None,
+    }
+    if score_stdev > SAMPLE_STDEV_REVIEW:
+        result["review_reason"] = f"grading samples disagreed (total score stdev {score_stdev:.1f} points)"
+    return result
+
+
+_strict_chains = {}
+
+
+def _strict_grading_chain(human_prompt):
+    """The GPT-4 grading LLMChain for a human prompt template, built on first use and reused."""
+    chain = _strict_chains.get(human_prompt)
+    if chain is None:
+        from langchain.chains import LLMChain
+        from langchain.prompts import ChatPromptTemplate
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", GRADING_SYSTEM_PROMPT),
+            ("human", human_prompt)
+        ])
+        chain = LLMChain(llm=_chat_openai(model="gpt-4", temperature=0.3), prompt=prompt)
+        _strict_chains[human_prompt] = chain
+    return chain
+
+
+def strict_grading_llm(submission: str, rubric: str, exemplars: str = "", samples: int = None) -> dict:
+    """
+    Returns a configured LLMChain for grading with a stricter evaluation prompt.
+    
+    Args:
+        submission (str): The student's submission text
+        rubric (str): The formatted rubric text
+        exemplars (str): Optional calibration block from utils.exemplar_store.format_exemplars
+        samples (int): Number of samples to aggregate (defaults to GRADING_SAMPLES)
         
+    Returns:
+        dict: Contains score and detailed feedback (plus spread statistics when sampled)
+    """
+    human_prompt = (GRADING_EXEMPLAR_PROMPT if exemplars else "") + GRADING_HUMAN_PROMPT
+    variables = {"rubric": rubric, "submission": submission}
+    if exemplars:
+        variables["exemplars"] = exemplars
+    messages = [
+        {"role": "system", "content": GRADING_SYSTEM_PROMPT},
+        {"role": "user", "content": human_prompt.format(**variables)}
+    ]
+
+    samples = samples or GRADING_SAMPLES
+    if samples > 1:
+        backend = _grading_backend or _get_sampling_backend()
+        model = getattr(backend, "model", backend.name)
+        with span("llm.grade", model=model, samples=samples, submission_chars=len(submission or "")) as grade_span, \
+                usage_context(purpose="grade"):
+            texts = backend.complete_n(messages, samples, temperature=0.3)
+            result = aggregate_samples(texts, model)
+            grade_span.set("grade.score_stdev", round(result["score_stdev"], 2))
+        return result
+
+    if _grading_backend is not None:
+        with span("llm.grade", model=_grading_backend.name, submission_chars=len(submission or "")), usage_context(purpose="grade"):
+            result = _grading_backend.complete(messages, temperature=0.3)
+        return {
+            "score": parse_grading_output(result),
+            "feedback": result,
+            "model": _grading_backend.name
+        }
+    
+    from langchain.callbacks import get_openai_callback
+    chain = _strict_grading_chain(human_prompt)
+    
+    # Run the chain
+    with span("llm.grade", model="gpt-4", submission_chars=len(submission or "")), usage_context(purpose="grade"):
+        with get_openai_callback() as usage:
+            result = chain.run(variables)
+        account_llm_usage(usage.prompt_tokens, usage.completion_tokens, "gpt-4")
+    
     return {
-        "score": score,
-        "feedback": result
-    }
\ No newline at end of file
+        "score": parse_grading_output(result),
+        "feedback": result,
+        "model": "gpt-4"
+    }
+
+
+# "single" (one strong-model call) or "cascade" (fast model first, escalate uncertain grades)
+GRADING_MODE = os.getenv("GRADING_MODE", "single")
+CASCADE_FAST_MODEL = os.getenv("CASCADE_FAST_MODEL", "gpt-4o-mini")
+# Fast-tier grades below this self-reported confidence go to the strong model
+CASCADE_MIN_CONFIDENCE = float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.75"))
+# Percentages where a few points change the letter grade, and how close counts as borderline
+GRADE_BOUNDARIES = (60.0, 70.0, 80.0, 90.0)
+CASCADE_BORDERLINE_MARGIN = float(os.getenv("CASCADE_BORDERLINE_MARGIN", "2.0"))
+
+FAST_GRADING_SYSTEM_PROMPT = (
+    "You are a strict but fair grading assistant. Grade the submission exactly according to the "
+    "provided rubric, criterion by criterion, using the rubric's criterion names and point values.\n\n"
+    "Respond with ONLY a JSON object of this shape:\n"
+    '{"criteria": [{"name": "<criterion name>", "points": <awarded>, "max_points": <available>, '
+    '"feedback": "<specific feedback>"}], "total": <sum of awarded points>, "max_total": <sum of available points>, '
+    '"confidence": <0.0-1.0, how sure you are that an expert grader would give the same scores>, '
+    '"strengths": "<summary>", "improvements": "<specific suggestions>"}\n\n'
+    "Lower your confidence when the submission is ambiguous, off-topic, unusually short or long, "
+    "or falls between two rating levels."
+)
+
+_fast_grading_backend = None
+
+
+def set_fast_grading_backend(backend):
+    """Override the fast first-tier backend used in cascade mode; pass None for CASCADE_FAST_MODEL."""
+    global _fast_grading_backend
+    _fast_grading_backend = backend
+
+
+def get_fast_grading_backend():
+    global _fast_grading_backend
+    if _fast_grading_backend is None:
+        _fast_grading_backend = OpenAIBackend(model=CASCADE_FAST_MODEL, temperature=0)
+    return _fast_grading_backend
+
+
+def render_structured_grade(grade) -> str:
+    """Render a structured grade in the same text format strict_grading_llm produces."""
+    lines = [f"Overall Score: {grade['total']:g}/{grade['max_total']:g}", ""]
+    for criterion in grade["criteria"]:
+        lines.append(f"{criterion['name']}: {criterion['points']:g}/{criterion['max_points']:g}")
+        lines.append(f"Feedback: {criterion.get('feedback', '')}")
+        lines.append("")
+    lines.append(f"Strengths: {grade.get('strengths', '')}")
+    lines.append(f"Areas for Improvement: {grade.get('improvements', '')}")
+    return "\n".join(lines)
+
+
+def escalation_reasons(grade) -> list:
+    """Why a fast-tier grade should be re-graded by the strong model (empty list: accept it)."""
+    reasons = []
+    if grade["confidence"] < CASCADE_MIN_CONFIDENCE:
+        reasons.append(f"low confidence ({grade['confidence']:.2f})")
+    if grade["max_total"] > 0:
+        percent = 100.0 * grade["total"] / grade["max_total"]
+        near = [b for b in GRADE_BOUNDARIES if abs(percent - b) <= CASCADE_BORDERLINE_MARGIN]
+        if near:
+            reasons.append(f"borderline score ({percent:.1f}% near {near[0]:g}%)")
+    # The criteria must agree with each other and with the reported total
+    criteria_sum = sum(c["points"] for c in grade["criteria"])
+    if abs(criteria_sum - grade["total"]) > 0.5:
+        reasons.append(f"criterion scores sum to {criteria_sum:g}, not the total {grade['total']:g}")
+    out_of_range = [c["name"] for c in grade["criteria"] if not 0 <= c["points"] <= c["max_points"]]
+    if out_of_range:
+        reasons.append(f"points out of range for {', '.join(out_of_range)}")
+    return reasons
+
+
+def cascade_grading_llm(submission: str, rubric: str, exemplars: str = "") -> dict:
+    """Grade with the fast model and escalate uncertain grades to strict_grading_llm.
+
+    Args:
+        submission (str): The student's submission text
+        rubric (str): The formatted rubric text
+        exemplars (str): Optional calibration block passed to both tiers
+
+    Returns:
+        dict: score, feedback and model as from strict_grading_llm, plus ``tier``
+        ("fast"/"strong"), ``confidence`` and ``escalation_reason`` when escalated
+    """
+    backend = get_fast_grading_backend()
+    model = getattr(backend, "model", backend.name)
+    human_prompt = (GRADING_EXEMPLAR_PROMPT if exemplars else "") + GRADING_HUMAN_PROMPT
+    variables = {"rubric": rubric, "submission": submission}
+    if exemplars:
+        variables["exemplars"] = exemplars
+    messages = [
+        {"role": "system", "content": FAST_GRADING_SYSTEM_PROMPT},
+        {"role": "user", "content": human_prompt.format(**variables)}
+    ]
+
+    with span("llm.grade_fast", model=model, submission_chars=len(submission or "")) as fast_span, \
+            usage_context(purpose="grade_fast"):
+        text = backend.complete(messages, temperature=0.0)
+        try:
+            grade = parse_llm_json(text, validator=validate_structured_grade)
+            reasons = escalation_reasons(grade)
+        except LLMOutputError as e:
+            grade, reasons = None, [f"unparseable fast-tier output ({e})"]
+        fast_span.set("cascade.escalated", bool(reasons))
+
+    if not reasons:
+        return {
+            "score": grade["total"],
+            "feedback": render_structured_grade(grade),
+            "model": model,
+            "tier": "fast",
+            "confidence": grade["confidence"],
+        }
+
+    logger.info("Escalating to the strong grader: %s", "; ".join(reasons))
+    result = strict_grading_llm(submission, rubric, exemplars=exemplars)
+    result.update(
+        tier="strong",
+        confidence=grade["confidence"] if grade else None,
+        fast_score=grade["total"] if grade else None,
+        escalation_reason="; ".join(reasons),
+    )
+    return result
+
+
+def grading_llm(submission: str, rubric: str, exemplars: str = "", mode: str = None) -> dict:
+    """Grade with the configured GRADING_MODE ("single" or "cascade")."""
+    if (mode or GRADING_MODE) == "cascade":
+        return cascade_grading_llm(submission, rubric, exemplars=exemplars)
+    return strict_grading_llm(submission, rubric, exemplars=exemplars)
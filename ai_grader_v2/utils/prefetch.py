@@ -0,0 +1,215 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from api.canvas_api import get_assignment_data, download_attachment
+from utils.file_ingest import SUPPORTED_TYPES, submit_file
+from utils.grade_store import graded_student_ids
+from utils.html_text import clean_html_text
+from utils.submission_index import SubmissionIndex, slim_record
+from utils.tracing import logger, span
+
+# Students prepared ahead of the one being graded; 0 disables prefetching
+PREFETCH_LOOKAHEAD = int(os.getenv("PREFETCH_LOOKAHEAD", "3"))
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "4"))
+# Prefetched submission lists and rubrics are refetched after this many seconds
+PREFETCH_TTL = float(os.getenv("PREFETCH_TTL", "300"))
+# Assignments whose submission index stays in memory; least recently used ones are dropped
+PREFETCH_MAX_ASSIGNMENTS = int(os.getenv("PREFETCH_MAX_ASSIGNMENTS", "8"))
+
+_executor = None
+# Assignment fetches get their own pool: prefetch jobs on _executor wait on them, so sharing one could deadlock
+_fetch_executor = None
+_lock = threading.Lock()
+# (course_id, assignment_id) -> {"data": Future of (SubmissionIndex, rubric), "at": time}, in LRU order
+_assignments = OrderedDict()
+# (course_id, assignment_id, student_id) -> Future of a prepared submission dict
+_prepared = {}
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+    return _executor
+
+
+def _get_fetch_executor():
+    global _fetch_executor
+    if _fetch_executor is None:
+        _fetch_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch-fetch")
+    return _fetch_executor
+
+
+def _key(course_id, assignment_id):
+    return str(course_id), str(assignment_id)
+
+
+def _fetch_assignment(course_id, assignment_id):
+    rubric, submissions = get_assignment_data(course_id, assignment_id)
+    # The full Canvas dicts are dropped as soon as the slim index is built
+    return SubmissionIndex.from_submissions(course_id, assignment_id, submissions), rubric
+
+
+def _drop_prepared(key):
+    for prepared_key in [k for k in _prepared if k[:2] == key]:
+        del _prepared[prepared_key]
+
+
+def _assignment_entry(course_id, assignment_id):
+    """Start (or reuse) the background fetch of an assignment's submissions and rubric."""
+    key = _key(course_id, assignment_id)
+    with _lock:
+        entry = _assignments.get(key)
+        if entry is None or time.time() - entry["at"] > PREFETCH_TTL:
+            entry = {"data": _get_fetch_executor().submit(_fetch_assignment, *key), "at": time.time()}
+            _assignments[key] = entry
+            # Cleaned texts belong to the old submission list
+            _drop_prepared(key)
+        _assignments.move_to_end(key)
+        while len(_assignments) > PREFETCH_MAX_ASSIGNMENTS:
+            evicted, _ = _assignments.popitem(last=False)
+            _drop_prepared(evicted)
+    return entry
+
+
+def cached_index(course_id, assignment_id):
+    """SubmissionIndex for an assignment, from the prefetch cache when it is fresh."""
+    index = _assignment_entry(course_id, assignment_id)["data"].result()[0]
+    if not len(index):
+        # Don't hold on to a failed fetch
+        invalidate(course_id, assignment_id)
+    return index
+
+
+def cached_rubric(course_id, assignment_id):
+    """Canvas rubric for an assignment, from the prefetch cache when it is fresh."""
+    rubric = _assignment_entry(course_id, assignment_id)["data"].result()[1]
+    if isinstance(rubric, str):
+        # An error message (e.g. an expired token), not an assignment without a rubric
+        invalidate(course_id, assignment_id)
+    return rubric
+
+
+def invalidate(course_id, assignment_id):
+    """Drop everything prefetched for an assignment."""
+    key = _key(course_id, assignment_id)
+    with _lock:
+        _assignments.pop(key, None)
+        _drop_prepared(key)
+
+
+def refresh_submission(course_id, assignment_id, submission):
+    """Swap one student's fresh Canvas submission into the cached index and drop their prepared text."""
+    key = _key(course_id, assignment_id)
+    record = slim_record(submission)
+    with _lock:
+        _prepared.pop((*key, record.user_id), None)
+        entry = _assignments.get(key)
+        if entry is None:
+            # The next cached_index call fetches the whole (current) assignment anyway
+            return
+        if not entry["data"].done():
+            # An in-flight fetch may predate this submission
+            _assignments.pop(key)
+            _drop_prepared(key)
+            return
+        try:
+            index, rubric = entry["data"].result()
+        except Exception:
+            _assignments.pop(key)
+            return
+        data = Future()
+        data.set_result((index.with_record(record), rubric))
+        entry["data"] = data
+
+
+def _attachment_text(course_id, record):
+    """Extract text from a submission's PDF/Word/text attachments."""
+    texts = []
+    for attachment in record.attachments:
+        if attachment.content_type not in SUPPORTED_TYPES or not attachment.url:
+            continue
+        try:
+            data = download_attachment(attachment.url, size=attachment.size, course_id=course_id)
+            texts.append(f"[Attachment: {attachment.filename}]\n" + submit_file(data, attachment.content_type).result())
+        except Exception as e:
+            logger.warning("Could not extract attachment %s: %s", attachment.filename, e)
+    return "\n\n".join(texts)
+
+
+def prepare_submission(index, record):
+    """Everything grading needs from one submission: raw body, cleaned text and attachment text."""
+    with span("prefetch.prepare", student_id=record.user_id):
+        raw_body = index.body(record.user_id)
+        text = clean_html_text(raw_body) or raw_body
+        attachments = _attachment_text(index.course_id, record)
+        if attachments:
+            text = f"{text}\n\n{attachments}" if text else attachments
+    return {
+        "student_id": record.user_id,
+        "student_name": record.user_name,
+        "raw_body": raw_body,
+        "text": text,
+    }
+
+
+def _prepare_future(index, record):
+    key = (index.course_id, index.assignment_id, record.user_id)
+    with _lock:
+        future = _prepared.get(key)
+        if future is None:
+            future = _get_executor().submit(prepare_submission, index, record)
+            _prepared[key] = future
+    return future
+
+
+def get_prepared(course_id, assignment_id, student_id):
+    """Prepared submission for one student (waits for an in-flight prefetch), or None if not submitted."""
+    key = (*_key(course_id, assignment_id), str(student_id))
+    with _lock:
+        future = _prepared.get(key)
+    if future is None:
+        index = cached_index(course_id, assignment_id)
+        record = index.get(student_id)
+        if record is None:
+            return None
+        future = _prepare_future(index, record)
+    try:
+        return future.result()
+    except Exception:
+        with _lock:
+            _prepared.pop(key, None)
+        raise
+
+
+def _prefetch_next(course_id, assignment_id, after_student, lookahead):
+    index = cached_index(course_id, assignment_id)
+    graded = graded_student_ids(course_id, assignment_id)
+    ids = index.user_ids()
+    start = ids.index(str(after_student)) + 1 if after_student is not None and str(after_student) in index else 0
+    # Wrap around so the students before the current one are covered too
+    upcoming = [
+        index.get(user_id) for user_id in ids[start:] + ids[:start]
+        if user_id not in graded and user_id != str(after_student) and index.get(user_id).submitted
+    ][:lookahead]
+    for record in upcoming:
+        _prepare_future(index, record)
+    logger.debug("Prefetching %d upcoming submissions for %s/%s", len(upcoming), course_id, assignment_id)
+
+
+def prefetch_assignment(course_id, assignment_id, after_student=None, lookahead=PREFETCH_LOOKAHEAD):
+    """Warm the submission list, rubric and the next ``lookahead`` ungraded students in the background.
+
+    Returns immediately; later calls to cached_index, cached_rubric and
+    get_prepared pick up the results (or wait for them if still in flight).
+    """
+    if lookahead <= 0 or not course_id or not assignment_id:
+        return
+    try:
+        _assignment_entry(course_id, assignment_id)
+        _get_executor().submit(_prefetch_next, course_id, assignment_id, after_student, lookahead)
+    except Exception as e:
+        logger.warning("Prefetch failed to start: %s", e)
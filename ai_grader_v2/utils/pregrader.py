@@ -0,0 +1,201 @@
+import os
+import threading
+from concurrent.futures import Future
+
+from api.tenants import fairness_key
+from utils.batch_grader import DEFAULT_RUN_BUDGET
+from utils.exemplar_store import exemplars_for
+from utils.fair_queue import FairQueue
+from utils.grade_store import save_grade, get_grade, graded_student_ids, rubric_hash
+from utils.grading_cache import grade_with_cache
+from utils.prefetch import cached_index, get_prepared
+from utils.rubric_parser import parse_rubric
+from utils.tracing import logger, span
+from utils.usage_store import Budget, usage_context
+
+# Opt-in: PREGRADE=1 starts background grading whenever a rubric is previewed
+PREGRADE_ENABLED = os.getenv("PREGRADE", "0") == "1"
+# Few workers so interactive grading keeps most of the LLM rate limit
+PREGRADE_WORKERS = int(os.getenv("PREGRADE_WORKERS", "1"))
+
+# How long a chat request waits for its (prioritized) pre-grade before grading itself
+PREGRADE_WAIT_SECONDS = float(os.getenv("PREGRADE_WAIT_SECONDS", "180"))
+
+PRIORITY_REQUESTED = 0
+PRIORITY_BACKGROUND = 10
+
+PREGRADE_SOURCE = "pregrade"
+
+
+class PreGrader:
+    """Background grading of a whole assignment into the grade store.
+
+    Jobs wait in a FairQueue with one lane per tenant (or per course when no
+    tenants are configured), so large courses don't starve small ones.
+    Within a lane background jobs run in submission order, and a student the
+    instructor asks for is moved up to PRIORITY_REQUESTED so it is graded
+    next. Stale queue entries are skipped when popped.
+    """
+
+    def __init__(self, workers=PREGRADE_WORKERS):
+        self.workers = workers
+        self._queue = FairQueue()
+        self._lock = threading.Lock()
+        # (course_id, assignment_id, student_id) -> Future resolved with the result dict
+        self._jobs = {}
+        # (course_id, assignment_id) -> {"rubric": ..., "rubric_text": ..., "budget": Budget}
+        self._assignments = {}
+        self._threads = []
+
+    def _ensure_workers(self):
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name="pregrade", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def start(self, course_id, assignment_id, rubric, budget_usd=DEFAULT_RUN_BUDGET):
+        """Queue every submitted, not-yet-graded student of an assignment; returns how many were queued."""
+        key = (str(course_id), str(assignment_id))
+        graded = graded_student_ids(*key)
+        queued = 0
+        with self._lock:
+            self._set_assignment(key, rubric, budget_usd)
+            # Finished jobs of an earlier run would inflate progress(); their grades are in the store
+            for job_key in [k for k, f in self._jobs.items() if k[:2] == key and f.done()]:
+                del self._jobs[job_key]
+            for record in cached_index(*key).submitted():
+                if record.user_id not in graded and self._queue_job((*key, record.user_id), PRIORITY_BACKGROUND):
+                    queued += 1
+            self._ensure_workers()
+        logger.info("Pre-grading %d submissions for %s/%s", queued, *key)
+        return queued
+
+    def enqueue(self, course_id, assignment_id, student_id, rubric, budget_usd=DEFAULT_RUN_BUDGET):
+        """Queue (or re-queue, e.g. after a resubmission) one student; returns False if a job is already waiting."""
+        key = (str(course_id), str(assignment_id))
+        with self._lock:
+            entry = self._assignments.get(key)
+            if entry is None or entry["rubric_hash"] != rubric_hash(rubric):
+                self._set_assignment(key, rubric, budget_usd)
+            queued = self._queue_job((*key, str(student_id)), PRIORITY_BACKGROUND, replace_running=True)
+            self._ensure_workers()
+        return queued
+
+    def _set_assignment(self, key, rubric, budget_usd):
+        self._assignments[key] = {
+            "rubric": rubric,
+            "rubric_text": parse_rubric(rubric),
+            "rubric_hash": rubric_hash(rubric),
+            "budget": Budget(budget_usd),
+        }
+
+    def _queue_job(self, job_key, priority, replace_running=False):
+        # A waiting job reads the latest submission when it runs; a running one may be grading an older attempt
+        future = self._jobs.get(job_key)
+        if future is not None and not future.done() and (not replace_running or not future.running()):
+            return False
+        self._jobs[job_key] = Future()
+        self._queue.put(job_key, fairness_key(job_key[0]), priority)
+        return True
+
+    def rubric_hash_for(self, course_id, assignment_id):
+        entry = self._assignments.get((str(course_id), str(assignment_id)))
+        return entry["rubric_hash"] if entry else None
+
+    def request(self, course_id, assignment_id, student_id, timeout=None):
+        """Move a student to the front of the queue and wait for their pre-grade.
+
+        Returns:
+            dict: the grading result, or None if the student is not queued,
+            the wait timed out or grading failed
+        """
+        job_key = (str(course_id), str(assignment_id), str(student_id))
+        with self._lock:
+            future = self._jobs.get(job_key)
+            if future is None:
+                return None
+            if not future.done() and not future.running():
+                # Reorder the waiting entry rather than queueing the job a second time
+                self._queue.promote(job_key, fairness_key(job_key[0]), PRIORITY_REQUESTED)
+        try:
+            return future.result(timeout=timeout)
+        except Exception as e:
+            logger.debug("Pre-grade for %s not available: %s", student_id, e)
+            return None
+
+    def progress(self, course_id, assignment_id):
+        """(done, total) pre-grading jobs for an assignment."""
+        key = (str(course_id), str(assignment_id))
+        with self._lock:
+            jobs = [f for k, f in self._jobs.items() if k[:2] == key]
+        return sum(f.done() for f in jobs), len(jobs)
+
+    def _work(self):
+        while True:
+            job_key = self._queue.get()
+            try:
+                with self._lock:
+                    future = self._jobs.get(job_key)
+                    # A stale entry: the job was replaced, is running or has finished
+                    if future is None or future.done() or future.running():
+                        continue
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                try:
+                    future.set_result(self._grade(job_key))
+                except Exception as e:
+                    logger.warning("Pre-grading failed for student %s: %s", job_key[2], e)
+                    future.set_exception(e)
+            except Exception as e:
+                # One bad queue entry must not stop the worker
+                logger.warning("Pre-grading worker skipped %s: %s", job_key, e)
+
+    def _grade(self, job_key):
+        course_id, assignment_id, student_id = job_key
+        assignment = self._assignments[(course_id, assignment_id)]
+        if assignment["budget"].exceeded:
+            raise RuntimeError("pre-grading budget reached")
+        prepared = get_prepared(course_id, assignment_id, student_id)
+        if prepared is None:
+            raise RuntimeError("submission no longer available")
+        with usage_context(course_id=course_id, assignment_id=assignment_id, student_id=student_id,
+                           purpose="pregrade", budget=assignment["budget"]), \
+                span("pregrade.student", student_id=student_id):
+            exemplars = exemplars_for(course_id, assignment_id, prepared["text"], exclude_student=student_id)
+            result = grade_with_cache(prepared["text"], assignment["rubric_text"], exemplars=exemplars)
+        save_grade(
+            course_id, assignment_id, student_id, result["score"], result["feedback"],
+            student_name=prepared["student_name"],
+            model=result.get("model"),
+            rubric_hash=assignment["rubric_hash"],
+            source=PREGRADE_SOURCE,
+            review_reason=result.get("review_reason"),
+        )
+        result.update(student_id=student_id, student_name=prepared["student_name"])
+        return result
+
+
+def stored_pregrade(course_id, assignment_id, student_id, rubric_hash_value):
+    """A stored pre-grade for the student made with this rubric, as a result dict, or None."""
+    grade = get_grade(course_id, assignment_id, student_id, with_criteria=False)
+    if not grade or grade["source"] != PREGRADE_SOURCE or grade["rubric_hash"] != rubric_hash_value:
+        return None
+    return {
+        "score": grade["score"],
+        "feedback": grade["feedback"],
+        "model": grade["model"],
+        "review_reason": grade["review_reason"],
+        "pregraded": True,
+    }
+
+
+_pregrader = None
+
+
+def get_pregrader():
+    """Process-wide PreGrader shared by every chat session."""
+    global _pregrader
+    if _pregrader is None:
+        _pregrader = PreGrader()
+    return _pregrader
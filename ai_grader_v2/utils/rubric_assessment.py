@@ -0,0 +1,108 @@
+"""Turn grading feedback into a Canvas ``rubric_assessment``.
+
+The grader writes "Criterion Name: 18/25" followed by sub-criteria and a
+"Feedback:" line for every rubric criterion. Matching those names against
+the Canvas rubric gives per-criterion points and comments keyed by the
+criterion ids (e.g. ``_5507``), so grades show up in Canvas's rubric view
+and the submission comment only needs the overall summary.
+"""
+import difflib
+import re
+
+# "Criterion Name: 18/25" lines, also when the model wraps them in markdown emphasis
+CRITERION_LINE = re.compile(
+    r"^[\s*_#]*([^:\n]{2,200}?)[\s*_]*:[\s*_]*(\d+(?:\.\d+)?)\s*/\s*(\d+(?:\.\d+)?)[\s*_]*$", re.MULTILINE
+)
+# "Feedback:" labels in front of a criterion's comment
+_FEEDBACK_LABEL = re.compile(r"^[\s*_]*feedback[\s*_]*:[\s*_]*", re.IGNORECASE | re.MULTILINE)
+# "(25 pts)", "(25 points)" suffixes, list numbering and markdown emphasis around names
+_POINTS_SUFFIX = re.compile(r"\(\s*\d+(?:\.\d+)?\s*(?:pts?|points?)\s*\)", re.IGNORECASE)
+_DECORATION = re.compile(r"^[\s#*_\-\d.)]+|[\s*_]+$")
+# Lines that close the per-criterion part of the feedback
+_SUMMARY_LINE = re.compile(r"^\s*[*_#]*\s*(strengths|areas for improvement)\b", re.IGNORECASE | re.MULTILINE)
+
+# Lowest similarity for a fuzzy criterion-name match
+MIN_NAME_SIMILARITY = 0.8
+
+
+def _normalize(name):
+    name = _POINTS_SUFFIX.sub("", name or "")
+    return re.sub(r"\s+", " ", _DECORATION.sub("", name)).strip().lower()
+
+
+def _match_criterion(name, criteria_by_name):
+    key = _normalize(name)
+    if key in criteria_by_name:
+        return criteria_by_name[key]
+    close = difflib.get_close_matches(key, list(criteria_by_name), n=1, cutoff=MIN_NAME_SIMILARITY)
+    return criteria_by_name[close[0]] if close else None
+
+
+def _rating_id(criterion, points):
+    """Id of the rating band the points fall into (the lowest rating at or above them)."""
+    ratings = [r for r in criterion.get("ratings") or [] if r.get("id") and r.get("points") is not None]
+    at_or_above = [r for r in ratings if float(r["points"]) >= points]
+    if at_or_above:
+        return min(at_or_above, key=lambda r: float(r["points"]))["id"]
+    return None
+
+
+def build_rubric_assessment(rubric, feedback):
+    """Per-criterion points and comments for a Canvas rubric, from grading feedback.
+
+    Args:
+        rubric (list): Canvas rubric criteria (with "id", "description", "points", "ratings")
+        feedback (str): Grading feedback text
+
+    Returns:
+        tuple: ({criterion_id: {"points", "comments", "rating_id"}}, general comment,
+                descriptions of rubric criteria the feedback did not score)
+    """
+    criteria_by_name = {
+        _normalize(c.get("description")): c for c in rubric or [] if isinstance(c, dict) and c.get("id")
+    }
+    feedback = feedback or ""
+    summary = _SUMMARY_LINE.search(feedback)
+    body_end = summary.start() if summary else len(feedback)
+
+    # Top-level criterion lines; sub-criteria lines stay inside their criterion's section
+    headings = []
+    for match in CRITERION_LINE.finditer(feedback, 0, body_end):
+        criterion = _match_criterion(match.group(1), criteria_by_name)
+        if criterion is not None and all(c["id"] != criterion["id"] for c, _ in headings):
+            headings.append((criterion, match))
+
+    assessment = {}
+    for i, (criterion, match) in enumerate(headings):
+        section_end = headings[i + 1][1].start() if i + 1 < len(headings) else body_end
+        max_points = float(criterion.get("points") or match.group(3))
+        points = min(max(float(match.group(2)), 0.0), max_points)
+        entry = {
+            "points": points,
+            "comments": _FEEDBACK_LABEL.sub("", feedback[match.end():section_end]).strip(),
+        }
+        rating_id = _rating_id(criterion, points)
+        if rating_id:
+            entry["rating_id"] = rating_id
+        assessment[str(criterion["id"])] = entry
+
+    missing = [c.get("description") for c in criteria_by_name.values() if str(c["id"]) not in assessment]
+
+    # Overall line plus strengths / areas for improvement
+    if headings:
+        parts = (feedback[:headings[0][1].start()].strip(), feedback[body_end:].strip())
+        general_comment = "\n\n".join(part for part in parts if part)
+    else:
+        general_comment = feedback.strip()
+    return assessment, general_comment, missing
+
+
+def rubric_assessment_form(assessment, prefix="rubric_assessment"):
+    """Flatten an assessment into Canvas form fields like ``rubric_assessment[_5507][points]``."""
+    form = {}
+    for criterion_id, entry in assessment.items():
+        for field in ("points", "comments", "rating_id"):
+            if entry.get(field) not in (None, ""):
+                value = entry[field]
+                form[f"{prefix}[{criterion_id}][{field}]"] = f"{value:g}" if isinstance(value, float) else str(value)
+    return form
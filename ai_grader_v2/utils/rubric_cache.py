@@ -0,0 +1,82 @@
+import json
+import sqlite3
+import time
+
+from utils.cache_utils import cache_path, content_hash
+
+STRUCTURE_PROMPT = """Convert the following rubric text into a structured JSON format suitable for grading. The format should be:
+            [{
+                "description": "Criterion Name",
+                "points": points_value,
+                "long_description": "Detailed description of the criterion",
+                "ratings": [
+                    {"description": "Level name", "points": points_value},
+                    ...
+                ]
+            }]
+            
+            Extract the criteria, point values, and rating levels from the text. If point values are not explicit, make reasonable assignments based on the content."""
+
+# Changing the prompt invalidates previously structured rubrics
+PROMPT_VERSION = content_hash(STRUCTURE_PROMPT)[:12]
+
+DB_PATH = cache_path("rubrics.sqlite")
+
+
+def _connect():
+    conn = sqlite3.connect(DB_PATH, timeout=10)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS structured_rubrics (
+            file_hash TEXT NOT NULL,
+            prompt_version TEXT NOT NULL,
+            filename TEXT,
+            rubric_json TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (file_hash, prompt_version)
+        )
+    """)
+    return conn
+
+
+def get_structured_rubric(file_hash, prompt_version=PROMPT_VERSION):
+    """Return the cached structured rubric for an uploaded file, or None."""
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT rubric_json FROM structured_rubrics WHERE file_hash = ? AND prompt_version = ?",
+            (file_hash, prompt_version)
+        ).fetchone()
+    finally:
+        conn.close()
+    return json.loads(row[0]) if row else None
+
+
+def save_structured_rubric(file_hash, filename, rubric, prompt_version=PROMPT_VERSION):
+    """Store a structured rubric so later uploads of the same file skip the LLM."""
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO structured_rubrics VALUES (?, ?, ?, ?, ?)",
+                (file_hash, prompt_version, filename, json.dumps(rubric), time.time())
+            )
+    finally:
+        conn.close()
+
+
+def list_structured_rubrics(limit=50, prompt_version=PROMPT_VERSION):
+    """List previously structured rubrics, newest first.
+
+    Returns:
+        list: dicts with file_hash, filename and created_at
+    """
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT file_hash, filename, created_at FROM structured_rubrics "
+            "WHERE prompt_version = ? ORDER BY created_at DESC LIMIT ?",
+            (prompt_version, limit)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [{"file_hash": h, "filename": name, "created_at": ts} for h, name, ts in rows]
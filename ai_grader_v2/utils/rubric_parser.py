@@ -1,3 +1,6 @@
+from utils.tracing import logger
+
+
 def parse_rubric(raw_rubric):
     """
     Convert Canvas rubric into clean structure for grading.
@@ -40,7 +43,7 @@ def parse_rubric(raw_rubric):
             output.append("")  # Add blank line between criteria
             
         except Exception as e:
-            print(f"Rubric parse error: {e}")
+            logger.warning("Rubric parse error: %s", e)
     
     # Add total points at the top
     output.insert(0, f"Total Points: {total_points}\n")
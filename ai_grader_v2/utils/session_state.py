@@ -0,0 +1,102 @@
+"""Session state shared by the tools, with or without Streamlit.
+
+Inside the Streamlit app ``session_state`` is ``st.session_state``. Code
+running in ``isolated_state()`` (each grading-service request or job) gets
+its own dict instead, so concurrent sessions never see each other's
+course, student or current grade. Anything else (scripts, benchmarks)
+shares one process-wide dict. Streamlit is never imported from here.
+"""
+import contextvars
+import sys
+from contextlib import contextmanager
+
+
+class StateDict(dict):
+    """dict with attribute access, like st.session_state."""
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key) from None
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+    def __delattr__(self, key):
+        try:
+            del self[key]
+        except KeyError:
+            raise AttributeError(key) from None
+
+
+_isolated = contextvars.ContextVar("session_state", default=None)
+_process_state = StateDict()
+
+
+def _streamlit_state():
+    st = sys.modules.get("streamlit")
+    if st is None:
+        return None
+    try:
+        if not st.runtime.exists():
+            return None
+    except Exception:
+        return None
+    return st.session_state
+
+
+def isolated():
+    """The state dict of the enclosing isolated_state() block, or None."""
+    return _isolated.get()
+
+
+def current_state():
+    """The state store for the calling code (see module docstring)."""
+    state = _isolated.get()
+    if state is not None:
+        return state
+    state = _streamlit_state()
+    return state if state is not None else _process_state
+
+
+@contextmanager
+def isolated_state(initial=None):
+    """Run a block (and the threads it starts with copied contexts) against a private state dict."""
+    state = StateDict(initial or {})
+    token = _isolated.set(state)
+    try:
+        yield state
+    finally:
+        _isolated.reset(token)
+
+
+class _SessionStateProxy:
+    """Forwards attribute and item access to current_state()."""
+
+    def __getattr__(self, key):
+        return getattr(current_state(), key)
+
+    def __setattr__(self, key, value):
+        setattr(current_state(), key, value)
+
+    def __delattr__(self, key):
+        delattr(current_state(), key)
+
+    def __getitem__(self, key):
+        return current_state()[key]
+
+    def __setitem__(self, key, value):
+        current_state()[key] = value
+
+    def __delitem__(self, key):
+        del current_state()[key]
+
+    def __contains__(self, key):
+        return key in current_state()
+
+    def get(self, key, default=None):
+        return current_state().get(key, default)
+
+
+session_state = _SessionStateProxy()
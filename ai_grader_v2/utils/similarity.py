@@ -0,0 +1,192 @@
+import os
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+from utils.tracing import logger
+
+# Mersenne prime for the universal hash family used by MinHash
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def normalize_text(text):
+    """Lowercase, drop punctuation and collapse whitespace so formatting differences vanish."""
+    text = re.sub(r"[^\w\s]", " ", (text or "").lower())
+    return " ".join(text.split())
+
+
+def shingles(text, k=5):
+    """Hashed word k-grams of normalized text as a uint64 array."""
+    words = normalize_text(text).split()
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+    if len(words) < k:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i:i + k]) for i in range(len(words) - k + 1)]
+    return np.unique(np.fromiter((zlib.crc32(g.encode()) for g in grams), dtype=np.uint64, count=len(grams)))
+
+
+class MinHasher:
+    """MinHash signatures over shingle sets; equal-signature fraction estimates Jaccard similarity."""
+
+    def __init__(self, num_perm=128, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self._a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingle_hashes):
+        if shingle_hashes.size == 0:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        # (a * x + b) mod p for every (permutation, shingle) pair, then min per permutation
+        hashed = (np.outer(self._a, shingle_hashes) + self._b[:, None]) % _PRIME
+        return (hashed & _MAX_HASH).min(axis=1)
+
+
+def estimate_jaccard(sig_a, sig_b):
+    return float(np.mean(sig_a == sig_b))
+
+
+class LSHIndex:
+    """Banded LSH over MinHash signatures: only signatures sharing a band become candidates.
+
+    With ``bands`` x ``rows`` = num_perm, pairs with Jaccard s collide with
+    probability 1 - (1 - s**rows)**bands, which is steep around (1/bands)**(1/rows).
+    """
+
+    def __init__(self, bands=32, rows=4):
+        self.bands = bands
+        self.rows = rows
+        self._buckets = [defaultdict(list) for _ in range(bands)]
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key, signature):
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band][band_key].append(key)
+
+    def query(self, signature):
+        found = set()
+        for band, band_key in self._band_keys(signature):
+            found.update(self._buckets[band].get(band_key, ()))
+        return found
+
+
+# "hashing" (numpy only) or "sentence-transformers" (local all-MiniLM-L6-v2)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "hashing")
+HASHING_DIM = 1024
+_sentence_model = None
+
+
+def embedding_model_name():
+    """Identifier of the active embedding backend, stored alongside precomputed vectors."""
+    if EMBEDDING_BACKEND == "sentence-transformers":
+        return "all-MiniLM-L6-v2"
+    return f"hashing-{HASHING_DIM}"
+
+
+def embed_texts(texts):
+    """L2-normalized embeddings as a float32 matrix (one row per text).
+
+    The default hashing backend projects word unigrams and bigrams into
+    HASHING_DIM buckets with log term frequency, needing only numpy.
+    """
+    global _sentence_model
+    if EMBEDDING_BACKEND == "sentence-transformers":
+        if _sentence_model is None:
+            from sentence_transformers import SentenceTransformer
+            _sentence_model = SentenceTransformer("all-MiniLM-L6-v2")
+        return np.asarray(_sentence_model.encode(list(texts), normalize_embeddings=True), dtype=np.float32)
+
+    matrix = np.zeros((len(texts), HASHING_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = normalize_text(text).split()
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        if not features:
+            continue
+        buckets = np.fromiter((zlib.crc32(f.encode()) % HASHING_DIM for f in features), dtype=np.int64, count=len(features))
+        matrix[row] = np.log1p(np.bincount(buckets, minlength=HASHING_DIM))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def _embedding_similarities(texts_by_id, pairs):
+    """Cosine similarity of candidate pairs using a local sentence-transformers model, or None."""
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        logger.info("sentence-transformers not installed; skipping embedding verification")
+        return None
+    ids = sorted({i for pair in pairs for i in pair})
+    model = SentenceTransformer("all-MiniLM-L6-v2")
+    vectors = model.encode([texts_by_id[i] for i in ids], normalize_embeddings=True)
+    index = {doc_id: n for n, doc_id in enumerate(ids)}
+    return {(a, b): float(np.dot(vectors[index[a]], vectors[index[b]])) for a, b in pairs}
+
+
+def find_duplicate_clusters(texts_by_id, threshold=0.8, num_perm=128, bands=32, use_embeddings=False,
+                            embedding_threshold=0.95):
+    """Group near-identical documents without comparing every pair.
+
+    Args:
+        texts_by_id (dict): document id -> text
+        threshold (float): Minimum estimated Jaccard similarity to link two documents
+        use_embeddings (bool): Additionally require local-embedding cosine >= embedding_threshold
+
+    Returns:
+        list: clusters as dicts {"members": [ids...], "similarity": min linked similarity},
+        largest first; singletons are omitted
+    """
+    hasher = MinHasher(num_perm=num_perm)
+    lsh = LSHIndex(bands=bands, rows=num_perm // bands)
+    signatures = {}
+    pairs = {}
+    for doc_id, text in texts_by_id.items():
+        if not normalize_text(text):
+            continue
+        signature = hasher.signature(shingles(text))
+        for other in lsh.query(signature):
+            similarity = estimate_jaccard(signature, signatures[other])
+            if similarity >= threshold:
+                pairs[(other, doc_id)] = similarity
+        lsh.add(doc_id, signature)
+        signatures[doc_id] = signature
+
+    if use_embeddings and pairs:
+        cosines = _embedding_similarities(texts_by_id, list(pairs))
+        if cosines is not None:
+            pairs = {pair: sim for pair, sim in pairs.items() if cosines[pair] >= embedding_threshold}
+
+    # Union-find over the verified pairs
+    parent = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in pairs:
+        parent[find(a)] = find(b)
+
+    members = defaultdict(list)
+    for doc_id in parent:
+        members[find(doc_id)].append(doc_id)
+    clusters = []
+    for group in members.values():
+        if len(group) < 2:
+            continue
+        group_set = set(group)
+        linked = [sim for (a, b), sim in pairs.items() if a in group_set and b in group_set]
+        # Preserve input order so the first submission becomes the representative
+        ordered = [doc_id for doc_id in texts_by_id if doc_id in group_set]
+        clusters.append({"members": ordered, "similarity": min(linked) if linked else 1.0})
+    clusters.sort(key=lambda c: len(c["members"]), reverse=True)
+    return clusters
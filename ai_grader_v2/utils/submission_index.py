@@ -0,0 +1,123 @@
+import os
+from collections import OrderedDict
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
+
+from utils.cache_utils import cache_path, content_hash
+
+# Submission bodies kept in memory at once (the rest stay on disk)
+BODY_CACHE_SIZE = int(os.getenv("SUBMISSION_BODY_CACHE", "64"))
+
+
+class Attachment(NamedTuple):
+    filename: str
+    content_type: Optional[str]
+    url: Optional[str]
+    size: Optional[int]
+
+
+class SubmissionRecord(NamedTuple):
+    """The parts of a Canvas submission the grader needs; the body lives on disk under ``body_hash``."""
+    user_id: str
+    user_name: str
+    workflow_state: Optional[str]
+    attempt: Optional[int]
+    submitted_at: Optional[str]
+    graded_at: Optional[str]
+    body_hash: Optional[str]
+    attachments: Tuple[Attachment, ...]
+
+    @property
+    def submitted(self):
+        return self.workflow_state != "unsubmitted"
+
+
+def _body_path(body_hash):
+    return cache_path("submission_bodies", body_hash[:2], f"{body_hash}.html")
+
+
+def store_body(body):
+    """Write a submission body to the content-addressed disk cache and return its hash."""
+    body_hash = content_hash(body)
+    path = _body_path(body_hash)
+    if not os.path.exists(path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+    return body_hash
+
+
+@lru_cache(maxsize=BODY_CACHE_SIZE)
+def load_body(body_hash):
+    """Read a body back from the disk cache (most recent ones are kept in memory)."""
+    with open(_body_path(body_hash), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def slim_record(submission):
+    """Reduce a full Canvas submission dict (comments, user object, ...) to a SubmissionRecord."""
+    body = submission.get("body")
+    return SubmissionRecord(
+        user_id=str(submission["user_id"]),
+        user_name=(submission.get("user") or {}).get("name", "Unknown"),
+        workflow_state=submission.get("workflow_state"),
+        attempt=submission.get("attempt"),
+        submitted_at=submission.get("submitted_at"),
+        graded_at=submission.get("graded_at"),
+        body_hash=store_body(body) if body else None,
+        attachments=tuple(
+            Attachment(a.get("display_name") or a.get("filename", "file"), a.get("content-type"), a.get("url"), a.get("size"))
+            for a in submission.get("attachments") or ()
+        ),
+    )
+
+
+class SubmissionIndex:
+    """user_id -> SubmissionRecord for one assignment, in Canvas order.
+
+    Records are a few hundred bytes each, so large courses fit comfortably;
+    bodies are loaded from disk only when ``body`` is called.
+    """
+
+    def __init__(self, course_id, assignment_id, records):
+        self.course_id = str(course_id)
+        self.assignment_id = str(assignment_id)
+        self._records = OrderedDict((record.user_id, record) for record in records)
+
+    @classmethod
+    def from_submissions(cls, course_id, assignment_id, submissions):
+        """Build an index from a raw get_submissions list (the list can be discarded afterwards)."""
+        return cls(course_id, assignment_id, (slim_record(s) for s in submissions))
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, user_id):
+        return str(user_id) in self._records
+
+    def __iter__(self):
+        return iter(self._records.values())
+
+    def get(self, user_id):
+        return self._records.get(str(user_id))
+
+    def with_record(self, record):
+        """A copy of the index with one student's record replaced (or appended), e.g. after a resubmission."""
+        records = OrderedDict(self._records)
+        records[record.user_id] = record
+        return SubmissionIndex(self.course_id, self.assignment_id, records.values())
+
+    def user_ids(self):
+        return list(self._records)
+
+    def submitted(self):
+        """Records of students who have submitted, in Canvas order."""
+        return [record for record in self._records.values() if record.submitted]
+
+    def body(self, user_id):
+        """The submission's HTML body ("" if none), read from the disk cache."""
+        record = self.get(user_id)
+        if record is None or record.body_hash is None:
+            return ""
+        return load_body(record.body_hash)
@@ -0,0 +1,235 @@
+import contextvars
+import json
+import logging
+import os
+import queue
+import secrets
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.cache_utils import cache_path
+
+# Level-gated logger shared by the app; use %-style args so disabled levels never format large strings
+logger = logging.getLogger("ai_grader")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(os.getenv("GRADER_LOG_LEVEL", "WARNING").upper())
+    logger.propagate = False
+
+# Span export to a JSONL file is opt-in; run summaries work from memory either way
+TRACE_ENABLED = os.getenv("GRADER_TRACING", "0") == "1"
+# Export file; defaults to traces/spans.jsonl in the cache dir, resolved by the writer thread
+TRACE_FILE = os.getenv("GRADER_TRACE_FILE")
+# Size at which the export file is rotated to ``<file>.1`` (the previous rotation is dropped)
+TRACE_MAX_BYTES = int(os.getenv("GRADER_TRACE_MAX_BYTES", str(50 * 1024 * 1024)))
+# Spans waiting for the writer thread; more than this are dropped rather than blocking callers
+TRACE_QUEUE_SIZE = 10000
+SERVICE_NAME = "ai-canvas-grader"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_current_trace_id = contextvars.ContextVar("current_trace_id", default=None)
+
+# Finished spans per trace id, for run summaries
+_finished = {}
+_finished_lock = threading.Lock()
+_export_queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+_writer = None
+_writer_lock = threading.Lock()
+MAX_TRACES_IN_MEMORY = 50
+
+
+class Span:
+    """A timed operation with attributes (latency, tokens, cache hits, retries...)."""
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def add(self, key, amount=1):
+        """Increment a numeric attribute, e.g. retries or tokens."""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    @property
+    def duration_ms(self):
+        end = self.end_ns or time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_otlp(self):
+        """Encode as an OTLP/JSON ``resourceSpans`` record (one per line in the export file)."""
+        attributes = []
+        for key, value in self.attributes.items():
+            if isinstance(value, bool):
+                encoded = {"boolValue": value}
+            elif isinstance(value, int):
+                encoded = {"intValue": str(value)}
+            elif isinstance(value, float):
+                encoded = {"doubleValue": value}
+            else:
+                encoded = {"stringValue": str(value)}
+            attributes.append({"key": key, "value": encoded})
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": attributes,
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": "ai_grader"}, "spans": [span]}],
+            }]
+        }
+
+
+def _rotate(path):
+    try:
+        if os.path.getsize(path) >= TRACE_MAX_BYTES:
+            os.replace(path, path + ".1")
+    except OSError:
+        pass
+
+
+def _write_spans():
+    """Writer thread: append queued spans in batches, rotating the file when it gets too big."""
+    path = TRACE_FILE or cache_path("traces", "spans.jsonl")
+    while True:
+        lines = [_export_queue.get()]
+        while True:
+            try:
+                lines.append(_export_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _rotate(path)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            logger.warning("Could not write %d spans to %s: %s", len(lines), path, e)
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is not None:
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_spans, name="span-writer", daemon=True)
+            _writer.start()
+
+
+def _export(span):
+    with _finished_lock:
+        spans = _finished.setdefault(span.trace_id, [])
+        spans.append(span)
+        while len(_finished) > MAX_TRACES_IN_MEMORY:
+            _finished.pop(next(iter(_finished)))
+    if not TRACE_ENABLED:
+        return
+    _ensure_writer()
+    try:
+        _export_queue.put_nowait(json.dumps(span.to_otlp()))
+    except queue.Full:
+        logger.debug("Span export queue is full; dropping span %s", span.name)
+
+
+def start_run():
+    """Begin a new trace (one user turn or batch run) and return its trace id."""
+    trace_id = secrets.token_hex(16)
+    _current_trace_id.set(trace_id)
+    return trace_id
+
+
+def current_span():
+    """The innermost active span, or None."""
+    return _current_span.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a block of work as a span nested under the current one."""
+    parent = _current_span.get()
+    trace_id = parent.trace_id if parent else (_current_trace_id.get() or start_run())
+    current = Span(name, trace_id, parent.span_id if parent else None, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        _export(current)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("span %s took %.1f ms %s", name, current.duration_ms, current.attributes)
+
+
+def record_llm_usage(prompt_tokens=0, completion_tokens=0, model=None):
+    """Attach token counts to the current span (normally an ``llm.*`` span)."""
+    current = _current_span.get()
+    if current is None:
+        return
+    current.add("llm.tokens_in", int(prompt_tokens or 0))
+    current.add("llm.tokens_out", int(completion_tokens or 0))
+    if model:
+        current.set("llm.model", model)
+
+
+def run_summary(trace_id=None):
+    """Aggregate finished spans of one run by name.
+
+    Returns:
+        list: dicts with name, count, total_ms, p50_ms, max_ms, tokens_in, tokens_out, errors
+    """
+    trace_id = trace_id or _current_trace_id.get()
+    with _finished_lock:
+        spans = list(_finished.get(trace_id, []))
+    grouped = {}
+    for s in spans:
+        grouped.setdefault(s.name, []).append(s)
+    rows = []
+    for name, group in grouped.items():
+        durations = [s.duration_ms for s in group]
+        rows.append({
+            "name": name,
+            "count": len(group),
+            "total_ms": sum(durations),
+            "p50_ms": statistics.median(durations),
+            "max_ms": max(durations),
+            "tokens_in": sum(s.attributes.get("llm.tokens_in", 0) for s in group),
+            "tokens_out": sum(s.attributes.get("llm.tokens_out", 0) for s in group),
+            "errors": sum(1 for s in group if s.error),
+        })
+    rows.sort(key=lambda r: r["total_ms"], reverse=True)
+    return rows
+
+
+def format_summary_table(rows):
+    """Render :func:`run_summary` rows as a fixed-width text table."""
+    header = f"{'span':<32}{'count':>6}{'total ms':>11}{'p50 ms':>10}{'max ms':>10}{'tok in':>8}{'tok out':>8}{'err':>5}"
+    lines = [header, "-" * len(header)]
+    for r in rows:
+        lines.append(
+            f"{r['name'][:31]:<32}{r['count']:>6}{r['total_ms']:>11.1f}{r['p50_ms']:>10.1f}"
+            f"{r['max_ms']:>10.1f}{r['tokens_in']:>8}{r['tokens_out']:>8}{r['errors']:>5}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,69 @@
+import json
+import os
+import time
+
+from utils.cache_utils import cache_path
+
+# Bytes read per step when paging back from the end of a transcript
+TAIL_BLOCK_BYTES = 64 * 1024
+
+
+def _transcript_path(session_id):
+    return cache_path("transcripts", f"{session_id}.jsonl")
+
+
+def archive_messages(session_id, messages):
+    """Append chat messages to the session's transcript file on disk.
+
+    Args:
+        session_id (str): Chat session identifier
+        messages (list): (role, content) tuples, role is "user" or "assistant"
+    """
+    if not messages:
+        return
+    now = time.time()
+    with open(_transcript_path(session_id), "a", encoding="utf-8") as f:
+        for role, content in messages:
+            f.write(json.dumps({"role": role, "content": content, "ts": now}) + "\n")
+
+
+def load_archived(session_id, limit, skip_latest=0):
+    """Load a page of archived messages, oldest first.
+
+    Pages are counted back from the most recent archived message so the UI can
+    reveal history one page at a time.
+
+    Args:
+        session_id (str): Chat session identifier
+        limit (int): Maximum number of messages to return
+        skip_latest (int): Number of most recent archived messages to skip
+
+    Returns:
+        list: dicts with role, content and ts
+    """
+    path = _transcript_path(session_id)
+    if not os.path.exists(path) or limit <= 0:
+        return []
+    lines = _tail_lines(path, skip_latest + limit)
+    end = max(len(lines) - skip_latest, 0)
+    start = max(end - limit, 0)
+    return [json.loads(line) for line in lines[start:end]]
+
+
+def _tail_lines(path, count):
+    """The last ``count`` lines of a file, read backwards in blocks so long transcripts stay cheap."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        # One extra newline: the file ends with one and the oldest kept line must be complete
+        while pos > 0 and data.count(b"\n") <= count:
+            step = min(TAIL_BLOCK_BYTES, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.splitlines()
+    if pos > 0:
+        # The first line is a partial one from the middle of the file
+        lines = lines[1:]
+    return [line.decode("utf-8") for line in lines[-count:] if line.strip()]
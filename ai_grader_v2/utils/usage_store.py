@@ -0,0 +1,178 @@
+"""Token and cost accounting for every LLM call, stored in a local SQLite file.
+
+Report:
+    python -m utils.usage_store --course 121 --by student
+"""
+import argparse
+import contextvars
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.cache_utils import cache_path
+
+DB_PATH = cache_path("usage.sqlite")
+
+# USD per 1K tokens (prompt, completion); unknown models are priced as gpt-4
+MODEL_PRICES = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "llamacpp": (0.0, 0.0),
+    "fake": (0.0, 0.0),
+}
+
+_context = contextvars.ContextVar("usage_context", default={})
+_local = threading.local()
+
+
+class Budget:
+    """Per-run spending limit in USD, shared by all threads of a batch run."""
+
+    def __init__(self, limit_usd=None):
+        self.limit_usd = limit_usd
+        self.spent_usd = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def charge(self, cost, prompt_tokens=0, completion_tokens=0):
+        with self._lock:
+            self.spent_usd += cost
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    @property
+    def exceeded(self):
+        return self.limit_usd is not None and self.spent_usd >= self.limit_usd
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """Cost in USD of one call at list prices."""
+    prompt_price, completion_price = MODEL_PRICES.get(model or "gpt-4", MODEL_PRICES["gpt-4"])
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000.0
+
+
+@contextmanager
+def usage_context(**fields):
+    """Attribute LLM usage inside the block to course/assignment/student/purpose/budget."""
+    merged = dict(_context.get())
+    merged.update({k: v for k, v in fields.items() if v is not None})
+    token = _context.set(merged)
+    try:
+        yield merged
+    finally:
+        _context.reset(token)
+
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_usage (
+                ts REAL NOT NULL,
+                course_id TEXT,
+                assignment_id TEXT,
+                student_id TEXT,
+                purpose TEXT,
+                model TEXT,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                cost_usd REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_course ON llm_usage (course_id, assignment_id, student_id)")
+        _local.conn = conn
+    return conn
+
+
+def record_usage(model, prompt_tokens, completion_tokens):
+    """Store one LLM call's usage under the current usage context and charge its budget.
+
+    Returns:
+        float: Estimated cost in USD
+    """
+    prompt_tokens = int(prompt_tokens or 0)
+    completion_tokens = int(completion_tokens or 0)
+    cost = estimate_cost(model, prompt_tokens, completion_tokens)
+    ctx = _context.get()
+    budget = ctx.get("budget")
+    if budget is not None:
+        budget.charge(cost, prompt_tokens, completion_tokens)
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT INTO llm_usage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (time.time(), ctx.get("course_id"), ctx.get("assignment_id"), ctx.get("student_id"),
+             ctx.get("purpose"), model, prompt_tokens, completion_tokens, cost)
+        )
+    return cost
+
+
+def usage_report(course_id=None, assignment_id=None, group_by="assignment"):
+    """Aggregate usage rows.
+
+    Args:
+        course_id (str): Optional course filter
+        assignment_id (str): Optional assignment filter
+        group_by (str): "course", "assignment", "student" or "purpose"
+
+    Returns:
+        list: dicts with the group keys, calls, prompt_tokens, completion_tokens, cost_usd
+    """
+    keys = {
+        "course": ["course_id"],
+        "assignment": ["course_id", "assignment_id"],
+        "student": ["course_id", "assignment_id", "student_id"],
+        "purpose": ["course_id", "purpose", "model"],
+    }[group_by]
+    where, params = [], []
+    if course_id:
+        where.append("course_id = ?")
+        params.append(str(course_id))
+    if assignment_id:
+        where.append("assignment_id = ?")
+        params.append(str(assignment_id))
+    columns = ", ".join(keys)
+    sql = (f"SELECT {columns}, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens), SUM(cost_usd) "
+           f"FROM llm_usage {'WHERE ' + ' AND '.join(where) if where else ''} "
+           f"GROUP BY {columns} ORDER BY SUM(cost_usd) DESC")
+    rows = _connect().execute(sql, params).fetchall()
+    report = []
+    for row in rows:
+        entry = dict(zip(keys, row[:len(keys)]))
+        entry.update(calls=row[-4], prompt_tokens=row[-3], completion_tokens=row[-2], cost_usd=row[-1])
+        report.append(entry)
+    return report
+
+
+def format_report(rows):
+    if not rows:
+        return "No LLM usage recorded."
+    keys = [k for k in rows[0] if k not in ("calls", "prompt_tokens", "completion_tokens", "cost_usd")]
+    header = "".join(f"{k:<16}" for k in keys) + f"{'calls':>8}{'tokens in':>12}{'tokens out':>12}{'cost $':>10}"
+    lines = [header, "-" * len(header)]
+    for r in rows:
+        lines.append("".join(f"{str(r[k]):<16}" for k in keys)
+                     + f"{r['calls']:>8}{r['prompt_tokens']:>12}{r['completion_tokens']:>12}{r['cost_usd']:>10.2f}")
+    total = sum(r["cost_usd"] for r in rows)
+    lines.append(f"\nTotal: ${total:.2f}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM token and cost report")
+    parser.add_argument("--course")
+    parser.add_argument("--assignment")
+    parser.add_argument("--by", choices=["course", "assignment", "student", "purpose"], default="assignment")
+    args = parser.parse_args()
+    print(format_report(usage_report(args.course, args.assignment, args.by)))
+
+
+if __name__ == "__main__":
+    main()